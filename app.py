@@ -1,13 +1,19 @@
 import pandas as pd
 from flask import Flask, render_template, jsonify, request, send_file
-from components.draw_functions import draw_chart_image
+from components.draw_functions import draw_chart_image, row_strip_cache, iter_chart_png, \
+    draw_render_model_palette
+from components.render_model import build_render_model, get_chart_end_date, get_chart_size
 from datetime import datetime, timedelta
 import base64
+import gzip
+import hashlib
+import uuid
 from io import BytesIO
-from sqlmodel import select
+from sqlmodel import select, or_
 import os
 from werkzeug.utils import secure_filename
 import shutil
+import threading
 from pathlib import Path
 
 from components.calendar_manager import CalendarManager
@@ -16,10 +22,16 @@ from components.excel_functions import export_to_excel
 from components.job_manager import JobManager
 from components.order_manager import OrderManager
 from components.history_manager import HistoryManager
-from components.worktime_functions import adjust_schedule_and_fix_conflicts, check_equipment_conflicts, \
-    move_job_to_previous, move_job_to_next, calculate_finish_date
+from components.lru_cache import LRUCache
+from components.chart_prerender import ChartPrerenderer
+from components.png_stream import encode_palette_png
+from components.hit_index import JobHitIndex, quantize_jobs
+from components.conflict_scan import find_schedule_conflicts
+from components.worktime_functions import check_and_fix_conflicts, \
+    move_job_to_previous, move_job_to_next, calculate_finish_date, finish_date_cache, job_positions_updater, \
+    job_positions_are_current
 from database import get_session, create_backup, restore_backup, get_backup_files, init_backup_dirs, \
-    create_db_and_tables, get_jobs_count_by_equipment_id
+    create_db_and_tables, get_jobs_count_by_equipment_id, upgrade_schema, get_data_version
 from models import Equipment, EquipmentType, Job, Order, Calendar, JobHistory, HistoryVersion
 
 app = Flask(__name__)
@@ -49,6 +61,10 @@ job_manager = JobManager()
 calendar_manager = CalendarManager()
 history_manager = HistoryManager()
 
+# Однократная подготовка при запуске сервера (start_background_tasks)
+_background_tasks_started = False
+_background_tasks_lock = threading.Lock()
+
 
 @app.route('/')
 def index():
@@ -287,54 +303,579 @@ def set_all_8hours(year_month):
     return jsonify(result)
 
 
-@app.route('/api/gantt/image', methods=['POST'])
+# Таблицы, от которых зависит изображение диаграммы
+SCHEDULE_TABLES = (Job.__tablename__, Order.__tablename__, Equipment.__tablename__, EquipmentType.__tablename__,
+                   Calendar.__tablename__)
+# Версии данных начинаются заново при каждом запуске, поэтому в ETag добавляется метка запуска
+SCHEDULE_VERSION_SALT = uuid.uuid4().hex[:8]
+GANTT_TILE_SIZE = 256
+# Уровень сжатия PNG (0-9): больше - меньше трафик и выше нагрузка на процессор
+GANTT_PNG_COMPRESS_LEVEL = int(os.environ.get('GANTT_PNG_COMPRESS_LEVEL', 6))
+GANTT_IMAGE_FORMATS = {'png': 'image/png', 'webp': 'image/webp', 'svg': 'image/svg+xml'}
+# Список работ в JSON-ответе: с точными координатами, с целыми (quantized) или без него (поиск через /api/gantt/hit)
+GANTT_JOBS_FORMATS = ('full', 'quantized', 'none')
+# Размер частей при потоковой передаче изображения
+GANTT_STREAM_CHUNK_SIZE = 64 * 1024
+# PNG от этого размера (в пикселях) рисуется и кодируется полосами прямо в ответ, без полного изображения в памяти
+GANTT_STREAM_MIN_PIXELS = int(os.environ.get('GANTT_STREAM_MIN_PIXELS', 4_000_000))
+# Рисовать диаграмму с палитрой (байт на пиксель вместо трех, PNG меньше): точно передаются все цвета плана,
+# оттенки сглаживания текста сверх 256 цветов заменяются ближайшими
+GANTT_PALETTE = os.environ.get('GANTT_PALETTE', 'false').lower() == 'true'
+# Фоновая перерисовка основных видов после изменения данных (включена, GANTT_PRERENDER=false - выключить;
+# запускается сервером, а не при импорте приложения): задержка после последнего изменения в секундах
+# и число потоков отрисовки
+GANTT_PRERENDER = os.environ.get('GANTT_PRERENDER', 'true').lower() == 'true'
+GANTT_PRERENDER_DELAY = float(os.environ.get('GANTT_PRERENDER_DELAY', 2.0))
+GANTT_PRERENDER_WORKERS = int(os.environ.get('GANTT_PRERENDER_WORKERS', 2))
+# Режимы, перерисовываемые в фоне (через запятую). Годовой вид по умолчанию не рисуется: он самый
+# большой и запрашивается редко, его можно добавить: GANTT_PRERENDER_VIEWS=week,month,year
+GANTT_PRERENDER_VIEW_MODES = tuple(view_mode.strip() for view_mode in
+                                   os.environ.get('GANTT_PRERENDER_VIEWS', 'week,month').split(',')
+                                   if view_mode.strip() in ('week', 'month', 'year'))
+# Настройки клиента по умолчанию: пикселей на час, высота строки, высота работы в %, фильтр оборудования,
+# вид списка работ
+GANTT_PRERENDER_SETTINGS = (20, 60, 80, 'visible', 'quantized')
+# Примерный объем одной работы из списка работ диаграммы в памяти (словарь с координатами)
+GANTT_CACHED_JOB_BYTES = 1024
+
+
+def gantt_chart_weight(chart: dict) -> int:
+    """Объем готового ответа в памяти: тело JSON, закодированное изображение (и его gzip) и список работ"""
+    return (sum(len(chart.get(key, b'')) for key in ('body', 'image', 'image_gzip')) +
+            len(chart['jobs']) * GANTT_CACHED_JOB_BYTES)
+
+
+# Готовые ответы /api/gantt/image по параметрам отображения и версии данных.
+# Объем ограничивается в мегабайтах переменной окружения GANTT_IMAGE_CACHE_MB
+gantt_image_cache = LRUCache(maxsize=16, max_weight=int(os.environ.get('GANTT_IMAGE_CACHE_MB', 64)) * 1024 * 1024,
+                             weigher=gantt_chart_weight)
+# Координаты работ нарисованных изображений по их ETag (для /api/gantt/jobs)
+gantt_jobs_cache = LRUCache(maxsize=32)
+# Индексы для поиска работы по точке изображения (/api/gantt/hit) по ETag изображения
+gantt_hit_cache = LRUCache(maxsize=32)
+# Разметка диаграммы (тело ответа /api/gantt/layout) по параметрам отображения и версии данных
+gantt_layout_cache = LRUCache(maxsize=16)
+# Готовые фрагменты диаграммы (PNG) по параметрам отображения и версии данных
+gantt_tile_cache = LRUCache(maxsize=1024)
+# Данные диаграммы для фрагментов: соседние фрагменты одного вида не загружают их заново
+gantt_tile_data_cache = LRUCache(maxsize=8)
+
+
+def get_schedule_version():
+    """Версия данных, от которых зависит диаграмма: растет при любом изменении плана"""
+    return get_data_version(*SCHEDULE_TABLES)
+
+
+def gantt_image_cache_key(view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                          equipment_filter, is_dark, response_format, compress_level, jobs_format='full'):
+    """Ключ gantt_image_cache: ответ зависит только от параметров отображения и версии данных"""
+    return (view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio, equipment_filter,
+            is_dark, response_format, compress_level, jobs_format, get_schedule_version())
+
+
+def make_etag(cache_key):
+    """ETag ответа по ключу кэша (параметры отображения и версия данных)"""
+    return hashlib.sha1(f"{SCHEDULE_VERSION_SALT}:{cache_key!r}".encode()).hexdigest()
+
+
+@app.route('/api/gantt/image', methods=['GET', 'POST'])
 def generate_gantt_image():
-    """Генерирует изображение диаграммы Ганта"""
+    """
+    Генерирует изображение диаграммы Ганта.
+
+    Параметры передаются в JSON (POST) или в строке запроса (GET). format задает вид ответа:
+        json (по умолчанию для POST) - JSON с изображением в base64, идентификатором render_id
+            (он же ETag, для /api/gantt/hit и /api/gantt/jobs) и списком работ по jobs_format:
+            full (по умолчанию) - точные координаты, quantized - целые пиксели, none - без списка
+        png, webp (по умолчанию для GET - png) - изображение потоком по частям; координаты работ
+            отдаются отдельно по адресу из заголовка X-Gantt-Jobs (/api/gantt/jobs/<render_id>)
+        svg - векторная диаграмма по той же разметке (в режиме обзора, как и png, - тепловая карта
+            загрузки), отдается так же, как png; клиентам,
+            принимающим gzip, передается сжатой
+    compress_level - уровень сжатия 0-9 (по умолчанию GANTT_PNG_COMPRESS_LEVEL).
+    """
     try:
-        data = request.json
+        if request.method == 'GET':
+            data = request.args
+            if not data.get('start_date'):
+                return jsonify({'success': False, 'error': 'Не указана дата начала'}), 400
+            pixels_per_hour = data.get('pixels_per_hour', 20, type=int)
+            row_height = data.get('row_height', 60, type=int)
+            job_height_ratio = data.get('job_height_ratio', 80, type=int)
+            is_dark = data.get('is_dark', 'false').lower() in ('1', 'true')
+            compress_level = data.get('compress_level', GANTT_PNG_COMPRESS_LEVEL, type=int)
+        else:
+            data = request.json
+            pixels_per_hour = data.get('pixels_per_hour', 20)
+            row_height = data.get('row_height', 60)
+            job_height_ratio = data.get('job_height_ratio', 80)
+            is_dark = data.get('is_dark', False)
+            compress_level = data.get('compress_level', GANTT_PNG_COMPRESS_LEVEL)
+        jobs_format = data.get('jobs_format', 'full')
         view_mode = data.get('view_mode', 'week')
         chart_start_date = datetime.strptime(data.get('start_date'), '%Y-%m-%d').date()
-        pixels_per_hour = data.get('pixels_per_hour', 20)
-        row_height = data.get('row_height', 60)
-        job_height_ratio = data.get('job_height_ratio', 80)
         equipment_filter = data.get('equipment_filter', 'all')
-        is_dark = data.get('is_dark', False)
-
-        jobs_df, equipment_df, calendar_data = get_gantt_data(equipment_filter)
-
-        # Генерируем изображение
-        image, jobs = draw_chart_image(
-            view_mode=view_mode,
-            chart_start_date=chart_start_date,
-            calendar_data=calendar_data,
-            equipment_data=equipment_df,
-            jobs_data=jobs_df,
-            pixels_per_hour=pixels_per_hour,
-            row_height=row_height,
-            job_height_ratio=job_height_ratio,
-            is_dark=is_dark
-        )
+        response_format = data.get('format', 'png' if request.method == 'GET' else 'json')
+        if response_format not in ('json', *GANTT_IMAGE_FORMATS) or not 0 <= compress_level <= 9:
+            return jsonify({'success': False, 'error': 'Неверный формат или уровень сжатия'}), 400
+        if jobs_format not in GANTT_JOBS_FORMATS:
+            return jsonify({'success': False, 'error': 'Неверный вид списка работ'}), 400
+        if response_format != 'json':
+            # Изображения отдаются без списка работ
+            jobs_format = 'none'
+
+        cache_key = gantt_image_cache_key(view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                                          equipment_filter, is_dark, response_format, compress_level, jobs_format)
+        etag = make_etag(cache_key)
+        if etag in request.if_none_match:
+            # Изображение у клиента, но его работы могли быть вытеснены из кэша - /api/gantt/hit
+            # и /api/gantt/jobs по этому ETag должны их находить
+            if gantt_jobs_cache.get(etag) is None:
+                gantt_jobs_cache.put(etag, get_chart_jobs(cache_key, view_mode, chart_start_date, pixels_per_hour,
+                                                          row_height, job_height_ratio, equipment_filter))
+            return app.response_class(status=304, headers={'ETag': f'"{etag}"'})
+
+        chart = gantt_image_cache.get(cache_key)
+        if chart is None:
+            chart = render_gantt_chart(view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                                       equipment_filter, is_dark, response_format, compress_level, jobs_format, etag)
+            if 'chunks' not in chart:
+                gantt_image_cache.put(cache_key, chart)
+        gantt_jobs_cache.put(etag, chart['jobs'])
+
+        if response_format == 'json':
+            response = app.response_class(chart['body'], mimetype='application/json')
+        else:
+            # Изображение отдается частями (chunked), без копий в base64 и JSON
+            if 'chunks' in chart:
+                body = stream_and_cache(cache_key, chart)
+            elif 'image_gzip' in chart and 'gzip' in request.accept_encodings:
+                body = iter_chunks(chart['image_gzip'])
+            else:
+                body = iter_chunks(chart['image'])
+            response = app.response_class(body, mimetype=GANTT_IMAGE_FORMATS[response_format])
+            if 'image_gzip' in chart:
+                response.headers['Vary'] = 'Accept-Encoding'
+                if 'gzip' in request.accept_encodings:
+                    response.headers['Content-Encoding'] = 'gzip'
+            response.headers['X-Chart-Width'] = str(chart['width'])
+            response.headers['X-Chart-Height'] = str(chart['height'])
+            response.headers['X-Equipment-Count'] = str(chart['equipment_count'])
+            response.headers['X-Jobs-Count'] = str(chart['jobs_count'])
+            response.headers['X-Gantt-Jobs'] = f'/api/gantt/jobs/{etag}'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
 
-        # Конвертируем в base64
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
+    except Exception as e:
+        print(f"Ошибка генерации диаграммы: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)})
 
-        return jsonify({
-            'success': True,
-            'image_data': f"data:image/png;base64,{img_str}",
+
+@app.route('/api/gantt/jobs/<render_id>', methods=['GET'])
+def get_gantt_jobs(render_id):
+    """
+    Координаты работ на изображении диаграммы в компактном виде.
+
+    render_id - ETag изображения (из заголовка X-Gantt-Jobs). Работы передаются массивами
+    в порядке fields, названия заказов и оборудования - отдельными справочниками.
+    """
+    jobs = gantt_jobs_cache.get(render_id)
+    if jobs is None:
+        return jsonify({'success': False, 'error': 'Изображение не найдено, запросите его заново'}), 404
+
+    orders, equipment_index = {}, {}
+    rows = []
+    for job in jobs:
+        coordinates = job['coordinates']
+        orders[job['order_id']] = job['order_name']
+        equipment = equipment_index.setdefault(job['equipment_name'], len(equipment_index))
+        rows.append([job['id'], job['order_id'], coordinates['x1'], coordinates['y1'], coordinates['x2'],
+                     coordinates['y2'], equipment])
+
+    response = jsonify({
+        'success': True,
+        'render_id': render_id,
+        'fields': ['id', 'order_id', 'x1', 'y1', 'x2', 'y2', 'equipment'],
+        'jobs': rows,
+        'orders': orders,
+        'equipment': list(equipment_index)
+    })
+    # Координаты работ для данного изображения не меняются
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+@app.route('/api/gantt/hit', methods=['GET'])
+def gantt_hit_test():
+    """
+    Работа под точкой изображения диаграммы.
+
+    render_id - ETag изображения, x, y - координаты в пикселях полной диаграммы. Возвращает
+    работу в том же виде, что и список работ ответа /api/gantt/image (job), или null.
+    """
+    render_id = request.args.get('render_id')
+    x = request.args.get('x', type=float)
+    y = request.args.get('y', type=float)
+    if not render_id or x is None or y is None:
+        return jsonify({'success': False, 'error': 'Не указаны render_id и координаты x, y'}), 400
+
+    hit_index = get_job_hit_index(render_id)
+    if hit_index is None:
+        return jsonify({'success': False, 'error': 'Изображение не найдено, запросите его заново'}), 404
+
+    response = jsonify({'success': True, 'render_id': render_id, 'job': hit_index.find(x, y)})
+    # Работы на данном изображении не меняются
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def get_job_hit_index(render_id):
+    """Индекс работ изображения (строится при первом обращении) или None, если изображения нет в кэше"""
+    hit_index = gantt_hit_cache.get(render_id)
+    if hit_index is None:
+        jobs = gantt_jobs_cache.get(render_id)
+        if jobs is None:
+            return None
+        hit_index = JobHitIndex(jobs)
+        gantt_hit_cache.put(render_id, hit_index)
+    return hit_index
+
+
+def get_chart_jobs(cache_key, view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                   equipment_filter) -> list:
+    """
+    Работы с координатами для изображения из gantt_image_cache, а если его там нет - по разметке
+    диаграммы (без растеризации)
+    """
+    chart = gantt_image_cache.get(cache_key)
+    if chart is not None:
+        return chart['jobs']
+    jobs_df, equipment_df, calendar_data = get_gantt_data(
+        equipment_filter, chart_start_date, get_chart_end_date(view_mode, chart_start_date)
+    )
+    model = build_render_model(view_mode, chart_start_date, calendar_data, equipment_df, jobs_df,
+                               pixels_per_hour, row_height, job_height_ratio)
+    return model.jobs_info()
+
+
+def iter_chunks(data: bytes, chunk_size: int = GANTT_STREAM_CHUNK_SIZE):
+    """Части данных для потоковой передачи"""
+    view = memoryview(data)
+    for start in range(0, len(data), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+def stream_and_cache(cache_key, chart):
+    """
+    Передает PNG, рисуемый полосами (chart['chunks']), и после передачи кладет готовое
+    изображение в gantt_image_cache: в памяти остается только сжатый PNG
+    """
+    parts = []
+    for chunk in chart['chunks']:
+        parts.append(chunk)
+        yield chunk
+    cached = {key: value for key, value in chart.items() if key != 'chunks'}
+    cached['image'] = b''.join(parts)
+    gantt_image_cache.put(cache_key, cached)
+
+
+def encode_chart_image(image, image_format: str = 'png', compress_level: int = GANTT_PNG_COMPRESS_LEVEL) -> bytes:
+    """Кодирует изображение диаграммы в PNG или WebP (без потерь) с заданным уровнем сжатия 0-9"""
+    buffered = BytesIO()
+    if image_format == 'webp':
+        # Для WebP без потерь quality задает усилие сжатия
+        image.save(buffered, format="WEBP", lossless=True, quality=round(compress_level * 100 / 9))
+    elif image.mode == 'P':
+        return encode_palette_png(image, compress_level)
+    else:
+        image.save(buffered, format="PNG", compress_level=compress_level)
+    return buffered.getvalue()
+
+
+def render_gantt_chart(view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                       equipment_filter, is_dark, response_format='json',
+                       compress_level=GANTT_PNG_COMPRESS_LEVEL, jobs_format='full', render_id=None,
+                       streamed=False) -> dict:
+    """
+    Рисует диаграмму и готовит ответ /api/gantt/image: для формата json - тело JSON-ответа (body)
+    со списком работ по jobs_format и идентификатором изображения render_id,
+    для png и webp - закодированное изображение (image) и его параметры, для svg - текст SVG (image)
+    и он же сжатый gzip (image_gzip). Во всех случаях jobs - список работ с координатами.
+    Большие PNG (от GANTT_STREAM_MIN_PIXELS) не рисуются сразу: вместо image возвращается
+    генератор частей PNG (chunks), который рисует и кодирует диаграмму полосами.
+    streamed - PNG и JSON всегда рисовать полосами (или с палитрой при GANTT_PALETTE), без полного
+    изображения RGB в памяти и без кэша полос строк row_strip_cache (для фоновой перерисовки).
+    """
+    jobs_df, equipment_df, calendar_data = get_gantt_data(
+        equipment_filter, chart_start_date, get_chart_end_date(view_mode, chart_start_date)
+    )
+
+    width, height = get_chart_size(view_mode, chart_start_date, calendar_data, len(equipment_df),
+                                   pixels_per_hour, row_height)
+    if response_format == 'png' and width * height >= GANTT_STREAM_MIN_PIXELS:
+        model = build_render_model(view_mode, chart_start_date, calendar_data, equipment_df, jobs_df,
+                                   pixels_per_hour, row_height, job_height_ratio)
+        return {
+            'jobs': model.jobs_info(),
+            'width': model.width,
+            'height': model.height,
+            'equipment_count': len(equipment_df),
+            'jobs_count': len(jobs_df),
+            'chunks': iter_chart_png(model, is_dark, compress_level=compress_level,
+                                     chunk_size=GANTT_STREAM_CHUNK_SIZE)
+        }
+
+    if response_format == 'svg':
+        svg, jobs = draw_chart_image(view_mode, chart_start_date, calendar_data, equipment_df, jobs_df,
+                                     pixels_per_hour, row_height, job_height_ratio, is_dark=is_dark, backend='svg')
+        svg = svg.encode()
+        return {
             'jobs': jobs,
-            'width': image.width,
-            'height': image.height,
+            'width': width,
+            'height': height,
+            'equipment_count': len(equipment_df),
+            'jobs_count': len(jobs_df),
+            'image': svg,
+            'image_gzip': gzip.compress(svg, compresslevel=compress_level, mtime=0)
+        }
+
+    if streamed and response_format in ('png', 'json'):
+        model = build_render_model(view_mode, chart_start_date, calendar_data, equipment_df, jobs_df,
+                                   pixels_per_hour, row_height, job_height_ratio)
+        if GANTT_PALETTE:
+            image, _ = draw_render_model_palette(model, is_dark)
+            png = encode_chart_image(image, 'png', compress_level)
+            del image
+        else:
+            png = b''.join(iter_chart_png(model, is_dark, compress_level=compress_level))
+        chart = {
+            'jobs': model.jobs_info(),
+            'width': model.width,
+            'height': model.height,
             'equipment_count': len(equipment_df),
             'jobs_count': len(jobs_df)
-        })
+        }
+        if response_format == 'png':
+            chart['image'] = png
+            return chart
+        return make_gantt_json_body(chart, png, jobs_format, render_id)
+
+    # Генерируем изображение
+    image, jobs = draw_chart_image(
+        view_mode=view_mode,
+        chart_start_date=chart_start_date,
+        calendar_data=calendar_data,
+        equipment_data=equipment_df,
+        jobs_data=jobs_df,
+        pixels_per_hour=pixels_per_hour,
+        row_height=row_height,
+        job_height_ratio=job_height_ratio,
+        is_dark=is_dark,
+        use_row_cache=True,
+        palette=GANTT_PALETTE
+    )
+    chart = {
+        'jobs': jobs,
+        'width': image.width,
+        'height': image.height,
+        'equipment_count': len(equipment_df),
+        'jobs_count': len(jobs_df)
+    }
+    if response_format != 'json':
+        chart['image'] = encode_chart_image(image, response_format, compress_level)
+        return chart
+
+    return make_gantt_json_body(chart, encode_chart_image(image, 'png', compress_level), jobs_format, render_id)
+
+
+def make_gantt_json_body(chart: dict, png: bytes, jobs_format='full', render_id=None) -> dict:
+    """Добавляет к параметрам диаграммы chart тело JSON-ответа (body) с PNG в base64"""
+    # Конвертируем в base64
+    img_str = base64.b64encode(png).decode()
+    body = {'success': True, 'image_data': f"data:image/png;base64,{img_str}", 'render_id': render_id, **chart}
+    if jobs_format == 'quantized':
+        body['jobs'] = quantize_jobs(chart['jobs'])
+    elif jobs_format == 'none':
+        del body['jobs']
+    chart['body'] = jsonify(body).get_data()
+    return chart
+
+
+def get_prerender_views():
+    """Виды, перерисовываемые в фоне: режимы GANTT_PRERENDER_VIEW_MODES с сегодняшней даты в обеих темах"""
+    today = datetime.now().date()
+    return [(view_mode, today, is_dark) for view_mode in GANTT_PRERENDER_VIEW_MODES for is_dark in (False, True)]
+
+
+def prerender_gantt_view(view_mode, chart_start_date, is_dark) -> bool:
+    """
+    Рисует вид с настройками клиента по умолчанию (как запрашивает его GanttManager.js)
+    в gantt_image_cache. Возвращает False, если вид для текущей версии данных уже в кэше.
+    Вид рисуется полосами (streamed): фоновая перерисовка не держит в памяти полные изображения
+    и не вытесняет полосы строк, которые используют запросы клиентов.
+    """
+    pixels_per_hour, row_height, job_height_ratio, equipment_filter, jobs_format = GANTT_PRERENDER_SETTINGS
+    cache_key = gantt_image_cache_key(view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                                      equipment_filter, is_dark, 'json', GANTT_PNG_COMPRESS_LEVEL, jobs_format)
+    if cache_key in gantt_image_cache:
+        return False
+    # Тело JSON-ответа собирается jsonify, которому нужен контекст приложения
+    with app.app_context():
+        chart = render_gantt_chart(view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                                   equipment_filter, is_dark, 'json', GANTT_PNG_COMPRESS_LEVEL, jobs_format,
+                                   make_etag(cache_key), streamed=True)
+    gantt_image_cache.put(cache_key, chart)
+    return True
+
+
+# Перерисовка основных видов в фоне после изменения плана: первый запрос после правки берет готовый ответ
+chart_prerenderer = ChartPrerenderer(prerender_gantt_view, get_prerender_views, SCHEDULE_TABLES,
+                                     delay=GANTT_PRERENDER_DELAY, workers=GANTT_PRERENDER_WORKERS)
+
+
+@app.before_request
+def start_background_tasks():
+    """
+    Подготовка при запуске сервера (первый запрос или запуск app.py), а не при импорте модуля:
+    новые колонки в существующей БД, пересчет позиций работ и фоновая перерисовка (если не отключена GANTT_PRERENDER=false).
+    Скрипты, тесты и процессы отрисовки, импортирующие приложение, ничего не меняют и не запускают
+    """
+    global _background_tasks_started
+    if _background_tasks_started:
+        return
+    with _background_tasks_lock:
+        if _background_tasks_started:
+            return
+        upgrade_schema()
+        job_positions_updater.schedule()
+        if GANTT_PRERENDER:
+            chart_prerenderer.start()
+        _background_tasks_started = True
+
+
+@app.route('/api/gantt/layout', methods=['GET'])
+def get_gantt_layout():
+    """
+    Разметка диаграммы Ганта без растеризации - для отрисовки на клиенте (canvas).
+
+    Параметры отображения передаются в строке запроса, как для GET /api/gantt/image.
+    Возвращает дни, выходные, строки оборудования и блоки работ параллельными массивами
+    (RenderModel.layout); цвета и тема оформления применяются на клиенте.
+    """
+    try:
+        if not request.args.get('start_date'):
+            return jsonify({'success': False, 'error': 'Не указана дата начала'}), 400
+        view_mode = request.args.get('view_mode', 'week')
+        chart_start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        pixels_per_hour = request.args.get('pixels_per_hour', 20, type=int)
+        row_height = request.args.get('row_height', 60, type=int)
+        job_height_ratio = request.args.get('job_height_ratio', 80, type=int)
+        equipment_filter = request.args.get('equipment_filter', 'all')
+        if pixels_per_hour <= 0 or row_height <= 0:
+            return jsonify({'success': False, 'error': 'Неверный масштаб или высота строки'}), 400
+
+        cache_key = ('layout', view_mode, chart_start_date, pixels_per_hour, row_height, job_height_ratio,
+                     equipment_filter, get_schedule_version())
+        etag = make_etag(cache_key)
+        if etag in request.if_none_match:
+            return app.response_class(status=304, headers={'ETag': f'"{etag}"'})
+
+        body = gantt_layout_cache.get(cache_key)
+        if body is None:
+            jobs_df, equipment_df, calendar_data = get_gantt_data(
+                equipment_filter, chart_start_date, get_chart_end_date(view_mode, chart_start_date)
+            )
+            model = build_render_model(view_mode, chart_start_date, calendar_data, equipment_df, jobs_df,
+                                       pixels_per_hour, row_height, job_height_ratio)
+            body = jsonify({'success': True, **model.layout()}).get_data()
+            gantt_layout_cache.put(cache_key, body)
+
+        response = app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
 
     except Exception as e:
-        print(f"Ошибка генерации диаграммы: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'error': str(e)})
+        print(f"Ошибка расчета разметки диаграммы: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/gantt/tile/<int:zoom>/<int:x>/<int:y>', methods=['GET'])
+def get_gantt_tile(zoom, x, y):
+    """
+    Фрагмент диаграммы Ганта размером tile_size x tile_size пикселей (PNG).
+
+    zoom - масштаб в пикселях на час, x и y - номер фрагмента по горизонтали и вертикали.
+    Остальные параметры отображения передаются в строке запроса, как для /api/gantt/image.
+    Крайние фрагменты обрезаются по границам диаграммы, полный размер диаграммы
+    возвращается в заголовках X-Chart-Width и X-Chart-Height.
+    """
+    try:
+        if not request.args.get('start_date'):
+            return jsonify({'success': False, 'error': 'Не указана дата начала'}), 400
+        view_mode = request.args.get('view_mode', 'week')
+        chart_start_date = datetime.strptime(request.args['start_date'], '%Y-%m-%d').date()
+        row_height = request.args.get('row_height', 60, type=int)
+        job_height_ratio = request.args.get('job_height_ratio', 80, type=int)
+        equipment_filter = request.args.get('equipment_filter', 'all')
+        is_dark = request.args.get('is_dark', 'false').lower() in ('1', 'true')
+        tile_size = request.args.get('tile_size', GANTT_TILE_SIZE, type=int)
+        if zoom <= 0 or not 0 < tile_size <= 4096:
+            return jsonify({'success': False, 'error': 'Неверный масштаб или размер фрагмента'}), 400
+
+        cache_key = (view_mode, chart_start_date, zoom, row_height, job_height_ratio, equipment_filter, is_dark,
+                     tile_size, x, y, get_schedule_version())
+        etag = make_etag(cache_key)
+        if etag in request.if_none_match:
+            return app.response_class(status=304, headers={'ETag': f'"{etag}"'})
+
+        tile = gantt_tile_cache.get(cache_key)
+        if tile is None:
+            data_key = (view_mode, chart_start_date, equipment_filter, cache_key[-1])
+            gantt_data = gantt_tile_data_cache.get(data_key)
+            if gantt_data is None:
+                gantt_data = get_gantt_data(
+                    equipment_filter, chart_start_date, get_chart_end_date(view_mode, chart_start_date)
+                )
+                gantt_tile_data_cache.put(data_key, gantt_data)
+            jobs_df, equipment_df, calendar_data = gantt_data
+            chart_width, chart_height = get_chart_size(view_mode, chart_start_date, calendar_data,
+                                                       len(equipment_df), zoom, row_height)
+            tile_x, tile_y = x * tile_size, y * tile_size
+            if tile_x >= chart_width or tile_y >= chart_height:
+                return jsonify({'success': False, 'error': 'Фрагмент вне диаграммы'}), 404
+
+            image, _ = draw_chart_image(
+                view_mode=view_mode,
+                chart_start_date=chart_start_date,
+                calendar_data=calendar_data,
+                equipment_data=equipment_df,
+                jobs_data=jobs_df,
+                pixels_per_hour=zoom,
+                row_height=row_height,
+                job_height_ratio=job_height_ratio,
+                is_dark=is_dark,
+                viewport=(tile_x, tile_y, min(tile_size, chart_width - tile_x), min(tile_size, chart_height - tile_y))
+            )
+            buffered = BytesIO()
+            image.save(buffered, format="PNG")
+            tile = (buffered.getvalue(), chart_width, chart_height)
+            gantt_tile_cache.put(cache_key, tile)
+
+        png_data, chart_width, chart_height = tile
+        response = send_file(BytesIO(png_data), mimetype='image/png')
+        response.headers['X-Chart-Width'] = str(chart_width)
+        response.headers['X-Chart-Height'] = str(chart_height)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    except Exception as e:
+        print(f"Ошибка генерации фрагмента диаграммы: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @app.route('/api/gantt/export-excel', methods=['POST'])
@@ -351,15 +892,10 @@ def export_gantt_excel():
         start_date = datetime.fromisoformat(start_date_str).date()
 
         # Рассчитываем end_date в зависимости от view_mode
-        if view_mode == 'week':
-            end_date = start_date + timedelta(days=6)
-        elif view_mode == 'month':
-            end_date = start_date + timedelta(days=30)
-        else:  # year
-            end_date = start_date + timedelta(days=365)
+        end_date = get_chart_end_date(view_mode, start_date)
 
         # Получаем данные для диаграммы (аналогично генерации изображения)
-        jobs_df, equipment_df, calendar_dict = get_gantt_data(equipment_filter)
+        jobs_df, equipment_df, calendar_dict = get_gantt_data(equipment_filter, start_date, end_date)
 
         # Генерируем Excel файл
         excel_buffer = export_to_excel(
@@ -379,19 +915,39 @@ def export_gantt_excel():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def get_gantt_data(equipment_filter='all'):
+GANTT_JOB_COLUMNS = ['id', 'equipment_id', 'duration_hours', 'hour_offset', 'start_date', 'status', 'is_locked',
+                     'order_name', 'order_color', 'order_id', 'equipment_name']
+
+
+def get_gantt_data(equipment_filter='all', start_date=None, end_date=None):
+    """
+    Загружает данные для диаграммы: работы, оборудование и календарь.
+
+    Фильтр оборудования ('all', 'visible' или ID) и диапазон дат [start_date, end_date]
+    применяются в запросах к БД: загружаются только работы, пересекающиеся с диапазоном,
+    и записи календаря внутри него. Без диапазона загружаются все данные.
+    """
+    # Условия фильтра оборудования (общие для оборудования и работ)
+    equipment_conditions = []
+    if equipment_filter != 'all':
+        # Если equipment_filter - число (ID оборудования), фильтруем по ID
+        if equipment_filter.isdigit():
+            equipment_conditions.append(Equipment.id == int(equipment_filter))
+        # Если equipment_filter = 'visible', фильтруем только видимое оборудование
+        elif equipment_filter == 'visible':
+            equipment_conditions.append(Equipment.show_on_chart == True)
 
     with get_session() as session:
         # Загружаем данные календаря
-        calendar_stmt = select(Calendar)
-        calendar_records = session.exec(calendar_stmt).all()
-
-        calendar_data = {}
-        for record in calendar_records:
-            calendar_data[record.date] = record.work_hours
+        calendar_stmt = select(Calendar.date, Calendar.work_hours)
+        if start_date is not None:
+            calendar_stmt = calendar_stmt.where(Calendar.date >= start_date.isoformat())
+        if end_date is not None:
+            calendar_stmt = calendar_stmt.where(Calendar.date <= end_date.isoformat())
+        calendar_data = dict(session.exec(calendar_stmt).all())
 
         # Загружаем оборудование с JOIN
-        equipment_stmt = select(Equipment, EquipmentType).join(EquipmentType)
+        equipment_stmt = select(Equipment, EquipmentType).join(EquipmentType).where(*equipment_conditions)
         equipment_results = session.exec(equipment_stmt).all()
 
         equipment_data = []
@@ -408,8 +964,13 @@ def get_gantt_data(equipment_filter='all'):
         equipment_df = pd.DataFrame(equipment_data)
 
         # Загружаем работы с JOIN
-        jobs_stmt = select(Job, Order, Equipment).join(Order).join(Equipment)
-        jobs_results = session.exec(jobs_stmt).all()
+        jobs_stmt = select(Job, Order, Equipment).join(Order).join(Equipment).where(*equipment_conditions)
+        if end_date is not None:
+            jobs_stmt = jobs_stmt.where(Job.start_date < (end_date + timedelta(days=1)).isoformat())
+        # Дата окончания используется, только если она пересчитана по текущему календарю
+        if start_date is not None and job_positions_are_current():
+            jobs_stmt = jobs_stmt.where(or_(Job.finish_date == None, Job.finish_date >= start_date.isoformat()))
+        jobs_results = session.exec(jobs_stmt.order_by(Job.id)).all()
 
         jobs_data = []
         for job, order, equipment in jobs_results:
@@ -427,21 +988,8 @@ def get_gantt_data(equipment_filter='all'):
                 'equipment_name': equipment.name
             })
 
-        jobs_df = pd.DataFrame(jobs_data)
-
-        # Применяем фильтр оборудования если нужно
-        if equipment_filter != 'all':
-            # Если equipment_filter - число (ID оборудования), фильтруем по ID
-            if equipment_filter.isdigit():
-                equipment_id = int(equipment_filter)
-                jobs_df = jobs_df[jobs_df['equipment_id'] == equipment_id]
-                equipment_df = equipment_df[equipment_df['id'] == equipment_id]
-            # Если equipment_filter = 'visible', фильтруем только видимое оборудование
-            elif equipment_filter == 'visible' and len(equipment_df):
-                visible_equipment = equipment_df[equipment_df['show_on_chart']]
-                visible_equipment_ids = visible_equipment['id'].tolist()
-                jobs_df = jobs_df[jobs_df['equipment_id'].isin(visible_equipment_ids)]
-                equipment_df = visible_equipment
+        # Колонки задаются явно, чтобы пустой диапазон давал пустую таблицу нужной структуры
+        jobs_df = pd.DataFrame(jobs_data, columns=GANTT_JOB_COLUMNS)
 
     return jobs_df, equipment_df, calendar_data
 
@@ -465,17 +1013,12 @@ def check_job_conflicts():
                 "error": "Отсутствуют обязательные параметры"
             })
 
-        # Проверяем конфликты
-        has_conflicts = adjust_schedule_and_fix_conflicts(
+        # Проверяем конфликты, заодно получая первое свободное время
+        has_conflicts, available_date, available_offset, moved_jobs = check_and_fix_conflicts(
             start_date, hour_offset, duration_hours, equipment_id, job_id, only_check
         )
 
         if has_conflicts and only_check:
-            # Если есть конфликты и мы только проверяем, находим первое свободное время
-            available_date, available_offset = check_equipment_conflicts(
-                equipment_id, job_id, start_date, hour_offset, duration_hours
-            )
-
             return jsonify({
                 "success": True,
                 "has_conflicts": True,
@@ -483,9 +1026,11 @@ def check_job_conflicts():
                 "available_offset": available_offset
             })
         else:
+            # Конфликты устранены (only_check=False): сдвинутые работы со старыми и новыми позициями
             return jsonify({
                 "success": True,
-                "has_conflicts": False
+                "has_conflicts": False,
+                "moved_jobs": moved_jobs
             })
 
     except Exception as e:
@@ -852,6 +1397,32 @@ def calculate_job_finish():
         }), 500
 
 
+@app.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """Возвращает счетчики кэшей для мониторинга"""
+    return jsonify({
+        'success': True,
+        'caches': {
+            'finish_date': finish_date_cache.stats(),
+            'gantt_images': gantt_image_cache.stats(),
+            'gantt_tiles': gantt_tile_cache.stats(),
+            'gantt_hit_index': gantt_hit_cache.stats(),
+            'gantt_row_strips': row_strip_cache.stats()
+        },
+        'gantt_prerender': chart_prerenderer.stats()
+    })
+
+
+@app.route('/api/schedule/conflicts', methods=['GET'])
+def get_schedule_conflicts():
+    """Проверка всего плана: пересечения работ, старты в нерабочие дни, сдвинутые закрепленные работы"""
+    try:
+        return jsonify({'success': True, **find_schedule_conflicts()})
+    except Exception as e:
+        print(f"Ошибка проверки плана: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # Обработчик ошибок для продакшена
 @app.errorhandler(404)
 def not_found(error):
@@ -867,6 +1438,7 @@ if __name__ == '__main__':
     # Инициализация базы данных
     create_db_and_tables()
     init_backup_dirs()
+    start_background_tasks()
 
     # Инициализируем историю при запуске
     try:
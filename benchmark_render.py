@@ -0,0 +1,48 @@
+"""
+Сравнение бэкендов растеризации диаграммы Ганта ('pil' и 'numpy') на данных текущей БД.
+
+Запуск: python benchmark_render.py [число повторов]
+Для каждого режима выводится лучшее время отрисовки обоими бэкендами и ускорение;
+изображения и списки работ обоих бэкендов должны совпадать.
+"""
+import sys
+import time
+from datetime import date
+
+from app import get_gantt_data
+from components.draw_functions import draw_render_model
+from components.render_model import build_render_model, get_chart_end_date
+
+# Режим, пикселей на час, высота строки
+VIEWS = [('week', 20, 60), ('month', 10, 60), ('month', 20, 60), ('year', 5, 50)]
+
+
+def measure(model, backend, repeats):
+    """Лучшее время отрисовки и результат последней отрисовки"""
+    best, result = None, None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = draw_render_model(model, backend=backend)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(repeats=3):
+    start_date = date.today()
+    for view_mode, pixels_per_hour, row_height in VIEWS:
+        jobs_data, equipment_data, calendar_data = get_gantt_data(
+            'all', start_date, get_chart_end_date(view_mode, start_date)
+        )
+        model = build_render_model(view_mode, start_date, calendar_data, equipment_data, jobs_data,
+                                   pixels_per_hour, row_height, 80)
+        pil_time, (pil_image, pil_jobs) = measure(model, 'pil', repeats)
+        numpy_time, (numpy_image, numpy_jobs) = measure(model, 'numpy', repeats)
+        identical = pil_image.tobytes() == numpy_image.tobytes() and pil_jobs == numpy_jobs
+        print(f"{view_mode:5} {pixels_per_hour:>3} px/ч {model.width}x{model.height}: "
+              f"pil {pil_time * 1000:.0f} мс, numpy {numpy_time * 1000:.0f} мс, "
+              f"ускорение {pil_time / numpy_time:.2f}x, {'совпадает' if identical else 'РАЗЛИЧАЕТСЯ'}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
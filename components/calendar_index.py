@@ -0,0 +1,329 @@
+import copy
+import math
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+
+import numpy as np
+from sqlmodel import select
+
+from database import get_session, get_data_version, bump_data_version
+from models import Calendar
+
+# День без записи в календаре считается рабочим на 8 часов
+DEFAULT_WORK_HOURS = 8
+# Начало отсчета абсолютных позиций в рабочих часах
+POSITION_EPOCH = date(2000, 1, 1).toordinal()
+
+CALENDAR_TABLE = Calendar.__tablename__
+
+
+def to_ordinal(value) -> int:
+    """Преобразует дату (строку ISO, date или datetime) в порядковый номер дня"""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return datetime.fromisoformat(value).date().toordinal()
+
+
+def ordinal_to_iso(ordinal: int) -> str:
+    """Преобразует порядковый номер дня в строку ISO"""
+    return date.fromordinal(ordinal).isoformat()
+
+
+class CalendarSnapshot:
+    """
+    Неизменяемый срез календаря рабочих часов.
+
+    Хранит часы по дням в плотном массиве от первой до последней даты из таблицы Calendar
+    и массив накопленных сумм рабочих часов. За пределами массива все дни считаются
+    рабочими по DEFAULT_WORK_HOURS, поэтому суммы для них считаются арифметически.
+    """
+
+    def __init__(self, records: dict, version: int = 0):
+        self.version = version
+
+        if records:
+            self.base = min(records)
+            days_count = max(records) - self.base + 1
+        else:
+            self.base = POSITION_EPOCH
+            days_count = 0
+
+        self.hours = [DEFAULT_WORK_HOURS] * days_count
+        for ordinal, work_hours in records.items():
+            self.hours[ordinal - self.base] = work_hours
+
+        # cumulative[i] - сумма рабочих часов дней base .. base + i - 1
+        self._cumulative = [0] * (days_count + 1)
+        # working_cumulative[i] - количество рабочих дней base .. base + i - 1
+        self._working_cumulative = [0] * (days_count + 1)
+        # next_working[i] - индекс первого рабочего дня, начиная с base + i
+        # (days_count - первый день за пределами массива, он рабочий по умолчанию)
+        self._next_working = [days_count] * (days_count + 1)
+
+        self._rebuild(0, days_count - 1)
+
+    def _rebuild(self, first: int, last: int):
+        """Пересчитывает производные массивы после изменения часов дней с индексами first .. last"""
+        hours = self.hours
+        days_count = len(hours)
+        cumulative = self._cumulative
+        working_cumulative = self._working_cumulative
+        next_working = self._next_working
+
+        for i in range(first, days_count):
+            cumulative[i + 1] = cumulative[i] + hours[i]
+            working_cumulative[i + 1] = working_cumulative[i] + (1 if hours[i] > 0 else 0)
+
+        # Левее измененных дней таблица меняется только до первого совпадения со старым значением
+        for i in range(last, -1, -1):
+            value = i if hours[i] > 0 else next_working[i + 1]
+            if i < first and next_working[i] == value:
+                break
+            next_working[i] = value
+
+        self._origin = 0
+        self._origin = self._raw_cumulative(POSITION_EPOCH)
+
+        self._hours_array = np.asarray(hours, dtype=np.int64)
+        self._cumulative_array = np.asarray(cumulative, dtype=np.int64)
+        self._next_working_array = np.asarray(next_working, dtype=np.int64)
+
+    def with_changes(self, changes: dict, version: int) -> 'CalendarSnapshot':
+        """
+        Возвращает новый срез с измененными рабочими часами дней {порядковый номер дня: часы}.
+        Массивы пересчитываются только начиная с измененных дней.
+        """
+        days_count = len(self.hours)
+        if not changes:
+            first = last = None
+        else:
+            first, last = min(changes) - self.base, max(changes) - self.base
+
+        # Изменение за пределами плотного массива расширяет его - строим срез заново
+        if first is not None and (first < 0 or last >= days_count):
+            records = {self.base + i: work_hours for i, work_hours in enumerate(self.hours)}
+            records.update(changes)
+            return CalendarSnapshot(records, version)
+
+        snapshot = copy.copy(self)
+        snapshot.version = version
+        snapshot.hours = list(self.hours)
+        snapshot._cumulative = list(self._cumulative)
+        snapshot._working_cumulative = list(self._working_cumulative)
+        snapshot._next_working = list(self._next_working)
+        if first is not None:
+            for ordinal, work_hours in changes.items():
+                snapshot.hours[ordinal - self.base] = work_hours
+            snapshot._rebuild(first, last)
+        return snapshot
+
+    def _raw_cumulative(self, ordinal: int) -> int:
+        """Сумма рабочих часов от начала плотного массива до начала дня (может быть отрицательной)"""
+        i = ordinal - self.base
+        if i < 0:
+            return i * DEFAULT_WORK_HOURS
+        days_count = len(self.hours)
+        if i > days_count:
+            return self._cumulative[days_count] + (i - days_count) * DEFAULT_WORK_HOURS
+        return self._cumulative[i]
+
+    def work_hours(self, ordinal: int) -> int:
+        """Рабочие часы дня"""
+        i = ordinal - self.base
+        if 0 <= i < len(self.hours):
+            return self.hours[i]
+        return DEFAULT_WORK_HOURS
+
+    def position(self, ordinal: int) -> int:
+        """Абсолютная позиция начала дня в рабочих часах (от POSITION_EPOCH)"""
+        return self._raw_cumulative(ordinal) - self._origin
+
+    def hours_between(self, first_ordinal: int, last_ordinal: int) -> int:
+        """Сумма рабочих часов дней с first_ordinal по last_ordinal включительно"""
+        if last_ordinal < first_ordinal:
+            return 0
+        return self._raw_cumulative(last_ordinal + 1) - self._raw_cumulative(first_ordinal)
+
+    def working_days_between(self, first_ordinal: int, last_ordinal: int) -> int:
+        """Количество рабочих дней с first_ordinal по last_ordinal включительно"""
+        if last_ordinal < first_ordinal:
+            return 0
+        return self._raw_working_count(last_ordinal + 1) - self._raw_working_count(first_ordinal)
+
+    def _raw_working_count(self, ordinal: int) -> int:
+        """Количество рабочих дней от начала плотного массива до дня (может быть отрицательным)"""
+        i = ordinal - self.base
+        if i < 0:
+            return i
+        days_count = len(self.hours)
+        if i > days_count:
+            return self._working_cumulative[days_count] + (i - days_count)
+        return self._working_cumulative[i]
+
+    def day_at_position(self, position: float) -> int:
+        """
+        Возвращает день, в котором заканчивается работа, завершающаяся в позиции position,
+        т.е. рабочий день d, для которого position(d) < position <= position(d + 1).
+        """
+        raw = position + self._origin
+        days_count = len(self.hours)
+        total = self._cumulative[days_count]
+
+        if raw <= 0:
+            return self.base + math.ceil(raw / DEFAULT_WORK_HOURS) - 1
+        if raw > total:
+            return self.base + days_count + math.ceil((raw - total) / DEFAULT_WORK_HOURS) - 1
+        return self.base + bisect_left(self._cumulative, raw) - 1
+
+    def day_at_start_position(self, position: float) -> tuple[int, float]:
+        """
+        Возвращает рабочий день и смещение в нем для работы, начинающейся в позиции position,
+        т.е. день d, для которого position(d) <= position < position(d + 1).
+        """
+        raw = position + self._origin
+        days_count = len(self.hours)
+        total = self._cumulative[days_count]
+
+        if raw < 0:
+            ordinal = self.base + math.floor(raw / DEFAULT_WORK_HOURS)
+        elif raw >= total:
+            ordinal = self.base + days_count + math.floor((raw - total) / DEFAULT_WORK_HOURS)
+        else:
+            ordinal = self.base + bisect_right(self._cumulative, raw) - 1
+        return ordinal, position - self.position(ordinal)
+
+    def start_position(self, ordinal: int, offset: float) -> float:
+        """
+        Абсолютная позиция начала работы, начинающейся в день ordinal со смещением offset.
+        Как и в calculate_finish_date, выходной день переносится на первый рабочий день,
+        а не помещающееся в день смещение - на начало следующего рабочего дня.
+        """
+        first_ordinal = self.first_working_day(ordinal)
+        if offset < self.work_hours(first_ordinal):
+            return self.position(first_ordinal) + offset
+        return self.position(self.first_working_day(first_ordinal + 1))
+
+    def first_working_day(self, ordinal: int) -> int:
+        """Первый рабочий день, начиная с указанного (включительно)"""
+        i = ordinal - self.base
+        if i < 0 or i >= len(self.hours):
+            return ordinal
+        return self.base + self._next_working[i]
+
+    # Векторные версии методов для массивов порядковых номеров дней (numpy)
+
+    def work_hours_many(self, ordinals: np.ndarray) -> np.ndarray:
+        """Рабочие часы для массива дней"""
+        i = ordinals - self.base
+        if not len(self.hours):
+            return np.full(i.shape, DEFAULT_WORK_HOURS, dtype=np.int64)
+        inside = (i >= 0) & (i < len(self.hours))
+        return np.where(inside, self._hours_array[np.clip(i, 0, len(self.hours) - 1)], DEFAULT_WORK_HOURS)
+
+    def position_many(self, ordinals: np.ndarray) -> np.ndarray:
+        """Абсолютные позиции начала дней для массива дней"""
+        i = ordinals - self.base
+        days_count = len(self.hours)
+        total = self._cumulative_array[days_count]
+        raw = np.where(
+            i < 0,
+            i * DEFAULT_WORK_HOURS,
+            np.where(i > days_count,
+                     total + (i - days_count) * DEFAULT_WORK_HOURS,
+                     self._cumulative_array[np.clip(i, 0, days_count)])
+        )
+        return raw - self._origin
+
+    def day_at_position_many(self, positions: np.ndarray) -> np.ndarray:
+        """Векторная версия day_at_position"""
+        raw = positions + self._origin
+        days_count = len(self.hours)
+        total = self._cumulative_array[days_count]
+
+        before = self.base + np.ceil(raw / DEFAULT_WORK_HOURS).astype(np.int64) - 1
+        after = self.base + days_count + np.ceil((raw - total) / DEFAULT_WORK_HOURS).astype(np.int64) - 1
+        inside = self.base + np.searchsorted(self._cumulative_array, raw, side='left') - 1
+
+        return np.where(raw <= 0, before, np.where(raw > total, after, inside))
+
+    def first_working_day_many(self, ordinals: np.ndarray) -> np.ndarray:
+        """Векторная версия first_working_day"""
+        i = ordinals - self.base
+        days_count = len(self.hours)
+        inside = (i >= 0) & (i < days_count)
+        found = self.base + self._next_working_array[np.clip(i, 0, days_count)]
+        return np.where(inside, found, ordinals)
+
+
+class CalendarIndex:
+    """
+    Общий для процесса индекс календаря рабочих часов.
+
+    Загружает таблицу Calendar один раз и отдает неизменяемые срезы (CalendarSnapshot).
+    Срез перечитывается из БД при следующем обращении после изменения версии
+    данных таблицы Calendar (см. database.get_data_version).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    @property
+    def version(self) -> int:
+        """Номер версии календаря, увеличивается при каждом изменении"""
+        return get_data_version(CALENDAR_TABLE)
+
+    def snapshot(self) -> CalendarSnapshot:
+        """Возвращает актуальный срез календаря, загружая его при необходимости"""
+        version = self.version
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                if self._snapshot is None or self._snapshot.version != version:
+                    self._snapshot = self._load(version)
+                snapshot = self._snapshot
+        return snapshot
+
+    def update_days(self, changes: dict):
+        """
+        Применяет к срезу изменения рабочих часов дней {дата: часы} сразу после их фиксации в БД,
+        без перечитывания таблицы Calendar. Если между срезом и этим изменением были другие
+        изменения календаря, срез будет перечитан при следующем обращении.
+        """
+        version = self.version
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version - 1:
+                return
+            self._snapshot = snapshot.with_changes(
+                {to_ordinal(date_value): work_hours for date_value, work_hours in changes.items()}, version
+            )
+
+    def invalidate(self):
+        """Принудительно сбрасывает срез календаря (например, после изменения БД в обход сессий)"""
+        bump_data_version(CALENDAR_TABLE)
+
+    def _load(self, version: int) -> CalendarSnapshot:
+        with get_session() as session:
+            rows = session.exec(select(Calendar.date, Calendar.work_hours)).all()
+
+        records = {to_ordinal(date_str): work_hours for date_str, work_hours in rows}
+        return CalendarSnapshot(records, version)
+
+    def work_hours(self, date_value) -> int:
+        """Рабочие часы для даты"""
+        return self.snapshot().work_hours(to_ordinal(date_value))
+
+    def hours_between(self, first_date, last_date) -> int:
+        """Сумма рабочих часов между датами включительно"""
+        return self.snapshot().hours_between(to_ordinal(first_date), to_ordinal(last_date))
+
+    def first_working_day(self, date_value) -> str:
+        """Первый рабочий день, начиная с указанной даты (включительно)"""
+        return ordinal_to_iso(self.snapshot().first_working_day(to_ordinal(date_value)))
+
+
+calendar_index = CalendarIndex()
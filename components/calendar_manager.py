@@ -4,6 +4,8 @@ from datetime import datetime, date, timedelta
 from sqlmodel import select
 import calendar as cal_lib
 
+from .calendar_index import calendar_index, DEFAULT_WORK_HOURS
+
 
 class CalendarManager:
     def __init__(self):
@@ -87,6 +89,9 @@ class CalendarManager:
 
                 session.commit()
 
+                # Обновляем индекс календаря без перечитывания таблицы
+                calendar_index.update_days({date_str: work_hours})
+
                 return {'success': True, 'work_hours': work_hours}
 
         except Exception as e:
@@ -186,11 +191,15 @@ class CalendarManager:
                     Calendar.date <= end_date.isoformat()
                 )
                 records = session.exec(statement).all()
+                deleted_dates = [record.date for record in records]
 
                 for record in records:
                     session.delete(record)
 
                 session.commit()
+
+                # Дни без записи считаются рабочими по умолчанию
+                calendar_index.update_days({date_str: DEFAULT_WORK_HOURS for date_str in deleted_dates})
                 return len(records)
 
         except Exception as e:
@@ -0,0 +1,74 @@
+import numpy as np
+
+PALETTE_SIZE = 256
+
+
+class ChartPalette:
+    """
+    Палитра изображения в режиме P, собираемая по мере перевода полос RGB в номера цветов.
+
+    Основные цвета диаграммы (colors - фоны, заливки, линии, цвета текста) занимают палитру
+    заранее и передаются точно. Остальные цвета (сглаживание текста) добавляются, пока есть
+    место, а затем заменяются ближайшими цветами палитры.
+    """
+
+    def __init__(self, colors):
+        self.colors = []
+        self._index = {}
+        for color in colors:
+            self._add(self._pack(color))
+
+    @staticmethod
+    def _pack(color) -> int:
+        r, g, b = color
+        return (int(r) << 16) | (int(g) << 8) | int(b)
+
+    def _add(self, packed: int) -> int:
+        if packed not in self._index:
+            self._index[packed] = len(self.colors)
+            self.colors.append(packed)
+        return self._index[packed]
+
+    def __len__(self):
+        return len(self.colors)
+
+    def indices(self, pixels) -> np.ndarray:
+        """Номера цветов палитры для массива пикселей (высота x ширина x 3, uint8)"""
+        pixels = np.asarray(pixels, dtype=np.uint32)
+        packed = (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+        # Почти все пиксели - цвета, уже занесенные в палитру: они находятся двоичным поиском,
+        # сортировка (np.unique) нужна только для остальных
+        known = np.array(self.colors, dtype=np.uint32)
+        order = np.argsort(known)
+        known = known[order]
+        position = np.minimum(np.searchsorted(known, packed), len(known) - 1)
+        result = order[position].astype(np.uint8)
+        new = known[position] != packed
+        if new.any():
+            result[new] = self._new_indices(packed[new])
+        return result
+
+    def _new_indices(self, packed) -> np.ndarray:
+        unique, inverse = np.unique(packed, return_inverse=True)
+        lookup = np.empty(len(unique), dtype=np.uint8)
+        missing = []
+        for i, color in enumerate(unique.tolist()):
+            if color in self._index:
+                lookup[i] = self._index[color]
+            elif len(self.colors) < PALETTE_SIZE:
+                lookup[i] = self._add(color)
+            else:
+                missing.append(i)
+        if missing:
+            # Ближайший по евклидову расстоянию цвет палитры
+            palette = self.rgb().astype(np.int32)
+            colors = unique[missing]
+            rgb = np.stack([(colors >> 16) & 255, (colors >> 8) & 255, colors & 255], axis=1).astype(np.int32)
+            distances = ((rgb[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2)
+            lookup[missing] = distances.argmin(axis=1)
+        return lookup[inverse]
+
+    def rgb(self) -> np.ndarray:
+        """Цвета палитры (число цветов x 3, uint8)"""
+        colors = np.array(self.colors, dtype=np.uint32)
+        return np.stack([(colors >> 16) & 255, (colors >> 8) & 255, colors & 255], axis=1).astype(np.uint8)
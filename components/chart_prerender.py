@@ -0,0 +1,69 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from database import add_data_change_listener
+from .debounced_task import DebouncedTask
+
+
+class ChartPrerenderer:
+    """
+    Фоновая перерисовка часто запрашиваемых видов диаграммы после изменения данных.
+
+    render(*view) рисует вид и кладет его в кэш ответов, views() возвращает параметры видов
+    (вызывается при каждом запуске, например, чтобы взять текущую дату). После изменения
+    таблиц tables запуск откладывается на delay секунд (серия изменений - одна перерисовка),
+    виды рисуются параллельно в пуле из workers потоков.
+    """
+
+    def __init__(self, render, views, tables, delay: float = 2.0, workers: int = 2):
+        self._render = render
+        self._views = views
+        self._tables = set(tables)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='gantt-prerender')
+        self._lock = threading.Lock()
+        self.task = DebouncedTask(self.prerender, delay=delay, name='gantt_prerender')
+        self.started = False
+        self.runs = 0
+        self.rendered = 0
+        self.errors = 0
+
+    def start(self):
+        """Подписывается на изменения данных и запускает первую перерисовку (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self.started:
+                return
+            self.started = True
+        add_data_change_listener(self.on_data_change)
+        self.task.schedule()
+
+    def on_data_change(self, tables: set):
+        if '*' in tables or tables & self._tables:
+            self.task.schedule()
+
+    def prerender(self) -> int:
+        """Рисует все виды и ждет завершения, возвращает число нарисованных"""
+        futures = [self._executor.submit(self._render_view, view) for view in self._views()]
+        wait(futures)
+        rendered = sum(future.result() for future in futures)
+        with self._lock:
+            self.runs += 1
+        return rendered
+
+    def _render_view(self, view) -> bool:
+        try:
+            rendered = bool(self._render(*view))
+        except Exception as e:
+            print(f"Ошибка фоновой отрисовки диаграммы {view}: {e}")
+            with self._lock:
+                self.errors += 1
+            return False
+        if rendered:
+            with self._lock:
+                self.rendered += 1
+        return rendered
+
+    def stats(self) -> dict:
+        """Счетчики для мониторинга"""
+        with self._lock:
+            return {'started': self.started, 'runs': self.runs, 'rendered': self.rendered, 'errors': self.errors,
+                    'pending': self.task.pending}
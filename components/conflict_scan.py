@@ -0,0 +1,86 @@
+from sqlmodel import select, func, and_
+
+from database import get_session
+from models import Job, JobHistory, HistoryVersion
+from .calendar_index import calendar_index, to_ordinal
+from .interval_index import job_interval_index, ACTIVE_STATUSES
+
+
+def find_schedule_conflicts() -> dict:
+    """
+    Проверяет весь план и возвращает найденные проблемы:
+        overlaps - пересекающиеся работы на одном оборудовании
+        zero_hour_starts - работы, начинающиеся в день без рабочих часов
+        moved_locked_jobs - закрепленные работы, сдвинутые относительно текущей версии истории
+    """
+    overlaps = [
+        {
+            'equipment_id': equipment_id,
+            'job_id': job_id,
+            'other_job_id': other_job_id,
+            'overlap_hours': round(overlap_hours, 4)
+        }
+        for equipment_id, pairs in sorted(job_interval_index.overlapping_pairs().items())
+        for job_id, other_job_id, overlap_hours in pairs
+    ]
+
+    with get_session() as session:
+        jobs = session.exec(
+            select(Job.id, Job.equipment_id, Job.start_date, Job.hour_offset, Job.is_locked)
+            .where(Job.status.in_(ACTIVE_STATUSES))
+            .order_by(Job.id)
+        ).all()
+        snapshot_jobs = _get_history_snapshot(session)
+
+    calendar = calendar_index.snapshot()
+    zero_hour_starts = [
+        {'job_id': job_id, 'equipment_id': equipment_id, 'start_date': start_date}
+        for job_id, equipment_id, start_date, _, _ in jobs
+        if calendar.work_hours(to_ordinal(start_date)) == 0
+    ]
+
+    moved_locked_jobs = []
+    for job_id, equipment_id, start_date, hour_offset, is_locked in jobs:
+        saved = snapshot_jobs.get(job_id)
+        if not is_locked or saved is None or not saved.is_locked:
+            continue
+        if (saved.equipment_id, saved.start_date, saved.hour_offset or 0) != (equipment_id, start_date,
+                                                                              hour_offset or 0):
+            moved_locked_jobs.append({
+                'job_id': job_id,
+                'equipment_id': equipment_id,
+                'start_date': start_date,
+                'hour_offset': hour_offset,
+                'saved_equipment_id': saved.equipment_id,
+                'saved_start_date': saved.start_date,
+                'saved_hour_offset': saved.hour_offset
+            })
+
+    return {
+        'overlaps': overlaps,
+        'zero_hour_starts': zero_hour_starts,
+        'moved_locked_jobs': moved_locked_jobs,
+        'conflicts_count': len(overlaps) + len(zero_hour_starts) + len(moved_locked_jobs)
+    }
+
+
+def _get_history_snapshot(session) -> dict:
+    """Состояние работ на момент текущей версии истории: {id работы: запись JobHistory}"""
+    version_record = session.exec(select(HistoryVersion).where(HistoryVersion.id == 1)).first()
+    if not version_record or version_record.current_version < 1:
+        return {}
+
+    # Последние записи для каждой работы на момент текущей версии
+    subquery = (
+        select(JobHistory.job_id, func.max(JobHistory.version).label('max_version'))
+        .where(JobHistory.version <= version_record.current_version)
+        .group_by(JobHistory.job_id)
+        .subquery()
+    )
+    history_stmt = (
+        select(JobHistory)
+        .join(subquery, and_(JobHistory.job_id == subquery.c.job_id,
+                             JobHistory.version == subquery.c.max_version))
+        .where(JobHistory.operation_type != 'DELETE')
+    )
+    return {record.job_id: record for record in session.exec(history_stmt).all()}
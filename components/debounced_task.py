@@ -0,0 +1,51 @@
+import threading
+
+
+class DebouncedTask:
+    """
+    Фоновая задача, запускаемая с задержкой после последнего вызова schedule().
+
+    Серия вызовов schedule() в течение delay секунд приводит к одному запуску функции,
+    поэтому задачу можно планировать после каждого изменения данных.
+    """
+
+    def __init__(self, func, delay: float = 1.0, name: str = None):
+        self._func = func
+        self._lock = threading.Lock()
+        self._timer = None
+        self.delay = delay
+        self.name = name or func.__name__
+
+    def schedule(self):
+        """Планирует запуск задачи через delay секунд (откладывает уже запланированный)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        """Отменяет запланированный запуск"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def run_now(self):
+        """Отменяет запланированный запуск и выполняет задачу сразу в текущем потоке"""
+        self.cancel()
+        return self._func()
+
+    @property
+    def pending(self) -> bool:
+        """Есть ли запланированный запуск"""
+        return self._timer is not None
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self._func()
+        except Exception as e:
+            print(f"Ошибка фоновой задачи {self.name}: {e}")
@@ -1,131 +1,218 @@
+import atexit
+import multiprocessing
 import os
-from datetime import timedelta
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .lru_cache import LRUCache
+from .raster_draw import RasterDraw
+from .text_cache import get_font, text_length, draw_text
+from .png_stream import PNGStreamWriter
+from .chart_palette import ChartPalette, PALETTE_SIZE
+from .render_model import margin, y_header_start, y_content_start, build_render_model
+
+# Запас вокруг фрагмента диаграммы, в пределах которого элементы (с подписями) еще рисуются
+viewport_padding = 32
+# Запас холста фрагмента слева и сверху: не меньше ширины самой длинной подписи и высоты строки текста
+viewport_canvas_padding = (256, 32)
+
+# Бэкенд растеризации по умолчанию: 'pil' (ImageDraw) или 'numpy' (RasterDraw)
+RASTER_BACKEND = os.environ.get('GANTT_RASTER_BACKEND', 'pil')
+
+# Число процессов для параллельной отрисовки полос диаграммы (0 или 1 - рисовать в текущем потоке)
+RENDER_PROCESSES = int(os.environ.get('GANTT_RENDER_PROCESSES', 0))
+# Цвет перегруженных ячеек тепловой карты (часов работ больше, чем рабочих часов)
+overload_color = (220, 38, 38)
+# Высота полосы в пикселях при потоковой отрисовке PNG (iter_chart_png)
+STREAM_BAND_HEIGHT = int(os.environ.get('GANTT_STREAM_BAND_HEIGHT', 64))
+# Способ запуска процессов отрисовки: без fork, который копирует потоки и блокировки
+# работающего сервера (forkserver, где его нет - spawn)
+RENDER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+# Пулы процессов отрисовки по числу процессов (создаются при первом использовании)
+_render_pools = {}
+_render_pools_lock = threading.Lock()
+
+# Кэш полос диаграммы: (изображение, работы) для заголовка, строк оборудования и низа диаграммы.
+# Объем ограничивается в мегабайтах переменной окружения ROW_STRIP_CACHE_MB
+row_strip_cache = LRUCache(maxsize=4096, max_weight=int(os.environ.get('ROW_STRIP_CACHE_MB', 128)) * 1024 * 1024,
+                           weigher=lambda item: item[0].width * item[0].height * 3)
+
+
+class ViewportDraw:
+    """
+    Обертка над ImageDraw, рисующая фрагмент диаграммы: координаты всех примитивов
+    сдвигаются на начало области отрисовки (x, y). Текст рисуется и измеряется
+    с кэшами растров и ширин подписей (text_cache).
+    """
 
-import pandas as pd
-from PIL import Image, ImageDraw, ImageFont
+    def __init__(self, draw, x, y):
+        self._draw = draw
+        self.x = x
+        self.y = y
 
-from .worktime_functions import calculate_finish_date, get_order_quantity, get_equipment_total_work_hours
+    def _shift(self, xy):
+        return [value - (self.x if i % 2 == 0 else self.y) for i, value in enumerate(xy)]
 
-margin = 90
+    def rectangle(self, xy, **kwargs):
+        self._draw.rectangle(self._shift(xy), **kwargs)
 
+    def line(self, xy, **kwargs):
+        self._draw.line(self._shift(xy), **kwargs)
+
+    def ellipse(self, xy, **kwargs):
+        self._draw.ellipse(self._shift(xy), **kwargs)
+
+    def text(self, xy, text, font=None, fill=None):
+        draw_text(self._draw, tuple(self._shift(xy)), text, font=font, fill=fill)
+
+    def textlength(self, text, font=None):
+        return text_length(text, font=font)
 
-def draw_chart_image(view_mode, chart_start_date, calendar_data, equipment_data, jobs_data, pixels_per_hour,
-                     row_height, job_height_ratio, is_dark=False):
-    y_header_start = 40
-    y_content_start = y_header_start + 40
-    total_chart_width, total_chart_height, chart_end_date = 0, 0, None
-    jobs_info = []
 
-    job_height = int(row_height * job_height_ratio / 100)
+def rows_are_independent(row_height, job_height, font_medium, font_large):
+    """
+    Помещается ли содержимое строки оборудования (подписи, блоки работ, их тексты) в ее полосу
+    [верх строки, верх строки + row_height). Тогда строку можно рисовать отдельно от соседних.
+    """
+    y_pos = row_height // 2
+    medium_height = sum(font_medium.getmetrics())
+    large_height = sum(font_large.getmetrics())
+    top = min(y_pos - 15, y_pos - job_height // 2, y_pos - 10)
+    bottom = max(y_pos - 15 + large_height,  # название оборудования
+                 y_pos + 2 + medium_height,  # статистика и тираж
+                 y_pos + 5 + medium_height,
+                 y_pos - 7 + max(medium_height, 15),  # название заказа и значок статуса
+                 y_pos + job_height // 2 + 1)  # блок работы
+    return top >= 0 and bottom <= row_height
+
+
+def draw_chart_image(view_mode, chart_start_date, calendar_data, equipment_data, jobs_data, pixels_per_hour,
+                     row_height, job_height_ratio, is_dark=False, viewport=None, order_quantities=None,
+                     use_row_cache=False, backend=None, processes=None, palette=False):
+    """
+    Рисует диаграмму Ганта: рассчитывает разметку (build_render_model) и рисует по ней.
+
+    viewport - область (x, y, ширина, высота) в пикселях полной диаграммы: если указана,
+    рисуется только этот фрагмент, а элементы за его пределами пропускаются.
+    order_quantities - заранее загруженные тиражи заказов {id заказа: количество}.
+    use_row_cache - собирать диаграмму из закэшированных полос строк оборудования (row_strip_cache),
+    заново рисуя только строки, данные которых изменились.
+    backend - бэкенд растеризации ('pil' или 'numpy', по умолчанию RASTER_BACKEND), результат одинаков;
+    'svg' - векторная диаграмма по той же разметке (вместо изображения возвращается текст SVG).
+    processes - число процессов, по которым распределяются горизонтальные полосы диаграммы
+    (по умолчанию RENDER_PROCESSES), изображение совпадает с нарисованным в одном потоке.
+    palette - рисовать в изображение с палитрой (режим P, байт на пиксель) из цветов плана
+    (draw_render_model_palette); если основных цветов больше 256, рисуется обычное RGB.
+    Возвращает [изображение, список нарисованных работ с координатами на полной диаграмме].
+    """
+    model = build_render_model(view_mode, chart_start_date, calendar_data, equipment_data, jobs_data,
+                               pixels_per_hour, row_height, job_height_ratio, order_quantities)
+    if backend == 'svg':
+        from .svg_render import draw_render_model_svg
+        return draw_render_model_svg(model, is_dark, viewport)
+    processes = RENDER_PROCESSES if processes is None else processes
+    if palette and viewport is None:
+        return draw_render_model_palette(model, is_dark, backend)
+    if use_row_cache and viewport is None:
+        return draw_render_model_by_rows(model, is_dark, backend, processes)
+    if processes > 1 and viewport is None:
+        return draw_render_model_parallel(model, is_dark, backend, processes)
+    return draw_render_model(model, is_dark, viewport, backend)
+
+
+def draw_render_model(model, is_dark=False, viewport=None, backend=None):
+    """
+    Рисует диаграмму (или ее фрагмент viewport) по готовой разметке.
+    Возвращает [изображение, список нарисованных работ с координатами на полной диаграмме].
+    """
+    view_mode, pixels_per_hour = model.view_mode, model.pixels_per_hour
+    row_height, job_height = model.row_height, model.job_height
+    total_chart_width, total_chart_height = model.width, model.height
+    grid_bottom = model.grid_bottom
 
     # Загружаем шрифты
     font_small, font_medium, font_large = load_fonts_for_deployment()
-    stats_font = ImageFont.truetype("arial.ttf", 9) if hasattr(font_small, 'getsize') else font_small
-
-    def get_chart_end_date():
-        chart_end_date = None
-        if view_mode == 'year':
-            chart_end_date = chart_start_date + timedelta(days=365)
-        elif view_mode == 'month':
-            chart_end_date = chart_start_date + timedelta(days=30)
-        else:  # week
-            chart_end_date = chart_start_date + timedelta(days=6)
-        return chart_end_date
-
-    def calc_total_chart_width():
-        total_virtual_hours = 0
-        current_date = chart_start_date
-        while current_date <= chart_end_date:
-            work_hours = calendar_data.get(current_date.isoformat(), 8)
-            is_weekend = (work_hours == 0)
-            day_virtual_duration = 2 if is_weekend else work_hours
-            total_virtual_hours += day_virtual_duration
-            current_date += timedelta(days=1)
-
-        chart_width = int(total_virtual_hours * pixels_per_hour)
-        total_chart_width = chart_width + margin * 2
-
-        return total_chart_width, total_virtual_hours
-
-    def calc_total_chart_height(equipment_count, header_height=100):
-        total_chart_height = equipment_count * row_height + header_height + margin
-        return total_chart_height
-
-    def create_metadata_for_days():
-        days_metadata = {}
-
-        current_virtual_time = 0
-        current_date = chart_start_date
-
-        while current_date <= chart_end_date:
-            work_hours = calendar_data.get(current_date.isoformat(), 8)
-            is_weekend = (work_hours == 0)
-            day_virtual_duration = 2 if is_weekend else work_hours
-
-            days_metadata[current_date] = {
-                'short_date': current_date.strftime('%d.%m'),
-                'virtual_start': current_virtual_time,
-                'virtual_end': current_virtual_time + day_virtual_duration,
-                'work_hours': work_hours,
-                'is_weekend': is_weekend
-            }
-            current_virtual_time += day_virtual_duration
-            current_date += timedelta(days=1)
-
-        return days_metadata
-
-    def draw_chart_days_grid(draw, day_metadata):
-
-        for day in day_metadata:
-            day_info = day_metadata[day]
-            x_start = day_info['virtual_start'] * pixels_per_hour + margin
-            x_end = day_info['virtual_end'] * pixels_per_hour + margin
+    stats_font = get_font("arial.ttf", 9) if hasattr(font_small, 'getsize') else font_small
+    # Строки, не выходящие за свои полосы, отсекаются по точным границам
+    independent_rows = rows_are_independent(row_height, job_height, font_medium, font_large)
+
+    if viewport is None:
+        viewport = (0, 0, total_chart_width, total_chart_height)
+    view_x, view_y, view_width, view_height = viewport
+    # Границы видимой области с запасом на подписи
+    visible_left, visible_right = view_x - viewport_padding, view_x + view_width + viewport_padding
+    visible_top, visible_bottom = view_y - viewport_padding, view_y + view_height + viewport_padding
+
+    def is_visible(x1, y1, x2, y2):
+        return x2 >= visible_left and x1 <= visible_right and y2 >= visible_top and y1 <= visible_bottom
+
+    # Видимые строки оборудования
+    rows_top = y_content_start + np.arange(model.rows_count) * row_height
+    if independent_rows:
+        # Нижнюю границу строки перекрывает следующая строка, у последней строки видна линия под ней
+        rows_end = rows_top + row_height
+        if model.rows_count:
+            rows_end[-1] += 3
+        visible_rows = (rows_top < view_y + view_height) & (rows_end > view_y)
+    else:
+        visible_rows = (rows_top + row_height >= visible_top) & (rows_top <= visible_bottom)
+
+    def draw_chart_days_grid(draw):
+        for day in range(len(model.day_work_hours)):
+            x_start, x_end = model.day_x_start[day], model.day_x_end[day]
+            if not is_visible(x_start, y_header_start, x_end, grid_bottom):
+                continue
+            is_weekend = model.day_is_weekend[day]
 
             # Фон дня
-            color = (200, 200, 200) if day_info['is_weekend'] else (173, 216, 230)
+            color = (200, 200, 200) if is_weekend else (173, 216, 230)
+            if is_weekend and not (model.lod and x_end - x_start < 1):
+                draw.rectangle([x_start, y_content_start, x_end, grid_bottom],
+                               fill=color, outline='gray', width=1)
+            # Заголовок дня
+            if not is_visible(x_start, y_header_start, x_end, y_content_start):
+                continue
             draw.rectangle([x_start, y_header_start, x_end, y_content_start - 5],
                            fill=color, outline='gray', width=1)
-            if day_info['is_weekend']:
-                draw.rectangle([x_start, y_content_start, x_end, total_chart_height - margin],
-                               fill=color, outline='gray', width=1)
 
-            xs_date, xs_hours = day_info['short_date'], f"[{day_info['work_hours']}]"
-            if day_info['is_weekend']:
-                if pixels_per_hour == 5:
-                    xs_date, xs_hours = "", ""
-                elif pixels_per_hour < 15:
-                    xs_date = xs_date[:2]
+            xs_date, xs_hours = get_day_header_labels(model, day)
 
             # Название дня
             if pixels_per_hour < 30:
                 day_text, duration = xs_date, xs_hours
                 text_width = draw.textlength(day_text, font=font_small)
                 text_x = x_start + (x_end - x_start - text_width) / 2
-                draw.text((text_x, y_header_start + 5), day_text, fill='black', font=font_small)
+                # В режиме обзора подписи шире дня не рисуются
+                if not model.lod or text_width <= x_end - x_start:
+                    draw.text((text_x, y_header_start + 5), day_text, fill='black', font=font_small)
                 text_width = draw.textlength(duration, font=font_small)
                 text_x = x_start + (x_end - x_start - text_width) / 2
-                draw.text((text_x, y_header_start + 15), duration, fill='black', font=font_small)
+                if not model.lod or text_width <= x_end - x_start:
+                    draw.text((text_x, y_header_start + 15), duration, fill='black', font=font_small)
             else:
                 day_text = f"{xs_date} {xs_hours}"
                 text_width = draw.textlength(day_text, font=font_medium)
                 text_x = x_start + (x_end - x_start - text_width) / 2
                 draw.text((text_x, y_header_start + 5), day_text, fill='black', font=font_medium)
 
-    def draw_chart_equipment_rows(draw, day_metadata, text_color='black'):
-        for i, (_, equipment) in enumerate(equipment_data.iterrows()):
-
-            y_pos = y_content_start + i * row_height + row_height // 2
-            y_row_top = y_content_start + i * row_height
+    def draw_chart_equipment_rows(draw, text_color='black'):
+        # Выходные дни в пределах видимой области
+        weekends = range(np.searchsorted(model.weekend_x_end, visible_left),
+                         np.searchsorted(model.weekend_x_start, visible_right, side='right'))
+        # В режиме обзора выходные уже пикселя не притеняются
+        if model.lod and 2 * pixels_per_hour < 1:
+            weekends = range(0)
+
+        for i in np.flatnonzero(visible_rows).tolist():
+            y_pos = model.row_y_pos(i)
+            y_row_top = model.row_y_top(i)
             y_row_bottom = y_row_top + row_height
 
-            equipment_jobs = jobs_data[jobs_data['equipment_name'] == equipment['name']]
-            # Рассчитываем общее время работы оборудования в диапазоне
-            total_work_hours = get_equipment_total_work_hours(chart_start_date, chart_end_date, equipment_jobs,
-                                                              calendar_data)
-
             # Получаем цвет типа оборудования
-            type_color = equipment['type_color']
-            rgb_color = hex_to_rgb(equipment['type_color'])
+            rgb_color = hex_to_rgb(model.row_type_colors[i])
             background_color = lighten_color(rgb_color, 0.75)
 
             # Рисуем прямоугольник фона для всей строки
@@ -134,29 +221,23 @@ def draw_chart_image(view_mode, chart_start_date, calendar_data, equipment_data,
                 fill=background_color,
                 outline=None
             )
-            # ПРИТЕМНЕНИЕ ФОНА ТИПА ОБОРУДОВАНИЯ В ВЫХОДНЫЕ ДНИ'
-            for day in day_metadata:
-                day_info = day_metadata[day]
-                if day_info['is_weekend']:
-                    day_x_start = day_info['virtual_start'] * pixels_per_hour + margin
-                    day_x_end = day_info['virtual_end'] * pixels_per_hour + margin
-
-                    # Притемняем исходный цвет типа оборудования
-                    darkened_color = darken_color(background_color, 0.1)  # Притемняем на 30%
-                    draw.rectangle(
-                        [day_x_start, y_row_top, day_x_end, y_row_bottom],
-                        fill=darkened_color,
-                        outline=None
-                    )
+            # ПРИТЕМНЕНИЕ ФОНА ТИПА ОБОРУДОВАНИЯ В ВЫХОДНЫЕ ДНИ
+            darkened_color = darken_color(background_color, 0.1)
+            for weekend in weekends:
+                draw.rectangle(
+                    [model.weekend_x_start[weekend], y_row_top, model.weekend_x_end[weekend], y_row_bottom],
+                    fill=darkened_color,
+                    outline=None
+                )
             # === ОТОБРАЖЕНИЕ НАЗВАНИЯ ОБОРУДОВАНИЯ И СТАТИСТИКИ ===
-            equipment_text = equipment['name']
+            equipment_text = model.row_names[i]
             # Рассчитываем позиции текста
             text_width = draw.textlength(equipment_text, font=font_large)
             # Основное название оборудования
             draw.text((margin - text_width - 10, y_pos - 15), equipment_text,
                       fill=text_color, font=font_large)
             # Статистика времени работы (вторая строка)
-            stats_text = f"{total_work_hours:.2f} ч"
+            stats_text = model.row_stats[i]
             stats_width = draw.textlength(stats_text, font=stats_font)
             draw.text((margin - stats_width - 20, y_pos + 2), stats_text,
                       fill=text_color, font=font_medium)
@@ -164,280 +245,392 @@ def draw_chart_image(view_mode, chart_start_date, calendar_data, equipment_data,
             draw.line([margin, y_row_bottom, total_chart_width - margin, y_row_bottom],
                       fill='gray', width=4)
 
-    def draw_chart_days_lines(draw, day_metadata):
-
-        for day in day_metadata:
-            day_info = day_metadata[day]
-            x_start = day_info['virtual_start'] * pixels_per_hour + margin
+    def draw_chart_days_lines(draw):
+        # В режиме обзора линии рисуются только по границам ячеек тепловой карты
+        cell_days = model.lod_cell_days() if model.lod else 1
+        for day in range(0, len(model.day_work_hours), cell_days):
+            x_start, x_end = model.day_x_start[day], model.day_x_end[day]
+            if not is_visible(x_start, y_content_start, x_end, grid_bottom):
+                continue
 
             # Линия дня
-            draw.line([x_start, y_content_start, x_start, total_chart_height - margin],
+            draw.line([x_start, y_content_start, x_start, grid_bottom],
                       fill='gray', width=2)
 
             # Линии часов для рабочих дней
-            if not day_info['is_weekend'] and view_mode == "week":
-                for hour in range(day_info['work_hours'] + 1):
+            if not model.day_is_weekend[day] and view_mode == "week":
+                for hour in range(model.day_work_hours[day] + 1):
                     x_hour = x_start + hour * pixels_per_hour
-                    draw_dotted_line(draw, [x_hour, y_content_start, x_hour, total_chart_height - margin],
-                                     fill='gray', width=1, dot_interval=2)
-
-    def get_virtual_start_time(start_date, offset, day_metadata):
-        """Время начала работы на оси X диаграммы"""
-
-        # Если работа началась до начала диаграммы
-        if start_date < chart_start_date:
-            return 0  # Начинаем отрисовывать с самого начала диаграммы
-
-        if start_date not in day_metadata:
-            return None
-
-        day_info = day_metadata[start_date]
-        if day_info['is_weekend']:
-            return day_info['virtual_start'] + (offset / 24) * 2
-        else:
-            return day_info['virtual_start'] + min(offset, day_info['work_hours'])
-
-    def get_virtual_finish_time(start_dt, offset, duration):
-        """Точное время окончания работы с учетом всей продолжительности"""
-
-        # Получаем полное расписание работы по дням
-        finish_date_str, daily_schedule = calculate_finish_date(
-            start_dt.isoformat(),
-            duration,
-            offset
-        )
-
-        if not daily_schedule:
-            return None
-
-        finish_dt = pd.to_datetime(finish_date_str)
-        work_start_date = start_dt.date()
-
-        # Если работа началась до начала диаграммы
-        if work_start_date < chart_start_date:
-            # Суммируем продолжительность ВСЕХ дней, которые попадают в диапазон диаграммы
-            total_visible_hours = 0
-            last_visible_day = None
-
-            for day_str, hours, day_offset in daily_schedule:
-                day_date = pd.to_datetime(day_str).date()
-
-                if day_date >= chart_start_date:  # День попадает в диапазон диаграммы
-                    total_visible_hours += hours
-                    last_visible_day = (day_date, hours, day_offset)
-
-            if last_visible_day:
-                day_date, hours, day_offset = last_visible_day
-
-                if day_date in day_metadata:
-                    day_info = day_metadata[day_date]
-
-                    # Виртуальное время окончания = начало последнего дня + продолжительность в этот день
-                    if day_info['is_weekend']:
-                        # Для выходных: пропорционально 24 часам
-                        time_in_last_day = day_offset + hours
-                        return day_info['virtual_start'] + (time_in_last_day / 24) * 2
-                    else:
-                        # Для рабочих дней: начало дня + смещение + часы
-                        return day_info['virtual_start'] + day_offset + hours
-
-            return 0  # Если нет видимых дней
-
-        # Стандартный расчет для работ, начинающихся в диапазоне диаграммы
-        finish_date = finish_dt.date()
-
-        if finish_date not in day_metadata:
-            if finish_date < chart_start_date:
-                return 0
-            else:
-                return total_virtual_hours
-
-        day_info = day_metadata[finish_date]
-        last_day_str, hours_in_last_day, offset_in_last_day = daily_schedule[-1]
-        total_time_in_last_day = offset_in_last_day + hours_in_last_day
-
-        if day_info['is_weekend']:
-            return day_info['virtual_start'] + (total_time_in_last_day / 24) * 2
-        else:
-            return day_info['virtual_start'] + total_time_in_last_day
+                    draw_dotted_line(draw, [x_hour, y_content_start, x_hour, grid_bottom],
+                                     fill='gray', width=1, dot_interval=2, y_range=(visible_top, visible_bottom))
+
+    def visible_jobs():
+        """Работы видимых строк, попадающие во фрагмент"""
+        return np.flatnonzero(
+            visible_rows[model.job_rows] &
+            (model.job_x_finish >= visible_left) & (model.job_x_start <= visible_right) &
+            (model.job_y_bottom >= visible_top) & (model.job_y_top <= visible_bottom)
+        ).tolist()
+
+    def draw_chart_utilization(draw):
+        """
+        Тепловая карта загрузки вместо блоков работ (режим обзора): ячейка строки тем темнее,
+        чем больше доля занятых рабочих часов, перегруженные ячейки - красные
+        """
+        x_starts, x_ends, hours, capacity = model.utilization_cells()
+        cells = np.flatnonzero((x_ends >= visible_left) & (x_starts <= visible_right))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            utilization = np.where(capacity > 0, hours / capacity, np.inf)
+        for i in np.flatnonzero(visible_rows).tolist():
+            rgb_color = hex_to_rgb(model.row_type_colors[i])
+            y_pos = model.row_y_pos(i)
+            for cell in cells[hours[i, cells] > 0].tolist():
+                draw.rectangle([x_starts[cell], y_pos - job_height // 2, x_ends[cell], y_pos + job_height // 2],
+                               fill=get_utilization_color(rgb_color, utilization[i, cell]))
+        return visible_jobs()
 
     def draw_chart_jobs(draw):
-
-        equipment_list = [x['id'] for (_, x) in equipment_data.iterrows()]
-
-        for _, job in jobs_data.iterrows():
-
-            hour_offset = float(job['hour_offset']) if job['hour_offset'] else 0.0
-            duration_hours = float(job['duration_hours'])
-            start_dt = pd.to_datetime(job['start_date'])
-
-            virtual_start = get_virtual_start_time(start_dt.date(), hour_offset, day_metadata)
-            virtual_finish = get_virtual_finish_time(start_dt, hour_offset, duration_hours)
-            # Если даты выходят за границы - пропускаем
-            if virtual_start is None or virtual_finish is None:
-                continue
-
-            # Проверяем, началась ли работа до начала диаграммы
-            work_started_before_chart = start_dt.date() < chart_start_date
-
-            if work_started_before_chart:
-                # Работа началась до начала диаграммы
-                if virtual_finish > 0:  # Работа продолжается в диапазоне диаграммы
-                    # Начинаем отрисовку с начала диаграммы
-                    x_start = margin
-                    x_finish = virtual_finish * pixels_per_hour + margin
-
-                else:
-                    # Вся работа завершилась до начала диаграммы - не отрисовываем
-                    continue
-            else:
-                # Обычная отрисовка для работ, начинающихся в диапазоне диаграммы
-                x_start = virtual_start * pixels_per_hour + margin
-                x_finish = virtual_finish * pixels_per_hour + margin
-
-            # Убеждаемся, что работа видима на диаграмме
-            if x_finish <= margin or x_start >= total_chart_width - margin:
-                continue  # Работа полностью за пределами видимой области
-
-            # Обеспечиваем минимальную ширину для коротких работ
-            min_width = 3
-            if x_finish - x_start < min_width:
-                x_finish = x_start + min_width
-
-            # Обеспечиваем попадание в границы диаграммы
-            x_start = max(margin, min(x_start, total_chart_width - margin))
-            x_finish = max(margin, min(x_finish, total_chart_width - margin))
-
-            # Цвет работы
-            status_color_map = {
-                'planned': None,
-                'started': '#00FF00',
-                'completed': '#FF0000'
-            }
-            color = hex_to_rgb(job['order_color'])
-
-            # Рисуем блок работы
-            idx = equipment_list.index(job['equipment_id'])
-            y_pos = y_content_start + idx * row_height + row_height // 2
-            y_top = y_pos - job_height // 2
-            y_bottom = y_pos + job_height // 2
+        # Цвет значка статуса
+        status_color_map = {
+            'planned': None,
+            'started': '#00FF00',
+            'completed': '#FF0000'
+        }
+        y_positions, y_tops, y_bottoms = model.job_y_pos, model.job_y_top, model.job_y_bottom
+        jobs = visible_jobs()
+
+        for job in jobs:
+            x_start, x_finish = float(model.job_x_start[job]), float(model.job_x_finish[job])
+            y_pos, y_top, y_bottom = int(y_positions[job]), int(y_tops[job]), int(y_bottoms[job])
+            order_color = model.job_colors[job]
+            color = hex_to_rgb(order_color)
 
             # Основной прямоугольник
-            outline_color = lighten_color(hex_to_rgb(job['order_color']), 0.6)
-            outline_thickness = 1
+            outline_color = lighten_color(color, 0.6)
             draw_rounded_rectangle(draw,
                                    [x_start, y_top, x_finish, y_bottom],
                                    radius=0,  # Радиус скругления
                                    fill=color,
                                    outline=outline_color,
-                                   width=outline_thickness
+                                   width=1
                                    )
 
-            jobs_info.append({
-                'coordinates': {'x1': x_start, 'y1': y_top, 'x2': x_finish, 'y2': y_bottom},
-                'order_name': job['order_name'],
-                'order_id': job['order_id'],
-                'equipment_name': job['equipment_name'],
-                'id': job['id']
-            })
-            # Проверяем все дни, которые пересекаются с работой
-
-            for day in day_metadata:
-                day_info = day_metadata[day]
-                if day_info['is_weekend']:
-                    day_x_start = day_info['virtual_start'] * pixels_per_hour + margin
-                    day_x_end = day_info['virtual_end'] * pixels_per_hour + margin
-
-                    # Ограничиваем границы текущей работой
-                    day_x_start = max(x_start, day_x_start)
-                    day_x_end = min(x_finish, day_x_end)
-
-                    if day_x_end > day_x_start:  # Если выходной попадает в видимую часть работы
-                        # Рисуем полупрозрачный серый прямоугольник поверх работы
-                        weekend_color = tuple(max(0, int(c * 0.7)) for c in color)
-                        draw.rectangle([day_x_start, y_top, day_x_end, y_bottom],
-                                       fill=weekend_color, outline=None)
+            # Выходные дни, попадающие в работу, притемняются
+            weekend_color = tuple(max(0, int(c * 0.7)) for c in color)
+            for weekend in model.weekends_between(x_start, x_finish):
+                draw.rectangle([max(x_start, model.weekend_x_start[weekend]), y_top,
+                                min(x_finish, model.weekend_x_end[weekend]), y_bottom],
+                               fill=weekend_color, outline=None)
 
             # Текст внутри блока работы
-            text_color = get_contrast_text_color(job['order_color'])
+            text_color = get_contrast_text_color(order_color)
             job_width = x_finish - x_start
 
-            if job_width > 60:
-                # Основной текст - название заказа
-                text = job['order_name']
-                if start_dt.date() < chart_start_date:
-                    text = "← " + text
-
-                if len(text) > 20:
-                    text = text[:20] + '...'
-
-                text_font = font_small if job_height < 30 else font_medium
-                text_width_px = draw.textlength(text, font=text_font)
-
-                if text_width_px > job_width - 10:
-                    text_font = font_small
-                    text_width_px = draw.textlength(text, font=text_font)
-                    if text_width_px > job_width - 10 and len(text) > 8:
-                        text = text[:8] + '...'
-                        text_width_px = draw.textlength(text, font=text_font)
-
-                if text_width_px <= job_width - 10:
-                    text_x = x_start + (job_width - text_width_px) / 2
-                    text_y = y_pos - 10 if job_height >= 30 else y_pos - 7
-
-                    draw.text((text_x, text_y), text, fill=text_color, font=text_font)
-                    if job['status'] in ('started', 'completed'):
-                        icon_color = status_color_map.get(job['status'], text_color)
-                        draw.ellipse((text_x-20, text_y+0, text_x-6, text_y+14), fill=hex_to_rgb(icon_color), outline=text_color, width=2)
-
-            # === НОВЫЙ КОД ДЛЯ ОТОБРАЖЕНИЯ ТИРАЖА ===
-            if job_height >= 40:  # Только если высота блока позволяет
-                # Получаем информацию о тираже заказа
-                order_quantity = get_order_quantity(job['order_id'])
-
-                if order_quantity and order_quantity > 0:
-                    quantity_text = f"{order_quantity} шт."
-                    quantity_font = font_medium
-
-                    # Рассчитываем ширину текста тиража
-                    quantity_width_px = draw.textlength(quantity_text, font=quantity_font)
+            label = get_job_label(model, job, job_width, draw.textlength, font_small, font_medium)
+            if label is not None:
+                text, text_font, text_width_px = label
+                text_x = x_start + (job_width - text_width_px) / 2
+                text_y = y_pos - 10 if job_height >= 30 else y_pos - 7
+
+                draw.text((text_x, text_y), text, fill=text_color, font=text_font)
+                status = model.job_statuses[job]
+                if status in ('started', 'completed'):
+                    icon_color = status_color_map.get(status, text_color)
+                    draw.ellipse((text_x-20, text_y+0, text_x-6, text_y+14), fill=hex_to_rgb(icon_color), outline=text_color, width=2)
+
+            # Тираж заказа (только если высота блока позволяет)
+            quantity_label = get_quantity_label(model, job, job_width, draw.textlength, font_medium)
+            if quantity_label is not None:
+                quantity_text, quantity_width_px = quantity_label
+                # Позиционируем текст тиража под названием заказа
+                quantity_x = x_start + (job_width - quantity_width_px) / 2
+                quantity_y = y_pos + 5 if job_height >= 50 else y_pos + 2
+
+                draw.text((quantity_x, quantity_y), quantity_text,
+                          fill=text_color, font=font_medium)
+        return jobs
+
+    # Фрагмент рисуется с запасом слева и сверху: подписи, начинающиеся левее или выше фрагмента,
+    # растеризуются с той же субпиксельной позицией, что и на полной диаграмме
+    canvas_x = max(0, view_x - viewport_canvas_padding[0])
+    canvas_y = max(0, view_y - viewport_canvas_padding[1])
+    canvas_size = (view_x + view_width - canvas_x, view_y + view_height - canvas_y)
+    background = '#1F2937' if is_dark else 'white'
+    if (backend or RASTER_BACKEND) == 'numpy':
+        draw = RasterDraw(canvas_size, background, origin=(canvas_x, canvas_y))
+    else:
+        image = Image.new('RGB', canvas_size, color=background)
+        draw = ViewportDraw(ImageDraw.Draw(image), canvas_x, canvas_y)
 
-                    # Проверяем, помещается ли текст тиража
-                    if quantity_width_px <= job_width - 10:
-                        # Позиционируем текст тиража под названием заказа
-                        quantity_x = x_start + (job_width - quantity_width_px) / 2
-                        quantity_y = y_pos + 5 if job_height >= 50 else y_pos + 2
+    # Рисуем заголовок с указанием даты начала
+    draw.text((margin, 10), model.title, fill='white' if is_dark else 'black', font=font_large)
+    # Рисуем сетку дней
+    draw_chart_days_grid(draw)
+    # Рисуем строки по оборудованию
+    draw_chart_equipment_rows(draw, 'white' if is_dark else 'black')
+    # отрисовываем работы (в режиме обзора - загрузку оборудования)
+    drawn_jobs = draw_chart_utilization(draw) if model.lod else draw_chart_jobs(draw)
+    # Рисуем линии дней поверх работ
+    draw_chart_days_lines(draw)
+    if isinstance(draw, RasterDraw):
+        image = draw.image()
+    if canvas_x != view_x or canvas_y != view_y:
+        image = image.crop((view_x - canvas_x, view_y - canvas_y, image.width, image.height))
+    return [image, model.jobs_info(drawn_jobs)]
+
+
+def get_render_pool(processes: int) -> ProcessPoolExecutor:
+    """Пул процессов отрисовки (один на число процессов, останавливается при завершении приложения)"""
+    with _render_pools_lock:
+        if processes not in _render_pools:
+            context = multiprocessing.get_context(RENDER_START_METHOD)
+            if RENDER_START_METHOD == 'forkserver':
+                # Сервер процессов загружает только модуль отрисовки, а не главный модуль приложения
+                context.set_forkserver_preload([__name__])
+            _render_pools[processes] = ProcessPoolExecutor(max_workers=processes, mp_context=context)
+        return _render_pools[processes]
+
+
+@atexit.register
+def shutdown_render_pools():
+    """Останавливает пулы процессов отрисовки (при завершении приложения)"""
+    with _render_pools_lock:
+        pools = list(_render_pools.values())
+        _render_pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def draw_render_model_bands(model, is_dark, viewports, backend=None) -> list:
+    """Рисует несколько фрагментов диаграммы (выполняется в процессе пула отрисовки)"""
+    return [draw_render_model(model, is_dark, viewport, backend) for viewport in viewports]
+
+
+def draw_bands(model, is_dark, viewports, backend=None, processes=0) -> list:
+    """
+    Рисует фрагменты диаграммы, распределяя их по processes процессам: разметка передается
+    в процесс один раз на группу соседних фрагментов. Возвращает результаты draw_render_model по порядку.
+    """
+    processes = min(processes, len(viewports))
+    if processes <= 1:
+        return draw_render_model_bands(model, is_dark, viewports, backend)
+    # Группы соседних фрагментов примерно одинаковой площади
+    areas = np.cumsum([viewport[2] * viewport[3] for viewport in viewports])
+    bounds = np.searchsorted(areas, areas[-1] * np.arange(1, processes) / processes).tolist()
+    groups = [viewports[start:end] for start, end in zip([0, *bounds], [*bounds, len(viewports)]) if start < end]
+    pool = get_render_pool(processes)
+    futures = [pool.submit(draw_render_model_bands, model, is_dark, group, backend) for group in groups]
+    return [band for future in futures for band in future.result()]
+
+
+def draw_render_model_parallel(model, is_dark=False, backend=None, processes=2):
+    """
+    Рисует диаграмму горизонтальными полосами из строк оборудования в processes процессах
+    и склеивает их. Полосы рисуются как фрагменты (viewport) полной диаграммы, поэтому
+    изображение совпадает с нарисованным целиком.
+    """
+    if model.rows_count < 2:
+        return draw_render_model(model, is_dark, backend=backend)
+    width, height = model.width, model.height
+    # Границы полос - по верхним границам строк; первая полоса включает заголовок, последняя - низ диаграммы
+    rows = np.array_split(np.arange(model.rows_count), min(processes, model.rows_count))
+    tops = [0] + [model.row_y_top(int(group[0])) for group in rows[1:]] + [height]
+    viewports = [(0, top, width, bottom - top) for top, bottom in zip(tops, tops[1:])]
+
+    image = Image.new('RGB', (width, height))
+    for viewport, (band_image, _) in zip(viewports, draw_bands(model, is_dark, viewports, backend, processes)):
+        image.paste(band_image, (0, viewport[1]))
+    # На полной диаграмме видны все работы разметки
+    return [image, model.jobs_info()]
+
+
+def iter_chart_bands(model, is_dark=False, backend=None, band_height=STREAM_BAND_HEIGHT):
+    """
+    Полосы диаграммы сверху вниз (массивы пикселей высота x ширина x 3): каждая рисуется
+    как фрагмент полной диаграммы, в памяти одновременно находится одна полоса.
+    """
+    for y in range(0, model.height, band_height):
+        viewport = (0, y, model.width, min(band_height, model.height - y))
+        image, _ = draw_render_model(model, is_dark, viewport, backend)
+        pixels = np.asarray(image)
+        del image
+        yield pixels
 
-                        draw.text((quantity_x, quantity_y), quantity_text,
-                                  fill=text_color, font=quantity_font)
 
-    chart_end_date = get_chart_end_date()
-    # вычисляем размеры диаграммы
-    total_chart_width, total_virtual_hours = calc_total_chart_width()
-    total_chart_height = calc_total_chart_height(len(equipment_data))
+def iter_chart_png(model, is_dark=False, backend=None, compress_level=6, band_height=STREAM_BAND_HEIGHT,
+                   chunk_size=64 * 1024):
+    """
+    Диаграмма в формате PNG частями по мере отрисовки полос: память ограничена размером
+    полосы, а не всего изображения. Пиксели совпадают с draw_render_model.
+    """
+    writer = PNGStreamWriter(model.width, model.height, compress_level, chunk_size)
+    yield writer.header()
+    for pixels in iter_chart_bands(model, is_dark, backend, band_height):
+        yield from writer.write(pixels)
+    yield writer.close()
 
-    image = Image.new('RGB', (total_chart_width, total_chart_height), color='#1F2937' if is_dark else 'white')
-    draw = ImageDraw.Draw(image)
 
-    viewport_width = total_chart_width
-    viewport_height = min(total_chart_height + margin / 2, 800)
+def draw_render_model_palette(model, is_dark=False, backend=None, band_height=STREAM_BAND_HEIGHT):
+    """
+    Рисует диаграмму в изображение с палитрой (режим P): полосы RGB переводятся в номера цветов
+    по мере отрисовки, полное изображение занимает байт на пиксель вместо трех.
 
-    # Рисуем заголовок с указанием даты начала
-    title = f"График загрузки - { {'year': 'на год', 'month': 'на месяц', 'week': 'на неделю'}[view_mode]} " \
-            f"(с {chart_start_date.strftime('%d.%m.%Y')})"
-    draw.text((margin, 10), title, fill='white' if is_dark else 'black', font=font_large)
+    Палитра собирается из цветов плана (get_chart_colors): фоны, заливки строк и работ, линии и
+    ячейки тепловой карты передаются точно. Свободные места занимают цвета сглаживания текста,
+    когда они заканчиваются, оставшиеся оттенки заменяются ближайшими цветами палитры.
+    Если основных цветов больше 256, диаграмма рисуется в RGB (draw_render_model).
+    """
+    colors = get_chart_colors(model, is_dark)
+    if len(colors) > PALETTE_SIZE:
+        return draw_render_model(model, is_dark, backend=backend)
+    chart_palette = ChartPalette(colors)
+    indices = np.empty((model.height, model.width), dtype=np.uint8)
+    y = 0
+    for pixels in iter_chart_bands(model, is_dark, backend, band_height):
+        indices[y:y + len(pixels)] = chart_palette.indices(pixels)
+        y += len(pixels)
+    image = Image.fromarray(indices, 'P')
+    image.putpalette(chart_palette.rgb().tobytes())
+    return [image, model.jobs_info()]
+
+
+def draw_render_model_by_rows(model, is_dark=False, backend=None, processes=0):
+    """
+    Собирает диаграмму из полос: заголовок, по полосе на строку оборудования и низ диаграммы.
 
-    # Создаем метаданные дней для позиционирования
-    day_metadata = create_metadata_for_days()
-    # Рисуем сетку дней
-    draw_chart_days_grid(draw, day_metadata)
-    # Рисуем строки по оборудованию
-    draw_chart_equipment_rows(draw, day_metadata, 'white' if is_dark else 'black')
-    # отрисовываем работы
-    draw_chart_jobs(draw)
-    # Рисуем линии дней поверх работ
-    draw_chart_days_lines(draw, day_metadata)
-    return [image, jobs_info]
+    Каждая полоса рисуется как фрагмент полной диаграммы (viewport) и кэшируется по разметке,
+    от которой она зависит: параметрам отображения, дням и работам своей строки.
+    Поэтому после изменения одной работы заново рисуются только строки ее оборудования.
+    Если содержимое строк выходит за их полосы, диаграмма рисуется целиком.
+    Недостающие в кэше полосы распределяются по processes процессам (draw_bands).
+    """
+    font_small, font_medium, font_large = load_fonts_for_deployment()
+    if not model.rows_count or not rows_are_independent(model.row_height, model.job_height, font_medium,
+                                                        font_large):
+        if processes > 1:
+            return draw_render_model_parallel(model, is_dark, backend, processes)
+        return draw_render_model(model, is_dark, backend=backend)
+
+    width, height = model.width, model.height
+    rows_bottom = model.rows_bottom
+    common_key = (model.view_mode, model.chart_start_date, tuple(model.day_work_hours), model.pixels_per_hour,
+                  model.row_height, model.job_height, is_dark, width, height)
+
+    # Полосы: (ключ кэша, верхняя граница, высота)
+    strips = [(('header', common_key), 0, y_content_start)]
+    for i, row_jobs in enumerate(model.rows_jobs()):
+        row_key = (i, model.row_ids[i], model.row_names[i], model.row_type_colors[i], model.row_stats[i],
+                   tuple((int(model.job_ids[job]), float(model.job_x_start[job]), float(model.job_x_finish[job]),
+                          model.job_colors[job], model.job_order_names[job], model.job_order_ids[job],
+                          model.job_equipment_names[job], model.job_statuses[job],
+                          bool(model.job_started_before[job]), model.job_quantities[job]) for job in row_jobs),
+                   None if model.row_day_hours is None else model.row_day_hours[i].tobytes())
+        strips.append((('row', common_key, row_key), model.row_y_top(i), model.row_height))
+    # Под последней строкой видна ее нижняя линия
+    footer_key = ('footer', common_key, model.row_ids[-1], model.row_type_colors[-1])
+    strips.append((footer_key, rows_bottom, height - rows_bottom))
+
+    bands = [(y, row_strip_cache.get(key)) for key, y, _ in strips]
+    missing = [i for i, (_, band) in enumerate(bands) if band is None]
+    rendered = draw_bands(model, is_dark, [(0, strips[i][1], width, strips[i][2]) for i in missing], backend,
+                          processes)
+    for i, band in zip(missing, rendered):
+        row_strip_cache.put(strips[i][0], band)
+        bands[i] = (strips[i][1], band)
+
+    image = Image.new('RGB', (width, height))
+    for y, (band_image, _) in bands:
+        image.paste(band_image, (0, y))
+    # На собранной диаграмме видны все работы разметки
+    return [image, model.jobs_info()]
+
+
+def get_job_label(model, job, job_width, textlength, font_small, font_medium):
+    """
+    Подпись блока работы: (текст, шрифт, ширина текста) или None, если подпись не помещается.
+    textlength(text, font=...) - измерение ширины текста (например, ImageDraw.textlength).
+    """
+    if job_width <= 60:
+        return None
+
+    # Основной текст - название заказа
+    text = model.job_order_names[job]
+    if model.job_started_before[job]:
+        text = "← " + text
+
+    if len(text) > 20:
+        text = text[:20] + '...'
+
+    text_font = font_small if model.job_height < 30 else font_medium
+    text_width_px = textlength(text, font=text_font)
+
+    if text_width_px > job_width - 10:
+        text_font = font_small
+        text_width_px = textlength(text, font=text_font)
+        if text_width_px > job_width - 10 and len(text) > 8:
+            text = text[:8] + '...'
+            text_width_px = textlength(text, font=text_font)
+
+    if text_width_px > job_width - 10:
+        return None
+    return text, text_font, text_width_px
+
+
+def get_quantity_label(model, job, job_width, textlength, font):
+    """Тираж заказа под подписью работы: (текст, ширина текста) или None"""
+    order_quantity = model.job_quantities[job]
+    if model.job_height < 40 or not order_quantity or order_quantity <= 0:
+        return None
+
+    quantity_text = f"{order_quantity} шт."
+    # Проверяем, помещается ли текст тиража
+    quantity_width_px = textlength(quantity_text, font=font)
+    if quantity_width_px > job_width - 10:
+        return None
+    return quantity_text, quantity_width_px
+
+
+def get_day_header_labels(model, day):
+    """Подписи заголовка дня: дата и рабочие часы (у узких выходных - сокращенные или пустые)"""
+    xs_date, xs_hours = model.day_date_labels[day], f"[{model.day_work_hours[day]}]"
+    if model.day_is_weekend[day]:
+        if model.pixels_per_hour == 5:
+            xs_date, xs_hours = "", ""
+        elif model.pixels_per_hour < 15:
+            xs_date = xs_date[:2]
+    return xs_date, xs_hours
+
+
+def get_utilization_color(rgb_color, utilization):
+    """Цвет ячейки тепловой карты: от фона строки к цвету типа оборудования, перегрузка - красная"""
+    if utilization > 1 + 1e-9:
+        return overload_color
+    empty_color = lighten_color(rgb_color, 0.75)
+    full_color = darken_color(rgb_color, 0.2)
+    share = 0.2 + 0.8 * float(utilization)
+    return tuple(int(empty + (full - empty) * share) for empty, full in zip(empty_color, full_color))
+
+
+def get_chart_colors(model, is_dark=False) -> list:
+    """
+    Основные цвета диаграммы по разметке: фон, сетка, строки оборудования, блоки работ,
+    значки статуса и ячейки тепловой карты (RGB, без повторов, в порядке появления)
+    """
+    colors = [hex_to_rgb('#1F2937') if is_dark else (255, 255, 255), (0, 0, 0), (255, 255, 255),
+              (128, 128, 128), (173, 216, 230), (200, 200, 200), (0, 255, 0), (255, 0, 0)]
+    for type_color in dict.fromkeys(model.row_type_colors):
+        background_color = lighten_color(hex_to_rgb(type_color), 0.75)
+        colors += [background_color, darken_color(background_color, 0.1)]
+    for order_color in dict.fromkeys(model.job_colors):
+        color = hex_to_rgb(order_color)
+        colors += [color, lighten_color(color, 0.6), tuple(max(0, int(c * 0.7)) for c in color)]
+    if model.lod:
+        _, _, hours, capacity = model.utilization_cells()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            utilization = np.where(capacity > 0, hours / capacity, np.inf)
+        for row, cell in zip(*np.nonzero(hours > 0)):
+            colors.append(get_utilization_color(hex_to_rgb(model.row_type_colors[row]), utilization[row, cell]))
+    return list(dict.fromkeys(colors))
 
 
 def lighten_color(color, factor=0.3):
@@ -495,8 +688,8 @@ def draw_rounded_rectangle(draw, xy, radius=5, fill=None, outline=None, width=1)
         # draw.arc([x2 - corrected_radius * 2, y2 - corrected_radius * 2, x2, y2], 0, 90, fill=outline, width=width)
 
 
-def draw_dotted_line(draw, xy, fill, width=1, dot_interval=5):
-    """Рисует точечную линию"""
+def draw_dotted_line(draw, xy, fill, width=1, dot_interval=5, y_range=None):
+    """Рисует точечную линию (если задан y_range - только точки в этом диапазоне по вертикали)"""
     x1, y1, x2, y2 = xy
 
     # Вычисляем длину линии
@@ -505,7 +698,20 @@ def draw_dotted_line(draw, xy, fill, width=1, dot_interval=5):
     # Количество точек
     num_dots = int(line_length / dot_interval)
 
-    for i in range(num_dots):
+    first_dot, last_dot = 0, num_dots
+    if y_range is not None and y2 > y1:
+        # Вертикальная координата точек растет с номером точки
+        step = (y2 - y1) * dot_interval / line_length
+        first_dot = max(0, int((y_range[0] - y1) / step) - 1)
+        last_dot = max(first_dot, min(num_dots, int((y_range[1] - y1) / step) + 2))
+
+    if isinstance(draw, RasterDraw) and width // 2 == 0:
+        # Точки в один пиксель - одним присваиванием в массив
+        ratios = np.arange(first_dot, last_dot) * dot_interval / line_length
+        draw.points(x1 + (x2 - x1) * ratios, y1 + (y2 - y1) * ratios, fill)
+        return
+
+    for i in range(first_dot, last_dot):
         ratio = i * dot_interval / line_length
         x = x1 + (x2 - x1) * ratio
         y = y1 + (y2 - y1) * ratio
@@ -546,10 +752,11 @@ def load_fonts_for_deployment():
     font_path = "./fonts/arial.ttf"
     bold_font_path = "./fonts/arialbd.ttf"
     if os.path.exists(font_path):
+        # Шрифты загружаются один раз на процесс (реестр text_cache)
         return (
-            ImageFont.truetype(font_path, 10),
-            ImageFont.truetype(font_path, 12),
-            ImageFont.truetype(bold_font_path, 14)
+            get_font(font_path, 10),
+            get_font(font_path, 12),
+            get_font(bold_font_path, 14)
         )
 
 
@@ -7,7 +7,7 @@ from openpyxl.styles import PatternFill, Border, Side, Alignment, Font
 from openpyxl.utils import get_column_letter
 
 from .draw_functions import darken_color, rgb_to_hex, hex_to_rgb, lighten_color
-from .worktime_functions import calculate_finish_date, get_equipment_total_work_hours
+from .worktime_functions import expand_schedules, get_equipment_total_work_hours
 
 
 def export_to_excel(jobs_df, equipment_df, start_date, end_date, calendar_dict):
@@ -89,6 +89,9 @@ def export_to_excel(jobs_df, equipment_df, start_date, end_date, calendar_dict):
             if day_info['is_weekend']:
                 cell.fill = PatternFill(start_color='D3D3D3', end_color='D3D3D3', fill_type='solid')
 
+    # Расписания всех работ рассчитываются один раз на весь экспорт
+    schedules = expand_schedules(jobs_df)
+
     # СТРОКИ ОБОРУДОВАНИЯ
     current_row = 2
 
@@ -98,7 +101,8 @@ def export_to_excel(jobs_df, equipment_df, start_date, end_date, calendar_dict):
         equipment_jobs = jobs_df[jobs_df['equipment_name'] == equipment['name']]
 
         # Рассчитываем общее время работы оборудования в диапазоне
-        total_work_hours = get_equipment_total_work_hours(start_date, end_date, equipment_jobs, calendar_dict)
+        total_work_hours = get_equipment_total_work_hours(start_date, end_date, equipment_jobs, calendar_dict,
+                                                          schedules)
 
         # Три строки для одного оборудования
         for i in range(3):
@@ -122,40 +126,9 @@ def export_to_excel(jobs_df, equipment_df, start_date, end_date, calendar_dict):
         # Создаем карту занятости для средней строки
         middle_row_occupancy = {}  # key: (start_col, end_col), value: job_data
 
-        for _, job in equipment_jobs.iterrows():
-            hour_offset = float(job['hour_offset']) if not pd.isna(job['hour_offset']) else 0.0
-            duration_hours = float(job['duration_hours'])
-            start_dt = pd.to_datetime(job['start_date'])
-
-            # Рассчитываем расписание работы
-            finish_date_str, daily_schedule = calculate_finish_date(
-                start_dt.isoformat(),
-                duration_hours,
-                hour_offset,
-            )
-
-            # ДОБАВЛЯЕМ ВЫХОДНЫЕ ДНИ В РАСПИСАНИЕ (ТО ЖЕ САМОЕ ДЛЯ ОТОБРАЖЕНИЯ)
-            extended_schedule = []
-            work_start_date = pd.to_datetime(job['start_date']).date()
-            work_finish_date = pd.to_datetime(finish_date_str).date()
-
-            current_schedule_date = work_start_date
-            schedule_index = 0
-
-            while current_schedule_date <= work_finish_date:
-                current_date_str = current_schedule_date.isoformat()
-
-                if schedule_index < len(daily_schedule) and daily_schedule[schedule_index][0] == current_date_str:
-                    extended_schedule.append(daily_schedule[schedule_index])
-                    schedule_index += 1
-                else:
-                    work_hours = calendar_dict.get(current_date_str, 8)
-                    if work_hours == 0:  # Выходной день
-                        extended_schedule.append((current_date_str, 0, 0))
-
-                current_schedule_date += timedelta(days=1)
-
-            daily_schedule_with_weekends = extended_schedule
+        for row, (_, job) in zip(schedules.rows(equipment_jobs.index), equipment_jobs.iterrows()):
+            # Расписание работы в диапазоне экспорта, включая выходные дни (из общего пакетного расчета)
+            daily_schedule_with_weekends = schedules.day_entries(row, start_date, end_date)
 
             # Для каждого дня в расширенном расписании
             for day_str, hours, offset in daily_schedule_with_weekends:
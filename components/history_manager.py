@@ -1,6 +1,7 @@
 from sqlmodel import select, func, and_
 from database import get_session
 from models import JobHistory, HistoryVersion, Job
+from .worktime_functions import get_job_positions
 
 
 class HistoryManager:
@@ -192,7 +193,9 @@ class HistoryManager:
                             hour_offset=history_record.hour_offset,
                             start_date=history_record.start_date,
                             status=history_record.status,
-                            is_locked=history_record.is_locked
+                            is_locked=history_record.is_locked,
+                            **get_job_positions(history_record.start_date, history_record.hour_offset,
+                                                history_record.duration_hours)
                         )
                         session.add(job)
 
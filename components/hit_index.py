@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+
+# Размер ячейки сетки в пикселях диаграммы
+HIT_GRID_CELL_SIZE = 64
+
+
+class JobHitIndex:
+    """
+    Поиск работы по точке изображения диаграммы: равномерная сетка из квадратных ячеек,
+    в каждой - номера работ, блоки которых ее задевают.
+
+    jobs - список работ с координатами (RenderModel.jobs_info). Пары (ячейка, работа) хранятся
+    отсортированными по номеру ячейки, поэтому поиск - двоичный поиск ячейки и проверка
+    нескольких блоков в ней вместо перебора всех работ.
+    """
+
+    def __init__(self, jobs: list, cell_size: int = HIT_GRID_CELL_SIZE):
+        self.jobs = jobs
+        self.cell_size = cell_size
+        boxes = np.array([[job['coordinates'][key] for key in ('x1', 'y1', 'x2', 'y2')] for job in jobs],
+                         dtype=float).reshape(-1, 4)
+        self.boxes = boxes
+        cells = np.floor(np.maximum(boxes, 0) / cell_size).astype(np.int64)
+        self.columns = int(cells[:, 2].max()) + 1 if len(jobs) else 1
+        widths = cells[:, 2] - cells[:, 0] + 1
+        heights = cells[:, 3] - cells[:, 1] + 1
+        counts = widths * heights
+        # Все ячейки каждой работы: смещение внутри прямоугольника ячеек -> столбец и строка сетки
+        job_numbers = np.repeat(np.arange(len(jobs)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        column = cells[job_numbers, 0] + offsets % widths[job_numbers]
+        row = cells[job_numbers, 1] + offsets // widths[job_numbers]
+        cell_ids = row * self.columns + column
+        # Устойчивая сортировка сохраняет порядок работ внутри ячейки
+        order = np.argsort(cell_ids, kind='stable')
+        self.cell_ids, starts = np.unique(cell_ids[order], return_index=True)
+        self.cell_starts = np.append(starts, len(order))
+        self.cell_jobs = job_numbers[order]
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def find(self, x: float, y: float):
+        """
+        Работа, блок которой содержит точку (x, y) включая границы, или None. Из перекрывающихся
+        блоков выбирается первый по списку, как при поиске перебором на клиенте.
+        """
+        if not (math.isfinite(x) and math.isfinite(y)) or x < 0 or y < 0:
+            return None
+        column, row = int(x // self.cell_size), int(y // self.cell_size)
+        if column >= self.columns:
+            return None
+        cell_id = row * self.columns + column
+        position = int(np.searchsorted(self.cell_ids, cell_id))
+        if position == len(self.cell_ids) or self.cell_ids[position] != cell_id:
+            return None
+        for job in self.cell_jobs[self.cell_starts[position]:self.cell_starts[position + 1]].tolist():
+            x1, y1, x2, y2 = self.boxes[job]
+            if x1 <= x <= x2 and y1 <= y <= y2:
+                return self.jobs[job]
+        return None
+
+
+def quantize_jobs(jobs: list) -> list:
+    """
+    Работы с координатами, округленными до целых пикселей внутрь: компактнее в JSON, а целая
+    точка попадает в округленный блок только если попадает в исходный, поэтому клик на клиенте
+    (по целым пикселям, границы включительно) не достается соседнему блоку.
+    """
+    return [{**job, 'coordinates': {'x1': math.ceil(job['coordinates']['x1']),
+                                    'y1': math.ceil(job['coordinates']['y1']),
+                                    'x2': math.floor(job['coordinates']['x2']),
+                                    'y2': math.floor(job['coordinates']['y2'])}} for job in jobs]
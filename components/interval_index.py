@@ -0,0 +1,237 @@
+import heapq
+import threading
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from sqlmodel import select
+
+from database import get_session, get_data_version
+from models import Job
+from .calendar_index import calendar_index, to_ordinal
+
+JOB_TABLE = Job.__tablename__
+# Работы с этими статусами занимают оборудование
+ACTIVE_STATUSES = ('planned', 'started')
+
+
+def job_interval(snapshot, start_date: str, hour_offset: float, duration_hours: float) -> tuple[float, float]:
+    """
+    Интервал [начало, конец) работы в абсолютных рабочих часах.
+
+    Началом считается указанное в работе время старта (для выходного дня - начало следующего
+    рабочего), даже если расчет расписания переносит смещение на следующий рабочий день.
+    """
+    ordinal = to_ordinal(start_date)
+    hour_offset = hour_offset or 0
+    start = snapshot.position(ordinal) + min(hour_offset, snapshot.work_hours(ordinal))
+    end = snapshot.start_position(ordinal, hour_offset) + (duration_hours or 0)
+    return start, end
+
+
+class EquipmentIntervals:
+    """
+    Интервалы работ одного оборудования в абсолютных рабочих часах [начало, конец).
+
+    Интервалы хранятся в списках, отсортированных по началу. Дополнительно хранится
+    максимум концов по префиксу, что позволяет за O(log n) найти первый интервал,
+    который может пересекаться с заданным.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.job_ids = []
+        self._max_ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, job_id: int, start: float, end: float):
+        """Добавляет интервал работы (при равном начале - в порядке возрастания id)"""
+        i = bisect_left(self.starts, start)
+        while i < len(self.starts) and self.starts[i] == start and self.job_ids[i] < job_id:
+            i += 1
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.job_ids.insert(i, job_id)
+        self._update_max_ends(i)
+
+    def remove(self, job_id: int) -> bool:
+        """Удаляет интервал работы"""
+        try:
+            i = self.job_ids.index(job_id)
+        except ValueError:
+            return False
+        del self.starts[i], self.ends[i], self.job_ids[i]
+        self._update_max_ends(i)
+        return True
+
+    def _update_max_ends(self, i: int):
+        previous = self._max_ends[i - 1] if i > 0 else float('-inf')
+        self._max_ends[i:] = list(accumulate(self.ends[i:], max, initial=previous))[1:]
+
+    def overlapping(self, start: float, end: float, exclude_job_id: int = None) -> list:
+        """Все интервалы (id работы, начало, конец), пересекающиеся с [start, end), по возрастанию начала"""
+        # Кандидаты - интервалы, начинающиеся до end, у которых максимум концов по префиксу больше start
+        first = bisect_right(self._max_ends, start)
+        stop = bisect_left(self.starts, end)
+        return [
+            (self.job_ids[k], self.starts[k], self.ends[k])
+            for k in range(first, stop)
+            if self.ends[k] > start and self.job_ids[k] != exclude_job_id
+        ]
+
+    def overlapping_pairs(self) -> list:
+        """
+        Все пары пересекающихся интервалов (id работы, id работы, длина пересечения).
+        Один проход по интервалам в порядке начала с кучей концов активных интервалов.
+        """
+        pairs = []
+        active = []
+        for k, (start, end) in enumerate(zip(self.starts, self.ends)):
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            if end <= start:
+                continue
+            for active_end, j in active:
+                pairs.append((self.job_ids[j], self.job_ids[k], min(active_end, end) - start))
+            heapq.heappush(active, (end, k))
+        return pairs
+
+    def first_overlapping(self, start: float, end: float, exclude_job_id: int = None):
+        """Первый по началу интервал, пересекающийся с [start, end), или None"""
+        first = bisect_right(self._max_ends, start)
+        stop = bisect_left(self.starts, end)
+        for k in range(first, stop):
+            if self.ends[k] > start and self.job_ids[k] != exclude_job_id:
+                return self.job_ids[k], self.starts[k], self.ends[k]
+        return None
+
+
+class JobIntervalIndex:
+    """
+    Общий для процесса индекс интервалов активных работ по оборудованию.
+
+    Строится один раз по всем работам со статусами ACTIVE_STATUSES и перестраивается
+    при следующем обращении, если изменилась версия данных таблицы работ или календаря.
+    Изменения, сделанные через JobManager, применяются инкрементально (apply_job_change).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._equipment = {}
+        self._job_equipment = {}
+        self._job_version = None
+        self._calendar_version = None
+
+    def _ensure_current(self):
+        """Перестраивает индекс, если он устарел (вызывается под блокировкой)"""
+        job_version = get_data_version(JOB_TABLE)
+        calendar_version = calendar_index.version
+        if self._job_version == job_version and self._calendar_version == calendar_version:
+            return
+
+        snapshot = calendar_index.snapshot()
+        statement = select(Job.id, Job.equipment_id, Job.start_date, Job.hour_offset, Job.duration_hours).where(
+            Job.status.in_(ACTIVE_STATUSES)
+        )
+        with get_session() as session:
+            rows = session.exec(statement).all()
+
+        intervals = {}
+        for job_id, equipment_id, start_date, hour_offset, duration_hours in rows:
+            start, end = job_interval(snapshot, start_date, hour_offset, duration_hours)
+            intervals.setdefault(equipment_id, []).append((start, end, job_id))
+
+        self._equipment = {}
+        self._job_equipment = {}
+        for equipment_id, items in intervals.items():
+            items.sort(key=lambda item: (item[0], item[2]))
+            equipment_intervals = EquipmentIntervals()
+            equipment_intervals.starts = [item[0] for item in items]
+            equipment_intervals.ends = [item[1] for item in items]
+            equipment_intervals.job_ids = [item[2] for item in items]
+            equipment_intervals._update_max_ends(0)
+            self._equipment[equipment_id] = equipment_intervals
+            self._job_equipment.update((job_id, equipment_id) for job_id in equipment_intervals.job_ids)
+
+        self._job_version = job_version
+        self._calendar_version = snapshot.version
+
+    def apply_job_change(self, job: Job = None, job_id: int = None):
+        """
+        Применяет к индексу изменение одной работы сразу после его фиксации в БД.
+
+        Args:
+            job: добавленная или измененная работа (None, если работа удалена)
+            job_id: ID удаленной работы
+
+        Если между построением индекса и этим изменением были другие изменения работ,
+        индекс не трогается и будет перестроен при следующем обращении.
+        """
+        with self._lock:
+            job_version = get_data_version(JOB_TABLE)
+            if self._job_version is None or self._job_version != job_version - 1:
+                return
+            if self._calendar_version != calendar_index.version:
+                return
+
+            job_id = job.id if job is not None else job_id
+            equipment_id = self._job_equipment.pop(job_id, None)
+            if equipment_id is not None:
+                self._equipment[equipment_id].remove(job_id)
+
+            if job is not None and job.status in ACTIVE_STATUSES:
+                start, end = job_interval(calendar_index.snapshot(), job.start_date, job.hour_offset,
+                                          job.duration_hours)
+                self._equipment.setdefault(job.equipment_id, EquipmentIntervals()).add(job.id, start, end)
+                self._job_equipment[job.id] = job.equipment_id
+
+            self._job_version = job_version
+
+    def overlapping(self, equipment_id: int, start: float, end: float, exclude_job_id: int = None) -> list:
+        """Все работы оборудования (id, начало, конец), пересекающиеся с [start, end)"""
+        with self._lock:
+            self._ensure_current()
+            equipment_intervals = self._equipment.get(equipment_id)
+            if equipment_intervals is None:
+                return []
+            return equipment_intervals.overlapping(start, end, exclude_job_id)
+
+    def overlapping_pairs(self) -> dict:
+        """Пересекающиеся работы по всем единицам оборудования: {id оборудования: [(id, id, часы)]}"""
+        with self._lock:
+            self._ensure_current()
+            result = {}
+            for equipment_id, equipment_intervals in self._equipment.items():
+                pairs = equipment_intervals.overlapping_pairs()
+                if pairs:
+                    result[equipment_id] = pairs
+            return result
+
+    def first_free_slot(self, equipment_id: int, start: float, duration: float, gap: float = 0.0,
+                        exclude_job_id: int = None) -> float:
+        """
+        Первая позиция не раньше start, с которой работа длительностью duration не пересекается
+        с работами оборудования. При пересечении поиск продолжается с конца первой по началу
+        пересекающейся работы плюс gap (как в check_equipment_conflicts).
+
+        Каждый шаг переносит start за конец пересекающейся работы, и она больше не пересекается,
+        поэтому поиск заканчивается не более чем за число работ оборудования шагов.
+        """
+        if gap < 0:
+            raise ValueError("gap не может быть отрицательным")
+        with self._lock:
+            self._ensure_current()
+            equipment_intervals = self._equipment.get(equipment_id)
+            if equipment_intervals is None:
+                return start
+
+            while True:
+                conflict = equipment_intervals.first_overlapping(start, start + duration, exclude_job_id)
+                if conflict is None:
+                    return start
+                start = conflict[2] + gap
+
+
+job_interval_index = JobIntervalIndex()
@@ -1,5 +1,6 @@
 import database as db
 from models import Job
+from .interval_index import job_interval_index
 
 
 class JobManager:
@@ -48,6 +49,7 @@ class JobManager:
             }
 
             new_job = db.create_job(job_data)
+            job_interval_index.apply_job_change(new_job)
             return {'success': True, 'job': self._job_to_dict(new_job)}
 
         except Exception as e:
@@ -63,6 +65,7 @@ class JobManager:
 
             result = db.update_job(job_id, data)
             if result:
+                job_interval_index.apply_job_change(result)
                 return {'success': True, 'job': self._job_to_dict(result)}
             else:
                 return {'success': False, 'error': 'Job not found'}
@@ -75,6 +78,7 @@ class JobManager:
         try:
             result = db.delete_job(job_id)
             if result:
+                job_interval_index.apply_job_change(job_id=job_id)
                 return {'success': True}
             else:
                 return {'success': False, 'error': 'Job not found'}
@@ -87,6 +91,7 @@ class JobManager:
         try:
             result = db.update_job(job_id, {'status': new_status})
             if result:
+                job_interval_index.apply_job_change(result)
                 return {'success': True, 'job': self._job_to_dict(result)}
             else:
                 return {'success': False, 'error': 'Job not found'}
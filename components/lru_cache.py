@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Потокобезопасный кэш ограниченного размера с вытеснением давно неиспользуемых записей.
+
+    Ведет счетчики попаданий, промахов и вытеснений для мониторинга (stats()).
+    Если заданы max_weight и weigher, размер кэша дополнительно ограничивается
+    суммарным весом записей (например, объемом памяти изображений в байтах).
+    """
+
+    def __init__(self, maxsize: int = 1024, max_weight: int = None, weigher=None):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._weights = {}
+        self.maxsize = max(0, int(maxsize))
+        self.max_weight = max_weight
+        self.weigher = weigher
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Возвращает значение по ключу и отмечает его как недавно использованное"""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Сохраняет значение, вытесняя самые старые записи при переполнении"""
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            if self.weigher is not None:
+                weight = self.weigher(value)
+                self.weight += weight - self._weights.get(key, 0)
+                self._weights[key] = weight
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self._evict()
+
+    def resize(self, maxsize: int):
+        """Изменяет максимальный размер кэша"""
+        with self._lock:
+            self.maxsize = max(0, int(maxsize))
+            self._evict()
+
+    def clear(self):
+        """Очищает кэш (счетчики сохраняются)"""
+        with self._lock:
+            self._data.clear()
+            self._weights.clear()
+            self.weight = 0
+
+    def _evict(self):
+        while len(self._data) > self.maxsize or (self.max_weight is not None and self.weight > self.max_weight):
+            key, _ = self._data.popitem(last=False)
+            self.weight -= self._weights.pop(key, 0)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self) -> dict:
+        """Счетчики кэша для мониторинга"""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'weight': self.weight,
+                'max_weight': self.max_weight,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,92 @@
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Сколько строк изображения фильтруется и сжимается за раз: ограничивает память на промежуточные массивы
+FILTER_ROWS = 64
+
+
+def png_chunk(tag: bytes, data: bytes) -> bytes:
+    """Блок PNG: длина, тип, данные и контрольная сумма"""
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+class PNGStreamWriter:
+    """
+    Потоковый кодировщик PNG (RGB, 8 бит на канал, или с палитрой palette - до 256 цветов RGB,
+    байт на пиксель) без полного изображения в памяти.
+
+    Строки пикселей подаются полосами сверху вниз (write), сжатые данные отдаются блоками
+    IDAT по мере накопления chunk_size байт. Все строки кодируются фильтром Up: диаграмма
+    состоит из вертикальных колонок дней и одноцветных полос, поэтому он сжимает почти так же,
+    как адаптивный выбор фильтра Pillow, и почти ничего не стоит.
+    """
+
+    def __init__(self, width: int, height: int, compress_level: int = 6, chunk_size: int = 64 * 1024,
+                 palette=None):
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.palette = None if palette is None else bytes(np.asarray(palette, dtype=np.uint8).ravel())
+        self.row_size = width if self.palette is not None else width * 3
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._buffer = bytearray()
+        self._previous_row = np.zeros(self.row_size, dtype=np.uint8)
+
+    def header(self) -> bytes:
+        """Подпись файла, заголовок IHDR и палитра PLTE"""
+        if self.palette is None:
+            return PNG_SIGNATURE + png_chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0))
+        return (PNG_SIGNATURE + png_chunk(b'IHDR', struct.pack('>IIBBBBB', self.width, self.height, 8, 3, 0, 0, 0)) +
+                png_chunk(b'PLTE', self.palette))
+
+    def write(self, pixels) -> list:
+        """
+        Добавляет строки (массив высота x ширина x 3, uint8; с палитрой - высота x ширина номеров цветов),
+        возвращает готовые блоки IDAT
+        """
+        pixels = np.asarray(pixels, dtype=np.uint8).reshape(-1, self.row_size)
+        if self.rows_written + len(pixels) > self.height:
+            raise ValueError("Строк больше, чем высота изображения")
+        for start in range(0, len(pixels), FILTER_ROWS):
+            self._buffer += self._compressor.compress(self._filter(pixels[start:start + FILTER_ROWS]))
+        self.rows_written += len(pixels)
+        return self._drain(self.chunk_size)
+
+    def close(self) -> bytes:
+        """Оставшиеся сжатые данные и конец файла"""
+        if self.rows_written != self.height:
+            raise ValueError(f"Записано {self.rows_written} строк из {self.height}")
+        self._buffer += self._compressor.flush()
+        return b''.join(self._drain(1)) + png_chunk(b'IEND', b'')
+
+    def _drain(self, min_size: int) -> list:
+        chunks = []
+        while self._buffer and len(self._buffer) >= min_size:
+            data = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            chunks.append(png_chunk(b'IDAT', data))
+        return chunks
+
+    def _filter(self, rows) -> bytes:
+        """Строки с фильтром Up (разность с предыдущей строкой) и байтом типа фильтра в начале каждой"""
+        up = np.vstack([self._previous_row[None], rows[:-1]])
+        self._previous_row = rows[-1].copy()
+        filtered = np.empty((len(rows), self.row_size + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        # Вычитание uint8 выполняется по модулю 256, как требует PNG
+        np.subtract(rows, up, out=filtered[:, 1:])
+        return filtered.tobytes()
+
+
+def encode_palette_png(image, compress_level: int = 6) -> bytes:
+    """
+    Кодирует изображение с палитрой (режим P) в PNG с фильтром Up. Pillow сохраняет такие
+    изображения без фильтрации строк, а номера цветов диаграммы, как и пиксели RGB, почти
+    повторяют строку выше, поэтому с фильтром файл получается в 1.5-3 раза меньше.
+    """
+    writer = PNGStreamWriter(image.width, image.height, compress_level, palette=image.getpalette()[:256 * 3])
+    return b''.join([writer.header(), *writer.write(np.asarray(image)), writer.close()])
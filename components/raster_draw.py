@@ -0,0 +1,168 @@
+import math
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+
+from .text_cache import draw_text, text_length
+
+# Размер ячейки сетки, которой отмечаются области отложенных операций PIL
+PENDING_CELL = 8
+
+
+class RasterDraw:
+    """
+    Растровый бэкенд отрисовки диаграммы с интерфейсом ImageDraw.
+
+    Прямоугольники, горизонтальные и вертикальные линии и точки рисуются прямо в массив
+    numpy (uint8, высота x ширина x 3) присваиванием срезов - по тем же правилам, что и PIL
+    (координаты отбрасывают дробную часть, концы включаются). Текст, эллипсы и остальные
+    примитивы откладываются и рисуются средствами PIL. Перед тем как закрасить область,
+    где есть отложенные операции, они выполняются (flush) на фрагменте холста, который
+    их покрывает, поэтому порядок наложения и результат совпадают с рисованием через ImageDraw.
+
+    origin - координаты левого верхнего угла холста (как у ViewportDraw).
+    """
+
+    def __init__(self, size, color, origin=(0, 0)):
+        width, height = size
+        self.x, self.y = origin
+        self.pixels = np.array(Image.new('RGB', size, color=color))
+        self._pending = []
+        self._pending_boxes = []
+        self._pending_cells = np.zeros((height // PENDING_CELL + 1, width // PENDING_CELL + 1), dtype=bool)
+        # Высоты шрифтов на время отрисовки
+        self._font_heights = {}
+        self.flushes = 0
+
+    @staticmethod
+    def _color(color):
+        return ImageColor.getrgb(color)[:3] if isinstance(color, str) else tuple(color)[:3]
+
+    def image(self) -> Image.Image:
+        """Готовое изображение (с выполненными отложенными операциями)"""
+        self.flush()
+        return Image.fromarray(self.pixels, 'RGB')
+
+    def flush(self):
+        """Выполняет отложенные операции PIL"""
+        if not self._pending:
+            return
+        boxes = np.array(self._pending_boxes)
+        height, width = self.pixels.shape[:2]
+        # Фрагмент, покрывающий все операции; сдвиг на целое число пикселей не меняет растеризацию
+        # при неотрицательных координатах, поэтому начало фрагмента не правее начала операций
+        x0, y0 = max(0, int(boxes[:, 0].min())), max(0, int(boxes[:, 1].min()))
+        x1, y1 = min(width, int(boxes[:, 2].max()) + 1), min(height, int(boxes[:, 3].max()) + 1)
+        image = Image.fromarray(self.pixels[y0:y1, x0:x1], 'RGB')
+        draw = ImageDraw.Draw(image)
+        for method, xy, args, kwargs in self._pending:
+            xy = [value - (x0 if i % 2 == 0 else y0) for i, value in enumerate(xy)]
+            if method == 'text':
+                draw_text(draw, xy, *args, **kwargs)
+            else:
+                getattr(draw, method)(xy, *args, **kwargs)
+        self.pixels[y0:y1, x0:x1] = np.asarray(image)
+        self._pending = []
+        self._pending_boxes = []
+        self._pending_cells[:] = False
+        self.flushes += 1
+
+    def _is_pending(self, x0, y0, x1, y1) -> bool:
+        """Пересекается ли область (включительно) с отложенными операциями"""
+        if not self._pending or not self._pending_cells[y0 // PENDING_CELL:y1 // PENDING_CELL + 1,
+                                                        x0 // PENDING_CELL:x1 // PENDING_CELL + 1].any():
+            return False
+        return any(bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1
+                   for bx0, by0, bx1, by1 in self._pending_boxes)
+
+    def _defer(self, method, xy, bbox, *args, **kwargs):
+        """Откладывает операцию PIL; bbox - занимаемая ею область в координатах холста"""
+        # Область включает начальную точку операции (от нее отсчитывается сдвиг фрагмента)
+        x0, y0 = math.floor(min(bbox[0], xy[0])), math.floor(min(bbox[1], xy[1]))
+        x1, y1 = math.ceil(bbox[2]), math.ceil(bbox[3])
+        height, width = self.pixels.shape[:2]
+        if x1 < 0 or y1 < 0 or x0 >= width or y0 >= height:
+            return
+        self._pending.append((method, xy, args, kwargs))
+        self._pending_boxes.append((x0, y0, x1, y1))
+        self._pending_cells[max(y0, 0) // PENDING_CELL:min(y1, height - 1) // PENDING_CELL + 1,
+                            max(x0, 0) // PENDING_CELL:min(x1, width - 1) // PENDING_CELL + 1] = True
+
+    def _fill(self, x0, y0, x1, y1, color):
+        """Закрашивает пиксели [x0, x1] x [y0, y1] (целые координаты холста, включительно)"""
+        height, width = self.pixels.shape[:2]
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, width - 1), min(y1, height - 1)
+        if x0 > x1 or y0 > y1:
+            return
+        if self._is_pending(x0, y0, x1, y1):
+            self.flush()
+        self.pixels[y0:y1 + 1, x0:x1 + 1] = color
+
+    def _shift(self, xy):
+        return [value - (self.x if i % 2 == 0 else self.y) for i, value in enumerate(xy)]
+
+    def rectangle(self, xy, fill=None, outline=None, width=1):
+        xy = self._shift(xy)
+        x0, y0, x1, y1 = (int(value) for value in xy)
+        if outline is not None and width != 0 and (x0 >= x1 or y0 >= y1 or width != 1):
+            # Вырожденные прямоугольники и толстая обводка - средствами PIL
+            self._defer('rectangle', xy, (x0 - width, y0 - width, x1 + width, y1 + width + 1),
+                        fill=fill, outline=outline, width=width)
+            return
+        fill = None if fill is None else self._color(fill)
+        if fill is not None:
+            self._fill(x0, y0, x1, y1, fill)
+        if outline is not None and width != 0 and self._color(outline) != fill:
+            color = self._color(outline)
+            self._fill(x0, y0, x1, y0, color)
+            self._fill(x0, y1, x1, y1, color)
+            self._fill(x0, y0, x0, y1, color)
+            self._fill(x1, y0, x1, y1, color)
+
+    def line(self, xy, fill=None, width=1):
+        xy = self._shift(xy)
+        x0, y0, x1, y1 = xy
+        vertical, horizontal = int(x0) == int(x1), int(y0) == int(y1)
+        # Толстые линии совпадают с PIL только для целых координат
+        integral = width == 1 or all(float(value).is_integer() for value in xy)
+        if (vertical or horizontal) and integral and not (vertical and horizontal and width > 1):
+            x0, y0, x1, y1 = (int(value) for value in xy)
+            before, after = (width - 1) // 2, width // 2
+            if vertical:
+                self._fill(x0 - before, min(y0, y1), x0 + after, max(y0, y1), self._color(fill))
+            else:
+                self._fill(min(x0, x1), y0 - before, max(x0, x1), y0 + after, self._color(fill))
+            return
+        self._defer('line', xy, (min(x0, x1) - width, min(y0, y1) - width, max(x0, x1) + width,
+                                 max(y0, y1) + width), fill=fill, width=width)
+
+    def points(self, xs, ys, fill):
+        """Точки (массивы координат) по одному пикселю, как rectangle([x, y, x, y])"""
+        height, width = self.pixels.shape[:2]
+        xs = np.trunc(np.asarray(xs, dtype=float) - self.x).astype(np.int64)
+        ys = np.trunc(np.asarray(ys, dtype=float) - self.y).astype(np.int64)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        xs, ys = xs[inside], ys[inside]
+        if not len(xs):
+            return
+        if self._is_pending(int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())):
+            self.flush()
+        self.pixels[ys, xs] = self._color(fill)
+
+    def ellipse(self, xy, width=1, **kwargs):
+        xy = self._shift(xy)
+        self._defer('ellipse', xy, (xy[0] - 1, xy[1] - 1, xy[2] + 1, xy[3] + 1), width=width, **kwargs)
+
+    def text(self, xy, text, font=None, **kwargs):
+        if not text:
+            return
+        xy = tuple(self._shift(xy))
+        if font not in self._font_heights:
+            self._font_heights[font] = sum(font.getmetrics())
+        # Область текста с запасом на выступающие за метрики части глифов
+        self._defer('text', xy, (xy[0] - 2, xy[1] - 2, xy[0] + self.textlength(text, font=font) + 2,
+                                 xy[1] + self._font_heights[font] + 2), text, font=font, **kwargs)
+
+    def textlength(self, text, font=None):
+        return text_length(text, font=font)
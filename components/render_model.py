@@ -0,0 +1,361 @@
+import os
+from datetime import timedelta
+
+import numpy as np
+
+from .calendar_index import to_ordinal
+from .worktime_functions import expand_schedules, get_order_quantities
+
+margin = 90
+y_header_start = 40
+y_content_start = y_header_start + 40
+# Минимальная ширина блока работы в пикселях
+min_job_width = 3
+
+# Ниже этого масштаба (пикселей на час) вместо блоков работ рисуется тепловая карта загрузки оборудования
+LOD_PIXELS_PER_HOUR = float(os.environ.get('GANTT_LOD_PIXELS_PER_HOUR', 5))
+# Минимальная ширина ячейки тепловой карты: если рабочие дни уже, ячейки объединяют неделю
+LOD_MIN_CELL_WIDTH = 4
+
+VIEW_TITLES = {'year': 'на год', 'month': 'на месяц', 'week': 'на неделю'}
+
+
+def get_chart_end_date(view_mode, chart_start_date):
+    """Последний день диаграммы для режима отображения"""
+    if view_mode == 'year':
+        return chart_start_date + timedelta(days=365)
+    elif view_mode == 'month':
+        return chart_start_date + timedelta(days=30)
+    else:  # week
+        return chart_start_date + timedelta(days=6)
+
+
+def get_chart_days(view_mode, chart_start_date, calendar_data):
+    """
+    Дни диаграммы: даты, рабочие часы и длительности на оси времени в часах
+    (выходной день занимает 2 часа)
+    """
+    chart_end_date = get_chart_end_date(view_mode, chart_start_date)
+    dates = [chart_start_date + timedelta(days=i) for i in range((chart_end_date - chart_start_date).days + 1)]
+    work_hours = [calendar_data.get(day.isoformat(), 8) for day in dates]
+    virtual_durations = [2 if hours == 0 else hours for hours in work_hours]
+    return dates, work_hours, virtual_durations
+
+
+def _chart_size(total_virtual_hours, equipment_count, pixels_per_hour, row_height):
+    return int(total_virtual_hours * pixels_per_hour) + margin * 2, equipment_count * row_height + 100 + margin
+
+
+def get_chart_size(view_mode, chart_start_date, calendar_data, equipment_count, pixels_per_hour, row_height):
+    """Размеры полного изображения диаграммы (ширина, высота) в пикселях"""
+    _, _, virtual_durations = get_chart_days(view_mode, chart_start_date, calendar_data)
+    return _chart_size(sum(virtual_durations), equipment_count, pixels_per_hour, row_height)
+
+
+class RenderModel:
+    """
+    Разметка диаграммы Ганта: положение дней, строк оборудования и блоков работ.
+
+    Строится один раз (build_render_model) и не зависит от шрифтов и БД, поэтому по ней
+    можно рисовать всю диаграмму, ее фрагменты или отдельные строки. Координаты - в пикселях
+    полной диаграммы, массивы numpy выровнены по дням, строкам и работам соответственно:
+        day_x_start, day_x_end, day_is_weekend, day_work_hours, day_date_labels - дни диаграммы
+        weekend_x_start, weekend_x_end - выходные дни (по возрастанию)
+        row_ids, row_names, row_type_colors, row_stats - строки оборудования (row_index: id -> номер строки)
+        job_* - нарисованные работы в порядке исходной таблицы (row - номер строки оборудования)
+        lod - режим обзора (масштаб меньше LOD_PIXELS_PER_HOUR), в нем row_day_hours - часы работ
+        строк оборудования по дням (строки x дни)
+    """
+
+    def __init__(self, view_mode, chart_start_date, pixels_per_hour, row_height, job_height, width, height):
+        self.view_mode = view_mode
+        self.chart_start_date = chart_start_date
+        self.pixels_per_hour = pixels_per_hour
+        self.row_height = row_height
+        self.job_height = job_height
+        self.width = width
+        self.height = height
+        self.title = f"График загрузки - {VIEW_TITLES[view_mode]} (с {chart_start_date.strftime('%d.%m.%Y')})"
+
+        self.day_x_start = self.day_x_end = np.empty(0)
+        self.day_is_weekend = np.empty(0, dtype=bool)
+        self.day_work_hours = []
+        self.day_date_labels = []
+        self.weekend_x_start = self.weekend_x_end = np.empty(0)
+
+        self.row_ids, self.row_names, self.row_type_colors, self.row_stats = [], [], [], []
+        self.row_index = {}
+
+        self.job_ids = np.empty(0, dtype=np.int64)
+        self.job_rows = np.empty(0, dtype=np.int64)
+        self.job_x_start = self.job_x_finish = np.empty(0)
+        self.job_order_ids, self.job_colors, self.job_order_names, self.job_equipment_names = [], [], [], []
+        self.job_statuses, self.job_quantities = [], []
+        self.job_started_before = np.empty(0, dtype=bool)
+
+        self.lod = pixels_per_hour < LOD_PIXELS_PER_HOUR
+        self.row_day_hours = None
+
+    @property
+    def rows_count(self) -> int:
+        return len(self.row_ids)
+
+    @property
+    def rows_bottom(self) -> int:
+        """Нижняя граница последней строки оборудования"""
+        return y_content_start + self.rows_count * self.row_height
+
+    @property
+    def grid_bottom(self) -> int:
+        """Нижняя граница сетки дней"""
+        return self.height - margin
+
+    def row_y_top(self, row: int) -> int:
+        return y_content_start + row * self.row_height
+
+    def row_y_pos(self, row: int) -> int:
+        """Середина строки оборудования"""
+        return y_content_start + row * self.row_height + self.row_height // 2
+
+    @property
+    def job_y_pos(self) -> np.ndarray:
+        return y_content_start + self.job_rows * self.row_height + self.row_height // 2
+
+    @property
+    def job_y_top(self) -> np.ndarray:
+        return self.job_y_pos - self.job_height // 2
+
+    @property
+    def job_y_bottom(self) -> np.ndarray:
+        return self.job_y_pos + self.job_height // 2
+
+    def weekends_between(self, x_start, x_finish) -> range:
+        """Номера выходных дней, пересекающихся с отрезком (x_start, x_finish)"""
+        return range(int(np.searchsorted(self.weekend_x_end, x_start, side='right')),
+                     int(np.searchsorted(self.weekend_x_start, x_finish)))
+
+    def lod_cell_days(self) -> int:
+        """Число дней в ячейке тепловой карты: 1 или 7, если рабочие дни уже LOD_MIN_CELL_WIDTH"""
+        widths = (self.day_x_end - self.day_x_start)[~self.day_is_weekend]
+        return 1 if len(widths) == 0 or widths.min() >= LOD_MIN_CELL_WIDTH else 7
+
+    def utilization_cells(self):
+        """
+        Ячейки тепловой карты загрузки (режим lod): границы ячеек по x, часы работ строк
+        по ячейкам (строки x ячейки) и рабочие часы ячеек
+        """
+        days = len(self.day_work_hours)
+        if days == 0:
+            return np.empty(0), np.empty(0), np.zeros((self.rows_count, 0)), np.empty(0)
+        step = self.lod_cell_days()
+        starts = np.arange(0, days, step)
+        ends = np.minimum(starts + step, days) - 1
+        hours = np.add.reduceat(self.row_day_hours, starts, axis=1)
+        capacity = np.add.reduceat(np.asarray(self.day_work_hours, dtype=float), starts)
+        return self.day_x_start[starts], self.day_x_end[ends], hours, capacity
+
+    def rows_jobs(self) -> list:
+        """Номера работ (в модели) по строкам оборудования"""
+        jobs_by_row = [[] for _ in range(self.rows_count)]
+        for job, row in enumerate(self.job_rows.tolist()):
+            jobs_by_row[row].append(job)
+        return jobs_by_row
+
+    def jobs_info(self, jobs=None) -> list:
+        """Работы с координатами блоков (для подсказок и выбора работы на клиенте)"""
+        jobs = range(len(self.job_ids)) if jobs is None else jobs
+        y_top, y_bottom = self.job_y_top, self.job_y_bottom
+        return [{
+            'coordinates': {'x1': float(self.job_x_start[job]), 'y1': int(y_top[job]),
+                            'x2': float(self.job_x_finish[job]), 'y2': int(y_bottom[job])},
+            'order_name': self.job_order_names[job],
+            'order_id': self.job_order_ids[job],
+            'equipment_name': self.job_equipment_names[job],
+            'id': int(self.job_ids[job])
+        } for job in jobs]
+
+    def layout(self) -> dict:
+        """
+        Разметка в компактном виде для отрисовки на клиенте: параллельные массивы по дням,
+        выходным, строкам и работам (координаты в пикселях полной диаграммы, округлены до 0.01).
+        Названия и цвета заказов вынесены в справочник orders, работы ссылаются на него номером.
+        """
+        orders = {}
+        for order_id, name, color in zip(self.job_order_ids, self.job_order_names, self.job_colors):
+            orders.setdefault(order_id, (name, color))
+
+        def coordinates(values):
+            return np.round(values, 2).tolist()
+
+        order_index = {order_id: i for i, order_id in enumerate(orders)}
+        return {
+            'view_mode': self.view_mode,
+            'start_date': self.chart_start_date.isoformat(),
+            'title': self.title,
+            'width': self.width,
+            'height': self.height,
+            'pixels_per_hour': self.pixels_per_hour,
+            'row_height': self.row_height,
+            'job_height': self.job_height,
+            'margin': margin,
+            'header_top': y_header_start,
+            'content_top': y_content_start,
+            'grid_bottom': self.grid_bottom,
+            'days': {
+                'x_start': coordinates(self.day_x_start),
+                'x_end': coordinates(self.day_x_end),
+                'date': self.day_date_labels,
+                'work_hours': list(self.day_work_hours),
+                'is_weekend': self.day_is_weekend.astype(int).tolist()
+            },
+            'weekends': {
+                'x_start': coordinates(self.weekend_x_start),
+                'x_end': coordinates(self.weekend_x_end)
+            },
+            'rows': {
+                'id': self.row_ids,
+                'name': self.row_names,
+                'type_color': self.row_type_colors,
+                'stats': self.row_stats,
+                'y_top': [self.row_y_top(row) for row in range(self.rows_count)]
+            },
+            'jobs': {
+                'id': self.job_ids.tolist(),
+                'row': self.job_rows.tolist(),
+                'x_start': coordinates(self.job_x_start),
+                'x_finish': coordinates(self.job_x_finish),
+                'y_top': self.job_y_top.tolist(),
+                'order': [order_index[order_id] for order_id in self.job_order_ids],
+                'status': self.job_statuses,
+                'started_before': self.job_started_before.astype(int).tolist(),
+                'quantity': [int(quantity) for quantity in self.job_quantities]
+            },
+            'orders': {
+                'id': list(orders),
+                'name': [name for name, _ in orders.values()],
+                'color': [color for _, color in orders.values()]
+            }
+        }
+
+
+def build_render_model(view_mode, chart_start_date, calendar_data, equipment_data, jobs_data, pixels_per_hour,
+                       row_height, job_height_ratio, order_quantities=None) -> RenderModel:
+    """
+    Рассчитывает разметку диаграммы: дни, строки оборудования и блоки работ.
+
+    Виртуальное время начала и окончания работ считается векторно по результатам
+    expand_schedules, тиражи заказов загружаются одним запросом (если блоки достаточно высокие).
+    """
+    chart_end_date = get_chart_end_date(view_mode, chart_start_date)
+    job_height = int(row_height * job_height_ratio / 100)
+
+    # Дни диаграммы: выходной занимает на оси 2 часа
+    dates, work_hours, virtual_durations = get_chart_days(view_mode, chart_start_date, calendar_data)
+    is_weekend = np.array([hours == 0 for hours in work_hours], dtype=bool)
+    virtual_end = np.cumsum(virtual_durations, dtype=float) if dates else np.empty(0)
+    virtual_start = virtual_end - np.asarray(virtual_durations, dtype=float)
+    total_virtual_hours = sum(virtual_durations)
+
+    model = RenderModel(view_mode, chart_start_date, pixels_per_hour, row_height, job_height,
+                        *_chart_size(total_virtual_hours, len(equipment_data), pixels_per_hour, row_height))
+    model.day_x_start = virtual_start * pixels_per_hour + margin
+    model.day_x_end = virtual_end * pixels_per_hour + margin
+    model.day_is_weekend = is_weekend
+    model.day_work_hours = work_hours
+    model.day_date_labels = [day.strftime('%d.%m') for day in dates]
+    model.weekend_x_start = model.day_x_start[is_weekend]
+    model.weekend_x_end = model.day_x_end[is_weekend]
+
+    # Строки оборудования
+    model.row_ids = [int(equipment_id) for equipment_id in equipment_data['id']] if len(equipment_data) else []
+    model.row_names = list(equipment_data['name']) if len(equipment_data) else []
+    model.row_type_colors = list(equipment_data['type_color']) if len(equipment_data) else []
+    for row, equipment_id in enumerate(model.row_ids):
+        model.row_index.setdefault(equipment_id, row)
+    if model.lod:
+        model.row_day_hours = np.zeros((model.rows_count, len(dates)))
+
+    # Расписания всех работ рассчитываются один раз
+    schedules = expand_schedules(jobs_data)
+    job_equipment_names = np.asarray(jobs_data['equipment_name'], dtype=object)
+
+    # Статистика строк: рабочие часы работ оборудования (по названию) в диапазоне диаграммы
+    hours_in_range = schedules.hours_in_range(chart_start_date, chart_end_date)
+    for name in model.row_names:
+        rows = np.flatnonzero(job_equipment_names == name)
+        total_work_hours = float(hours_in_range[rows].sum()) if len(rows) else 0
+        model.row_stats.append(f"{total_work_hours:.2f} ч")
+
+    if len(jobs_data) == 0:
+        return model
+
+    # Виртуальное время начала работ
+    chart_start_ordinal = to_ordinal(chart_start_date)
+    days_count = len(dates)
+    start_day = schedules.start_ordinal - chart_start_ordinal
+    started_before = start_day < 0
+    start_in_chart = (start_day >= 0) & (start_day < days_count)
+    start_index = np.clip(start_day, 0, days_count - 1)
+    hour_offset = schedules.first_offset
+    job_virtual_start = np.where(
+        is_weekend[start_index],
+        virtual_start[start_index] + (hour_offset / 24) * 2,
+        virtual_start[start_index] + np.minimum(hour_offset, np.asarray(work_hours, dtype=float)[start_index])
+    )
+    job_virtual_start = np.where(started_before, 0, job_virtual_start)
+
+    # Виртуальное время окончания работ
+    finish_day = schedules.finish_ordinal - chart_start_ordinal
+    finish_in_chart = (finish_day >= 0) & (finish_day < days_count)
+    finish_index = np.clip(finish_day, 0, days_count - 1)
+    finish_offset = schedules.finish_offset
+    job_virtual_finish = np.where(
+        is_weekend[finish_index],
+        virtual_start[finish_index] + (finish_offset / 24) * 2,
+        virtual_start[finish_index] + finish_offset
+    )
+    job_virtual_finish = np.where(finish_in_chart, job_virtual_finish,
+                                  np.where(started_before | (finish_day < 0), 0, total_virtual_hours))
+
+    # Работы вне диапазона и без расписания не рисуются
+    drawn = schedules.valid & (started_before | start_in_chart) & ~(started_before & (job_virtual_finish <= 0))
+
+    x_start = np.where(started_before, margin, job_virtual_start * pixels_per_hour + margin)
+    x_finish = job_virtual_finish * pixels_per_hour + margin
+    drawn &= (x_finish > margin) & (x_start < model.width - margin)
+    # Минимальная ширина коротких работ и границы диаграммы
+    x_finish = np.where(x_finish - x_start < min_job_width, x_start + min_job_width, x_finish)
+    x_start = np.maximum(margin, np.minimum(x_start, model.width - margin))
+    x_finish = np.maximum(margin, np.minimum(x_finish, model.width - margin))
+
+    job_rows = np.array([model.row_index.get(equipment_id, -1) for equipment_id in jobs_data['equipment_id']],
+                        dtype=np.int64)
+    drawn &= job_rows >= 0
+    jobs = np.flatnonzero(drawn)
+
+    if model.lod:
+        # Загрузка оборудования по дням: часы всех работ строки
+        allocations = schedules.daily_allocations(chart_start_date, chart_end_date)
+        in_rows = job_rows >= 0
+        np.add.at(model.row_day_hours, job_rows[in_rows], allocations[in_rows])
+
+    order_ids = np.asarray(jobs_data['order_id'])[jobs].tolist()
+    if job_height >= 40:
+        if order_quantities is None:
+            order_quantities = get_order_quantities(order_ids)
+        quantities = [order_quantities.get(order_id, 0) for order_id in order_ids]
+    else:
+        quantities = [0] * len(jobs)
+
+    model.job_ids = np.asarray(jobs_data['id'], dtype=np.int64)[jobs]
+    model.job_rows = job_rows[jobs]
+    model.job_x_start = x_start[jobs]
+    model.job_x_finish = x_finish[jobs]
+    model.job_started_before = started_before[jobs]
+    model.job_order_ids = order_ids
+    model.job_colors = np.asarray(jobs_data['order_color'], dtype=object)[jobs].tolist()
+    model.job_order_names = np.asarray(jobs_data['order_name'], dtype=object)[jobs].tolist()
+    model.job_equipment_names = job_equipment_names[jobs].tolist()
+    model.job_statuses = np.asarray(jobs_data['status'], dtype=object)[jobs].tolist()
+    model.job_quantities = quantities
+    return model
@@ -0,0 +1,173 @@
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from .draw_functions import (load_fonts_for_deployment, get_job_label, get_quantity_label, get_day_header_labels,
+                             get_contrast_text_color, get_utilization_color, hex_to_rgb, rgb_to_hex, lighten_color)
+from .render_model import margin, y_header_start, y_content_start
+from .text_cache import text_length
+
+# Классы элементов: дни, подписи (размеры шрифтов как у растровой диаграммы), притенение выходных, линии
+SVG_STYLE = (
+    ".d{fill:#ADD8E6;stroke:gray;stroke-width:1}.w{fill:#C8C8C8;stroke:gray;stroke-width:1}"
+    ".s{font-size:10px}.m{font-size:12px}.l{font-size:14px;font-weight:bold}"
+    ".o{fill:#000;fill-opacity:.1}.k{fill:#000;fill-opacity:.3}"
+    ".g{stroke:gray;stroke-width:2}.h{stroke:gray;stroke-width:1;stroke-dasharray:1 1}.r{fill:gray}"
+)
+STATUS_COLORS = {'started': '#00FF00', 'completed': '#FF0000'}
+
+
+def _num(value) -> str:
+    """Число для атрибута SVG: не больше двух знаков после запятой, без лишних нулей"""
+    text = f"{float(value):.2f}".rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def draw_render_model_svg(model, is_dark=False, viewport=None):
+    """
+    Рисует диаграмму по готовой разметке в SVG (векторное изображение без растеризации).
+
+    Положение дней, строк и блоков работ, подписи и их сокращение совпадают с растровой
+    диаграммой, текст выравнивается средствами SVG; в режиме обзора (model.lod), как и на растровой
+    диаграмме, вместо блоков работ рисуется тепловая карта загрузки. viewport - область
+    (x, y, ширина, высота), которую показывает изображение (viewBox).
+    Возвращает [текст SVG, список работ с координатами на полной диаграмме].
+    """
+    font_small, font_medium, font_large = load_fonts_for_deployment()
+    font_classes = {font_small: 's', font_medium: 'm', font_large: 'l'}
+    # Отступ базовой линии от верха текста (в растровой диаграмме текст позиционируется по верху)
+    ascents = {font: font.getmetrics()[0] for font in font_classes}
+    text_color = 'white' if is_dark else 'black'
+    width, height = model.width, model.height
+    view_x, view_y, view_width, view_height = viewport or (0, 0, width, height)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{view_width}" height="{view_height}" '
+        f'viewBox="{view_x} {view_y} {view_width} {view_height}" font-family="Arial,sans-serif">',
+        f'<style>{SVG_STYLE}</style>',
+        f'<rect width="{width}" height="{height}" fill="{"#1F2937" if is_dark else "white"}"/>',
+        f'<text x="{margin}" y="{10 + ascents[font_large]}" class="l" fill="{text_color}">{escape(model.title)}</text>'
+    ]
+
+    def text(x, y, content, font, fill, anchor='middle'):
+        parts.append(f'<text x="{_num(x)}" y="{_num(y + ascents[font])}" class="{font_classes[font]}" '
+                     f'text-anchor="{anchor}" fill="{fill}">{escape(content)}</text>')
+
+    # Сетка дней: колонки выходных и заголовки
+    grid_bottom = model.grid_bottom
+    for day in range(len(model.day_work_hours)):
+        x_start, x_end = model.day_x_start[day], model.day_x_end[day]
+        day_class = 'w' if model.day_is_weekend[day] else 'd'
+        if model.day_is_weekend[day] and not (model.lod and x_end - x_start < 1):
+            parts.append(f'<rect x="{_num(x_start)}" y="{y_content_start}" width="{_num(x_end - x_start)}" '
+                         f'height="{grid_bottom - y_content_start}" class="w"/>')
+        parts.append(f'<rect x="{_num(x_start)}" y="{y_header_start}" width="{_num(x_end - x_start)}" '
+                     f'height="{y_content_start - 5 - y_header_start}" class="{day_class}"/>')
+        xs_date, xs_hours = get_day_header_labels(model, day)
+        x_center = x_start + (x_end - x_start) / 2
+        if model.pixels_per_hour < 30:
+            # В режиме обзора подписи шире дня не рисуются
+            for label, y in ((xs_date, y_header_start + 5), (xs_hours, y_header_start + 15)):
+                if label and (not model.lod or text_length(label, font=font_small) <= x_end - x_start):
+                    text(x_center, y, label, font_small, 'black')
+        else:
+            text(x_center, y_header_start + 5, f"{xs_date} {xs_hours}", font_medium, 'black')
+
+    # Строки оборудования: фон, притенение выходных, линии между строками и подписи
+    chart_right = width - margin
+    for i in range(model.rows_count):
+        background_color = lighten_color(hex_to_rgb(model.row_type_colors[i]), 0.75)
+        parts.append(f'<rect x="{margin}" y="{model.row_y_top(i)}" width="{chart_right - margin}" '
+                     f'height="{model.row_height}" fill="{rgb_to_hex(background_color)}"/>')
+    # В режиме обзора выходные уже пикселя не притеняются
+    if model.rows_count and not (model.lod and 2 * model.pixels_per_hour < 1):
+        for weekend in range(len(model.weekend_x_start)):
+            x_start, x_end = model.weekend_x_start[weekend], model.weekend_x_end[weekend]
+            parts.append(f'<rect x="{_num(x_start)}" y="{y_content_start}" width="{_num(x_end - x_start)}" '
+                         f'height="{model.rows_bottom - y_content_start}" class="o"/>')
+    for i in range(model.rows_count):
+        # Линию под строкой частично перекрывает следующая строка, под последней она видна целиком
+        y_row_bottom = model.row_y_top(i) + model.row_height
+        line_height = 4 if i == model.rows_count - 1 else 1
+        parts.append(f'<rect x="{margin}" y="{y_row_bottom - 1}" width="{chart_right - margin + 1}" '
+                     f'height="{line_height}" class="r"/>')
+        y_pos = model.row_y_pos(i)
+        text(margin - 10, y_pos - 15, model.row_names[i], font_large, text_color, 'end')
+        # Статистика выравнивается, как на растровой диаграмме: по ширине мелкого шрифта
+        stats_width = text_length(model.row_stats[i], font=font_small)
+        text(margin - stats_width - 20, y_pos + 2, model.row_stats[i], font_medium, text_color, 'start')
+
+    if model.lod:
+        _draw_utilization(model, parts)
+    else:
+        _draw_jobs(model, parts, text)
+
+    # Линии дней (и часов в режиме недели) поверх работ; в режиме обзора - по границам ячеек тепловой карты
+    cell_days = model.lod_cell_days() if model.lod else 1
+    for day in range(0, len(model.day_work_hours), cell_days):
+        x_start = model.day_x_start[day]
+        parts.append(f'<line x1="{_num(x_start)}" y1="{y_content_start}" x2="{_num(x_start)}" y2="{grid_bottom}" '
+                     f'class="g"/>')
+        if not model.day_is_weekend[day] and model.view_mode == "week":
+            for hour in range(model.day_work_hours[day] + 1):
+                x_hour = _num(int(x_start + hour * model.pixels_per_hour) + 0.5)
+                parts.append(f'<line x1="{x_hour}" y1="{y_content_start}" x2="{x_hour}" y2="{grid_bottom}" '
+                             f'class="h"/>')
+
+    parts.append('</svg>')
+    return ['\n'.join(parts), model.jobs_info()]
+
+
+def _draw_utilization(model, parts):
+    """
+    Тепловая карта загрузки (режим обзора): ячейка строки тем темнее, чем больше доля занятых
+    рабочих часов, перегруженные ячейки - красные (цвета как на растровой диаграмме)
+    """
+    x_starts, x_ends, hours, capacity = model.utilization_cells()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        utilization = np.where(capacity > 0, hours / capacity, np.inf)
+    half_height = model.job_height // 2
+    for i in range(model.rows_count):
+        rgb_color = hex_to_rgb(model.row_type_colors[i])
+        y_top = model.row_y_pos(i) - half_height
+        for cell in np.flatnonzero(hours[i] > 0).tolist():
+            fill = rgb_to_hex(get_utilization_color(rgb_color, utilization[i, cell]))
+            parts.append(f'<rect x="{_num(x_starts[cell])}" y="{y_top}" width="{_num(x_ends[cell] - x_starts[cell])}" '
+                         f'height="{2 * half_height}" fill="{fill}"/>')
+
+
+def _draw_jobs(model, parts, text):
+    """Блоки работ с подписями, значками статуса и тиражами"""
+    font_small, font_medium, _ = load_fonts_for_deployment()
+    y_positions, y_tops = model.job_y_pos.tolist(), model.job_y_top.tolist()
+    job_height = model.job_height
+    for job in range(len(model.job_ids)):
+        x_start, x_finish = float(model.job_x_start[job]), float(model.job_x_finish[job])
+        y_pos, y_top = y_positions[job], y_tops[job]
+        job_width = x_finish - x_start
+        order_color = model.job_colors[job]
+        outline_color = rgb_to_hex(lighten_color(hex_to_rgb(order_color), 0.6))
+        parts.append(f'<rect x="{_num(x_start)}" y="{y_top}" width="{_num(job_width)}" height="{job_height}" '
+                     f'fill="{order_color}" stroke="{outline_color}"/>')
+        for weekend in model.weekends_between(x_start, x_finish):
+            weekend_start = max(x_start, model.weekend_x_start[weekend])
+            weekend_end = min(x_finish, model.weekend_x_end[weekend])
+            parts.append(f'<rect x="{_num(weekend_start)}" y="{y_top}" width="{_num(weekend_end - weekend_start)}" '
+                         f'height="{job_height}" class="k"/>')
+
+        job_text_color = get_contrast_text_color(order_color)
+        label = get_job_label(model, job, job_width, text_length, font_small, font_medium)
+        if label is not None:
+            label_text, label_font, label_width = label
+            text_x = x_start + (job_width - label_width) / 2
+            text_y = y_pos - 10 if job_height >= 30 else y_pos - 7
+            text(x_start + job_width / 2, text_y, label_text, label_font, job_text_color)
+            status = model.job_statuses[job]
+            if status in STATUS_COLORS:
+                parts.append(f'<circle cx="{_num(text_x - 13)}" cy="{text_y + 7}" r="7" fill="{STATUS_COLORS[status]}" '
+                             f'stroke="{job_text_color}" stroke-width="2"/>')
+
+        quantity_label = get_quantity_label(model, job, job_width, text_length, font_medium)
+        if quantity_label is not None:
+            quantity_y = y_pos + 5 if job_height >= 50 else y_pos + 2
+            text(x_start + job_width / 2, quantity_y, quantity_label[0], font_medium, job_text_color)
@@ -0,0 +1,76 @@
+import math
+import os
+import threading
+
+from PIL import Image, ImageDraw, ImageFont
+
+from .lru_cache import LRUCache
+
+# Загруженные шрифты по (путь, размер): файлы читаются один раз на процесс
+_fonts = {}
+_fonts_lock = threading.Lock()
+# Измерение текста без холста (режим сглаживания как у ImageDraw на RGB-изображении)
+_measure = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+# Ширины текстов по (текст, шрифт): названия заказов, подписи дней и тиражей повторяются
+text_length_cache = LRUCache(maxsize=int(os.environ.get('TEXT_LENGTH_CACHE_SIZE', 65536)))
+# Растры подписей по (текст, шрифт, режим сглаживания, дробные части координат): (маска, смещение).
+# Объем ограничивается в мегабайтах переменной окружения TEXT_MASK_CACHE_MB
+text_mask_cache = LRUCache(maxsize=65536, max_weight=int(os.environ.get('TEXT_MASK_CACHE_MB', 32)) * 1024 * 1024,
+                           weigher=lambda item: item[0].size[0] * item[0].size[1] + 64)
+# Наложение масок в draw_text использует внутренние методы ImageDraw (_getink, draw.draw_bitmap),
+# проверенные на версиях Pillow из requirements.txt. Если в другой версии их нет или они
+# изменились, текст рисуется через ImageDraw.text
+_draw_bitmap_supported = True
+
+
+def get_font(path, size):
+    """Шрифт TrueType из реестра (загружается при первом обращении)"""
+    key = (path, size)
+    font = _fonts.get(key)
+    if font is None:
+        with _fonts_lock:
+            font = _fonts.get(key)
+            if font is None:
+                font = _fonts[key] = ImageFont.truetype(path, size)
+    return font
+
+
+def text_length(text, font=None) -> float:
+    """Ширина текста в пикселях, как ImageDraw.textlength (с кэшем)"""
+    key = (text, font)
+    length = text_length_cache.get(key)
+    if length is None:
+        length = _measure.textlength(text, font=font)
+        text_length_cache.put(key, length)
+    return length
+
+
+def draw_text(draw, xy, text, font=None, fill=None):
+    """
+    Рисует однострочный текст, как ImageDraw.text: маска глифов с субпиксельным началом
+    накладывается цветом fill. Маски одинаковых текстов с одинаковой дробной частью координат
+    берутся из text_mask_cache, поэтому повторяющиеся подписи не растеризуются заново.
+    """
+    global _draw_bitmap_supported
+    if not text:
+        return
+    if (not _draw_bitmap_supported or not isinstance(font, ImageFont.FreeTypeFont) or
+            '\n' in text or '\r' in text):
+        draw.text(xy, text, fill=fill, font=font)
+        return
+    x, y = xy
+    start = (math.modf(x)[0], math.modf(y)[0])
+    try:
+        key = (text, font, draw.fontmode, start)
+        glyphs = text_mask_cache.get(key)
+        if glyphs is None:
+            glyphs = font.getmask2(text, draw.fontmode, start=start)
+            text_mask_cache.put(key, glyphs)
+        mask, offset = glyphs
+        ink = draw._getink(fill)[0]
+        draw.draw.draw_bitmap((int(x) + offset[0], int(y) + offset[1]), mask, ink)
+    except (AttributeError, TypeError) as e:
+        print(f"Наложение масок текста недоступно, текст рисуется через ImageDraw.text: {e}")
+        _draw_bitmap_supported = False
+        draw.text(xy, text, fill=fill, font=font)
@@ -1,42 +1,52 @@
+import math
+import os
+from collections.abc import Sequence
 from datetime import datetime, timedelta
 from typing import Tuple, List, Optional
 
+import numpy as np
 import pandas as pd
-from sqlmodel import select
-from models import Calendar, Order, Job
-from database import get_session, get_job_by_id, get_previous_job_by_id, update_job, get_next_job_by_id
+from sqlmodel import select, or_
+from models import Order, Job
+from database import get_session, get_job_by_id, get_previous_job_by_id, update_job, get_next_job_by_id, \
+    update_jobs_bulk, update_job_positions_bulk, add_data_change_listener
+from .calendar_index import calendar_index, to_ordinal, ordinal_to_iso, CALENDAR_TABLE
+from .debounced_task import DebouncedTask
+from .interval_index import job_interval_index, job_interval
+from .lru_cache import LRUCache
+
+# Кэш результатов calculate_finish_date (размер задается переменной окружения FINISH_DATE_CACHE_SIZE)
+finish_date_cache = LRUCache(int(os.environ.get('FINISH_DATE_CACHE_SIZE', 4096)))
+
+# Сохраняемые позиции работ (Job.start_ordinal, Job.end_ordinal) измеряются в четвертях часа
+POSITION_SCALE = 4
+# Промежуток в рабочих часах между работой и следующей за ней при устранении конфликтов
+CONFLICT_GAP = 0.25
 
 
 def adjust_date_for_work_hours(date_str: str, offset: float) -> tuple[str, float]:
     """Корректирует дату и смещение с учетом рабочих часов"""
-    work_hours = get_work_hours_for_date(date_str)
+    snapshot = calendar_index.snapshot()
+    ordinal = to_ordinal(date_str)
+    work_hours = snapshot.work_hours(ordinal)
 
     # Если день выходной, ищем следующий рабочий день
     if work_hours == 0:
-        next_working_day = ensure_working_day(date_str)
-        return next_working_day, 0.0  # Начинаем с начала рабочего дня
+        return ordinal_to_iso(_ensure_working_ordinal(snapshot, ordinal)), 0.0  # Начинаем с начала рабочего дня
 
-    # Если смещение превышает рабочий день, переходим к следующему дню
+    # Если смещение превышает рабочий день, переходим к следующему рабочему дню
     if offset >= work_hours:
-        next_working_day = (datetime.fromisoformat(date_str) + timedelta(days=1)).date().isoformat()
-        next_work_hours = get_work_hours_for_date(next_working_day)
-
-        # Если следующий день выходной, ищем рабочий
-        if next_work_hours == 0:
-            next_working_day = ensure_working_day(next_working_day)
-            next_work_hours = get_work_hours_for_date(next_working_day)
+        next_working_day = _ensure_working_ordinal(snapshot, ordinal + 1)
 
         # Корректируем смещение для следующего дня
-        adjusted_offset = offset - work_hours
-
-        return next_working_day, adjusted_offset
+        return ordinal_to_iso(next_working_day), offset - work_hours
 
     return date_str, offset
 
 
 def adjust_schedule_and_fix_conflicts(start_date: str, offset: float, duration: float,
                                       equipment_id: int, job_id: Optional[int] = None,
-                                      only_check: bool = True) -> bool:
+                                      only_check: bool = True) -> tuple[bool, List[dict]]:
     """
     Корректирует расписание и устраняет конфликты, перепланируя последующие работы.
 
@@ -49,7 +59,23 @@ def adjust_schedule_and_fix_conflicts(start_date: str, offset: float, duration:
         only_check: не устранять конфликты, только проверить их существование
 
      Returns:
-        bool: True если есть конфликты, False если конфликтов нет
+        tuple: (True если есть конфликты, False если конфликтов нет;
+                сдвинутые работы - результат reschedule_following_jobs, при only_check пустой список)
+    """
+    has_conflicts, _, _, moved_jobs = check_and_fix_conflicts(start_date, offset, duration, equipment_id, job_id,
+                                                              only_check)
+    return has_conflicts, moved_jobs
+
+
+def check_and_fix_conflicts(start_date: str, offset: float, duration: float,
+                            equipment_id: int, job_id: Optional[int] = None,
+                            only_check: bool = True) -> tuple[bool, str, float, List[dict]]:
+    """
+    То же, что adjust_schedule_and_fix_conflicts, но дополнительно возвращает
+    первое свободное время, найденное при проверке.
+
+    Returns:
+        tuple: (есть ли конфликты, доступная дата, доступное смещение, сдвинутые работы)
     """
     # 1. Проверяем конфликты и получаем доступную дату
     available_date, available_offset = check_equipment_conflicts(
@@ -58,126 +84,209 @@ def adjust_schedule_and_fix_conflicts(start_date: str, offset: float, duration:
 
     # 2. Если дата и смещение совпадают с исходными - нет конфликтов
     if available_date == start_date and abs(available_offset - offset) < 0.01:
-        return False
+        return False, available_date, available_offset, []
 
+    moved_jobs = []
     if not only_check:
-        with get_session() as session:
-            # 3. Вычисляем финишные параметры для исходной работы
-            finish_date, daily_schedule = calculate_finish_date(
-                start_date, duration, offset
-            )
-            # Получаем время окончания из последнего дня расписания
-            if daily_schedule:
-                last_day_date, last_day_hours, last_day_offset = daily_schedule[-1]
-                finish_offset = last_day_offset + last_day_hours
-            else:
-                finish_offset = 0
-
-            # 4. Вычисляем next_start_date как finish_date + finish_offset + 0.25 часа
-            finish_dt = datetime.fromisoformat(finish_date)
-            next_start_dt = finish_dt + timedelta(hours=finish_offset + 0.25 if finish_offset != 0 else finish_offset)
-            next_start_date = next_start_dt.date().isoformat()
-            next_start_offset = next_start_dt.hour + next_start_dt.minute / 60.0
-
-            # 5. Получаем список будущих работ, исключая текущую
-            future_jobs = get_future_jobs_excluding_current_optimized(
-                start_date, offset, job_id, equipment_id
-            )
-
-            # 6. Перебираем работы и перепланируем их если нужно
-            for future_job_id, future_duration in future_jobs:
-                # Получаем текущие параметры работы
-                future_job = session.get(Job, future_job_id)
-                if not future_job:
-                    continue
-
-                current_start_date = future_job.start_date
-                current_offset = future_job.hour_offset or 0.0
-
-                # Если работа начинается после next_start_date - выходим из цикла
-                current_start_dt = datetime.fromisoformat(current_start_date) + timedelta(hours=current_offset)
-                if current_start_dt >= next_start_dt:
-                    break
-
-                # Перепланируем работу на next_start_date
-                future_job.start_date = next_start_date
-                future_job.hour_offset = next_start_offset
-                session.add(future_job)
-
-                # Вычисляем новые параметры финиша для перепланированной работы
-                new_finish_date, new_daily_schedule = calculate_finish_date(
-                    next_start_date, future_duration, next_start_offset
-                )
-
-                # Обновляем next_start_date для следующей работы
-                if new_daily_schedule:
-                    last_day_date, last_day_hours, last_day_offset = new_daily_schedule[-1]
-                    new_finish_offset = last_day_offset + last_day_hours
-                else:
-                    new_finish_offset = 0
-
-                new_finish_dt = datetime.fromisoformat(new_finish_date)
-                next_start_dt = new_finish_dt + timedelta(hours=new_finish_offset + 0.25)
-                next_start_date = next_start_dt.date().isoformat()
-                next_start_offset = next_start_dt.hour + next_start_dt.minute / 60.0
-
-            # Фиксируем изменения в БД
-            session.commit()
-
-    # 7. Возвращаем исходные доступные дату и смещение
-    return True
+        # 3. Сдвигаем последующие работы вплотную за текущей
+        moved_jobs = reschedule_following_jobs(start_date, offset, duration, equipment_id, job_id)
+
+    # 4. Возвращаем исходные доступные дату и смещение и сдвинутые работы
+    return True, available_date, available_offset, moved_jobs
+
+
+def reschedule_following_jobs(start_date: str, offset: float, duration: float, equipment_id: int,
+                              job_id: Optional[int] = None) -> List[dict]:
+    """
+    Каскадно сдвигает работы оборудования, начинающиеся раньше окончания указанной работы.
+
+    Цепочка сдвигов рассчитывается в памяти за один проход по отсортированному списку работ
+    в абсолютных рабочих часах, как и проверка конфликтов (check_equipment_conflicts): каждая
+    сдвинутая работа начинается через CONFLICT_GAP часа после окончания предыдущей. Проход
+    останавливается на первой работе, которая уже начинается позже. Все сдвинутые работы
+    записываются в БД одним пакетным UPDATE.
+
+    Returns:
+        List[dict]: сдвинутые работы - id, old_start_date, old_hour_offset, new_start_date, new_hour_offset,
+                    duration_hours
+    """
+    snapshot = calendar_index.snapshot()
+    # Начало следующей работы - окончание текущей + CONFLICT_GAP
+    _, end_position = job_interval(snapshot, start_date, offset, duration)
+    next_position = end_position + CONFLICT_GAP if (duration or 0) > 0 else end_position
+
+    future_jobs = get_future_jobs_excluding_current_optimized(start_date, offset, job_id, equipment_id)
+
+    moved_jobs = []
+    for future_job_id, future_start_date, future_offset, future_duration in future_jobs:
+        future_offset = future_offset or 0.0
+
+        # Если работа начинается не раньше next_position - дальше сдвигать нечего
+        future_position, _ = job_interval(snapshot, future_start_date, future_offset, future_duration)
+        if future_position >= next_position:
+            break
+
+        new_ordinal, new_offset = snapshot.day_at_start_position(next_position)
+        moved_jobs.append({
+            'id': future_job_id,
+            'old_start_date': future_start_date,
+            'old_hour_offset': future_offset,
+            'new_start_date': ordinal_to_iso(new_ordinal),
+            'new_hour_offset': new_offset,
+            'duration_hours': future_duration
+        })
+
+        # Новое смещение - внутри рабочего дня, поэтому работа занимает часы подряд от next_position
+        next_position += (future_duration or 0) + CONFLICT_GAP
+
+    update_jobs_bulk([
+        {'id': job['id'], 'start_date': job['new_start_date'], 'hour_offset': job['new_hour_offset'],
+         **get_job_positions(job['new_start_date'], job['new_hour_offset'], job['duration_hours'])}
+        for job in moved_jobs
+    ])
+
+    return moved_jobs
 
 
 def get_future_jobs_excluding_current_optimized(need_date: str, offset: float, exclude_job_id: Optional[int],
-                                                equipment_id: int) -> List[Tuple[int, float]]:
+                                                equipment_id: int) -> List[Tuple[int, str, float, float]]:
     """
-    Оптимизированная версия - возвращает только ID работы и длительность.
+    Возвращает активные работы оборудования (id, дата начала, смещение, длительность),
+    которые заканчиваются позже указанного момента, в порядке начала.
     """
+    statement = select(Job.id, Job.start_date, Job.hour_offset, Job.duration_hours).where(
+        Job.equipment_id == equipment_id,
+        Job.status.in_(['planned', 'started'])
+    )
+    if exclude_job_id is not None:
+        statement = statement.where(Job.id != exclude_job_id)
+    need_ordinal = to_ordinal(need_date)
+    if job_positions_are_current():
+        # Работы, закончившиеся до начала дня need_date, отсекаются по сохраненной позиции окончания
+        # (с запасом на округление до четверти часа). Для отрицательного смещения окончание
+        # считается пошагово и может не совпадать с сохраненным - такие работы проверяются точно
+        day_start = math.floor(calendar_index.snapshot().position(need_ordinal) * POSITION_SCALE) - 1
+        statement = statement.where(or_(Job.end_ordinal == None, Job.end_ordinal >= day_start,
+                                        Job.hour_offset < 0))
+    statement = statement.order_by(Job.start_date, Job.hour_offset)
+
     with get_session() as session:
-        # Базовый запрос
-        statement = select(Job.id, Job.start_date, Job.duration_hours, Job.hour_offset).where(
-            Job.equipment_id == equipment_id,
-            Job.status.in_(['planned', 'started'])
-        )
+        jobs = session.exec(statement).all()
 
-        # Добавляем условие исключения если нужно
-        if exclude_job_id is not None:
-            statement = statement.where(Job.id != exclude_job_id)
+    if not jobs:
+        return []
 
-        # Сортируем
-        statement = statement.order_by(Job.start_date, Job.hour_offset)
+    # Даты окончания всех работ рассчитываются одним векторным проходом
+    schedules = expand_schedules(pd.DataFrame(jobs, columns=['id', 'start_date', 'hour_offset', 'duration_hours']))
+    is_future = schedules.valid & (
+        (schedules.finish_ordinal > need_ordinal) |
+        ((schedules.finish_ordinal == need_ordinal) & (offset < schedules.finish_offset))
+    )
 
-        # Выполняем запрос
-        results = session.exec(statement)
-        jobs = results.all()
-        future_jobs = []
+    return [tuple(jobs[row]) for row in np.flatnonzero(is_future)]
 
-        need_date_dt = datetime.fromisoformat(need_date).date()
 
-        for job in jobs:
-            job_id, start_date, duration_hours, hour_offset = job
-            hour_offset = hour_offset or 0.0
+def get_job_positions(start_date: str, hour_offset: float, duration_hours: float) -> dict:
+    """
+    Рассчитывает сохраняемые поля работы: start_ordinal и end_ordinal (позиции начала
+    и окончания в четвертях рабочего часа) и finish_date (дата окончания).
+    """
+    start_position, end_position = job_interval(calendar_index.snapshot(), start_date, hour_offset, duration_hours)
+    finish_date, _ = calculate_finish_date(start_date, duration_hours or 0, hour_offset or 0)
+    return {
+        'start_ordinal': round(start_position * POSITION_SCALE),
+        'end_ordinal': round(end_position * POSITION_SCALE),
+        'finish_date': finish_date
+    }
 
-            # Рассчитываем дату завершения работы
-            finish_date_str, daily_schedule = calculate_finish_date(
-                start_date, duration_hours, hour_offset
-            )
-            finish_date = datetime.fromisoformat(finish_date_str).date()
-            _, last_day_hours, last_day_offset = daily_schedule[-1]
-            # Проверяем, что работа завершается после need_date
-            if finish_date > need_date_dt or (finish_date == need_date_dt and offset < last_day_offset + last_day_hours):
-                future_jobs.append((job_id, duration_hours))
 
-        return future_jobs
+def get_job_positions_many(jobs) -> dict:
+    """
+    Сохраняемые поля (как get_job_positions) для набора работ одним векторным проходом.
 
+    Args:
+        jobs: DataFrame (или словарь массивов) с колонками start_date, hour_offset, duration_hours
 
-def get_work_hours_for_date(date_str: str) -> int:
-    """Получает рабочие часы для даты из календаря"""
+    Returns:
+        dict: массивы start_ordinal, end_ordinal и список finish_date, выровненные по строкам jobs
+    """
+    snapshot = calendar_index.snapshot()
+    schedules = expand_schedules(jobs)
+    ordinals, offsets = schedules.start_ordinal, schedules.first_offset
+    durations = np.nan_to_num(np.asarray(jobs['duration_hours'], dtype=float))
+
+    # Начало - как в job_interval: указанное время старта, смещение не дальше конца дня
+    start_position = snapshot.position_many(ordinals) + np.minimum(offsets, snapshot.work_hours_many(ordinals))
+    # Окончание - от начала по расписанию (snapshot.start_position)
+    first_ordinal = snapshot.first_working_day_many(ordinals)
+    fits_first_day = offsets < snapshot.work_hours_many(first_ordinal)
+    schedule_start = np.where(fits_first_day, snapshot.position_many(first_ordinal) + offsets,
+                              snapshot.position_many(snapshot.first_working_day_many(first_ordinal + 1)))
+    return {
+        'start_ordinal': np.round(start_position * POSITION_SCALE).astype(np.int64),
+        'end_ordinal': np.round((schedule_start + durations) * POSITION_SCALE).astype(np.int64),
+        'finish_date': [ordinal_to_iso(ordinal) for ordinal in schedules.finish_ordinal.tolist()]
+    }
+
+
+# Версия календаря, по которой пересчитаны сохраненные позиции работ (None - еще не пересчитывались)
+_job_positions_calendar_version = None
+
+
+def job_positions_are_current() -> bool:
+    """Рассчитаны ли сохраненные позиции и даты окончания работ по текущему календарю"""
+    return _job_positions_calendar_version == calendar_index.version
+
+
+def recompute_job_positions() -> int:
+    """Пересчитывает сохраненные позиции всех работ по текущему календарю, возвращает число обновленных"""
+    global _job_positions_calendar_version
+    calendar_version = calendar_index.version
+
+    statement = select(Job.id, Job.start_date, Job.hour_offset, Job.duration_hours,
+                       Job.start_ordinal, Job.end_ordinal, Job.finish_date)
     with get_session() as session:
-        statement = select(Calendar.work_hours).where(Calendar.date == date_str)
-        work_hours = session.exec(statement).first()
+        jobs = session.exec(statement).all()
 
-        return work_hours if work_hours is not None else 8
+    columns = ['id', 'start_date', 'hour_offset', 'duration_hours', 'start_ordinal', 'end_ordinal', 'finish_date']
+    jobs_df = pd.DataFrame(jobs, columns=columns)
+    try:
+        positions = get_job_positions_many(jobs_df)
+    except Exception as e:
+        # Некорректные даты в отдельных работах: расчет по одной работе (с запасным вариантом в calculate_finish_date)
+        print(f"Ошибка пакетного расчета позиций работ: {e}")
+        positions = pd.DataFrame([get_job_positions(*job[1:4]) for job in jobs],
+                                 columns=['start_ordinal', 'end_ordinal', 'finish_date'])
+
+    changed = []
+    for job, start_ordinal, end_ordinal, finish_date in zip(jobs, positions['start_ordinal'], positions['end_ordinal'],
+                                                            positions['finish_date']):
+        job_id, start_date, hour_offset, duration_hours = job[:4]
+        if tuple(job[4:]) != (start_ordinal, end_ordinal, finish_date):
+            changed.append({'id': job_id, 'start_date': start_date, 'hour_offset': hour_offset,
+                            'duration_hours': duration_hours, 'start_ordinal': int(start_ordinal),
+                            'end_ordinal': int(end_ordinal), 'finish_date': finish_date})
+
+    update_job_positions_bulk(changed)
+    _job_positions_calendar_version = calendar_version
+    return len(changed)
+
+
+# Пересчет позиций работ в фоне после изменения календаря (серия изменений - один пересчет)
+job_positions_updater = DebouncedTask(recompute_job_positions, delay=1.0)
+
+
+def _on_data_change(tables: set):
+    if CALENDAR_TABLE in tables or '*' in tables:
+        job_positions_updater.schedule()
+
+
+add_data_change_listener(_on_data_change)
+
+
+def get_work_hours_for_date(date_str: str) -> int:
+    """Получает рабочие часы для даты из календаря"""
+    return calendar_index.work_hours(date_str)
 
 
 def ensure_working_day(date_str: str) -> str:
@@ -186,63 +295,136 @@ def ensure_working_day(date_str: str) -> str:
     Если указанная дата - выходной, возвращает первый рабочий день после нее.
     Если день рабочий, возвращает ту же дату.
     """
-
-    work_hours = get_work_hours_for_date(date_str)
+    snapshot = calendar_index.snapshot()
+    ordinal = to_ordinal(date_str)
 
     # Если день рабочий, возвращаем ту же дату
-    if work_hours > 0:
+    if snapshot.work_hours(ordinal) > 0:
         return date_str
 
-    # Если день выходной, ищем следующий рабочий день
-    current_date = datetime.fromisoformat(date_str).date()
+    return ordinal_to_iso(_ensure_working_ordinal(snapshot, ordinal))
+
+
+def _ensure_working_ordinal(snapshot, ordinal: int) -> int:
+    """Первый рабочий день начиная с указанного по таблице следующих рабочих дней (не дальше 30 дней)"""
     max_attempts = 30
+    return min(snapshot.first_working_day(ordinal), ordinal + max_attempts)
+
 
-    for attempt in range(max_attempts):
-        current_date += timedelta(days=1)
-        next_date_str = current_date.isoformat()
+class DailySchedule(Sequence):
+    """
+    Расписание работы по дням: последовательность кортежей (дата, часы, смещение).
 
-        work_hours = get_work_hours_for_date(next_date_str)
-        if work_hours > 0:
-            return next_date_str
+    Список дней строится только при переборе. Первый и последний элементы, а также
+    длина вычисляются сразу по накопленным суммам календаря.
+    """
 
-    return current_date.isoformat()
+    def __init__(self, snapshot, start_position, end_position, first_ordinal, finish_ordinal, first_offset):
+        self._snapshot = snapshot
+        self.start_position = start_position
+        self.end_position = end_position
+        self.first_ordinal = first_ordinal
+        self.finish_ordinal = finish_ordinal
+        self._first_offset = first_offset
+        self._days = None
+
+    def _day_entry(self, ordinal):
+        day_start = self._snapshot.position(ordinal)
+        day_end = day_start + self._snapshot.work_hours(ordinal)
+        hours = min(self.end_position, day_end) - max(self.start_position, day_start)
+        offset = self._first_offset if ordinal == self.first_ordinal else 0
+        return ordinal_to_iso(ordinal), hours, offset
+
+    def _materialize(self):
+        if self._days is None:
+            self._days = [
+                self._day_entry(ordinal)
+                for ordinal in range(self.first_ordinal, self.finish_ordinal + 1)
+                if self._snapshot.work_hours(ordinal) > 0
+            ]
+        return self._days
+
+    def __len__(self):
+        if self._days is not None:
+            return len(self._days)
+        return self._snapshot.working_days_between(self.first_ordinal, self.finish_ordinal)
+
+    def __getitem__(self, index):
+        if self._days is None and isinstance(index, int):
+            size = len(self)
+            if index in (0, -size):
+                return self._day_entry(self.first_ordinal)
+            if index in (-1, size - 1):
+                return self._day_entry(self.finish_ordinal)
+        return self._materialize()[index]
+
+    def __iter__(self):
+        return iter(self._materialize())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return f"DailySchedule({self._materialize()!r})"
 
 
 def calculate_finish_date(start_date, duration, offset):
     """
-    Рассчитывает дату окончания работы с учетом календаря рабочих часов
+    Рассчитывает дату окончания работы с учетом календаря рабочих часов.
+
+    Результаты кэшируются (finish_date_cache) по входным параметрам и версии календаря,
+    поэтому после изменения календаря кэш автоматически перестает использоваться.
+
+    Returns:
+        tuple: (дата окончания в формате ISO, DailySchedule с расписанием по дням)
     """
+    snapshot = calendar_index.snapshot()
     try:
-        start_date = datetime.fromisoformat(start_date).date()
-        remaining_hours = duration
-        current_date = start_date
-        daily_schedule = []
-        current_offset = offset
+        key = (start_date, float(duration), float(offset or 0), snapshot.version)
+    except (TypeError, ValueError):
+        return _calculate_finish_date(snapshot, start_date, duration, offset)
+
+    result = finish_date_cache.get(key)
+    if result is None:
+        result = _calculate_finish_date(snapshot, start_date, duration, offset)
+        finish_date_cache.put(key, result)
+    return result
 
-        # Распределяем часы работы по дням
-        first_day = True
-        while remaining_hours > 0:
-            date_str = current_date.isoformat()
-            work_hours = get_work_hours_for_date(date_str)
 
-            if work_hours > 0:  # Рабочий день
-                # Получаем текущую загрузку оборудования на этот день
-                available_hours = work_hours
+def _calculate_finish_date(snapshot, start_date, duration, offset):
+    """
+    Расчет окончания работы без кэша.
+
+    Начало работы переводится в абсолютную позицию в рабочих часах, а день окончания
+    находится двоичным поиском по накопленным суммам календаря.
+    """
+    try:
+        start_ordinal = to_ordinal(start_date)
+        offset = offset or 0
 
-                if first_day:
-                    available_hours -= current_offset
-                    first_day = False
+        if duration <= 0:
+            return ordinal_to_iso(start_ordinal), []
+        if offset < 0:
+            return _calculate_finish_date_by_days(snapshot, start_ordinal, duration, offset)
 
-                if available_hours > 0:
-                    hours_today = min(available_hours, remaining_hours)
-                    daily_schedule.append((date_str, hours_today, current_offset))
-                    remaining_hours -= hours_today
-                    current_offset = 0
+        # Работа начинается в первый рабочий день, смещение отсчитывается от его начала.
+        # Если смещение не помещается в этот день, работа начинается со следующего рабочего дня
+        first_ordinal = snapshot.first_working_day(start_ordinal)
+        if offset < snapshot.work_hours(first_ordinal):
+            start_position = snapshot.position(first_ordinal) + offset
+        else:
+            first_ordinal = snapshot.first_working_day(first_ordinal + 1)
+            start_position = snapshot.position(first_ordinal)
 
-            if remaining_hours > 0:
-                current_date += timedelta(days=1)
+        end_position = start_position + duration
+        # Убираем погрешность сложения, чтобы окончание ровно в конце дня не переносилось на следующий
+        if abs(end_position - round(end_position)) < 1e-9:
+            end_position = round(end_position)
 
-        return current_date.isoformat(), daily_schedule
+        finish_ordinal = snapshot.day_at_position(end_position)
+        daily_schedule = DailySchedule(snapshot, start_position, end_position, first_ordinal, finish_ordinal, offset)
+
+        return ordinal_to_iso(finish_ordinal), daily_schedule
 
     except Exception as e:
         print(f"Ошибка в calculate_finish_date: {e}")
@@ -253,55 +435,203 @@ def calculate_finish_date(start_date, duration, offset):
         return finish_dt.date().isoformat(), daily_schedule
 
 
-def get_equipment_total_work_hours(start_date, end_date, equipment_jobs, calendar_dict):
-    total_work_hours = 0
-    # Рассчитываем общее время работы оборудования в диапазоне
+def _calculate_finish_date_by_days(snapshot, start_ordinal, duration, offset):
+    """Пошаговый расчет окончания работы по дням (используется для отрицательного смещения)"""
+    remaining_hours = duration
+    current_ordinal = start_ordinal
+    daily_schedule = []
+    current_offset = offset
 
-    for _, job in equipment_jobs.iterrows():
-        hour_offset = float(job['hour_offset']) if not pd.isna(job['hour_offset']) else 0.0
-        duration_hours = float(job['duration_hours'])
-        start_dt = pd.to_datetime(job['start_date'])
+    # Распределяем часы работы по дням
+    first_day = True
+    while remaining_hours > 0:
+        work_hours = snapshot.work_hours(current_ordinal)
 
-        finish_date_str, daily_schedule = calculate_finish_date(
-            start_dt.isoformat(),
-            duration_hours,
-            hour_offset
-        )
+        if work_hours > 0:  # Рабочий день
+            available_hours = work_hours
+
+            if first_day:
+                available_hours -= current_offset
+                first_day = False
+
+            if available_hours > 0:
+                hours_today = min(available_hours, remaining_hours)
+                daily_schedule.append((ordinal_to_iso(current_ordinal), hours_today, current_offset))
+                remaining_hours -= hours_today
+                current_offset = 0
 
-        # ДОБАВЛЯЕМ ВЫХОДНЫЕ ДНИ В РАСПИСАНИЕ
-        extended_schedule = []
-        work_start_date = pd.to_datetime(job['start_date']).date()
-        work_finish_date = pd.to_datetime(finish_date_str).date()
+        if remaining_hours > 0:
+            current_ordinal += 1
+
+    return ordinal_to_iso(current_ordinal), daily_schedule
+
+
+# Порядковый номер дня 1970-01-01 (начало отсчета datetime64)
+UNIX_EPOCH_ORDINAL = 719163
+
+
+class ScheduleExpansion:
+    """
+    Результат пакетного расчета расписаний (expand_schedules) для набора работ.
+
+    Все поля - массивы numpy, выровненные по порядку строк исходного набора работ:
+        start_ordinal - день начала работы (как указан в работе)
+        first_ordinal - первый день, в который работа получает часы
+        finish_ordinal - день окончания работы
+        start_position, end_position - абсолютные позиции начала и конца в рабочих часах
+        finish_offset - время окончания в последний день (смещение + часы, как в calculate_finish_date)
+        valid - False для работ без длительности (у них нет расписания)
+    """
+
+    def __init__(self, snapshot, index, start_ordinal, first_ordinal, finish_ordinal, start_position,
+                 end_position, first_offset, finish_offset, valid):
+        self._snapshot = snapshot
+        self.index = index
+        self.start_ordinal = start_ordinal
+        self.first_ordinal = first_ordinal
+        self.finish_ordinal = finish_ordinal
+        self.start_position = start_position
+        self.end_position = end_position
+        self.first_offset = first_offset
+        self.finish_offset = finish_offset
+        self.valid = valid
+
+    def __len__(self):
+        return len(self.start_ordinal)
+
+    def rows(self, labels) -> np.ndarray:
+        """Номера строк для меток индекса исходного DataFrame"""
+        return self.index.get_indexer(labels)
+
+    def finish_date(self, row: int) -> str:
+        """Дата окончания работы в формате ISO"""
+        return ordinal_to_iso(int(self.finish_ordinal[row]))
+
+    def hours_in_range(self, first_date, last_date) -> np.ndarray:
+        """Рабочие часы каждой работы, попадающие в диапазон дат (включительно)"""
+        low = self._snapshot.position(to_ordinal(first_date))
+        high = self._snapshot.position(to_ordinal(last_date) + 1)
+        hours = np.clip(self.end_position, low, high) - np.clip(self.start_position, low, high)
+        return np.where(self.valid, hours, 0.0)
+
+    def daily_allocations(self, first_date, last_date) -> np.ndarray:
+        """Матрица (работы x дни) рабочих часов каждой работы по дням диапазона"""
+        days = np.arange(to_ordinal(first_date), to_ordinal(last_date) + 1)
+        day_starts = self._snapshot.position_many(days)
+        day_ends = day_starts + self._snapshot.work_hours_many(days)
+
+        allocations = (np.minimum(self.end_position[:, None], day_ends[None, :]) -
+                       np.maximum(self.start_position[:, None], day_starts[None, :]))
+        allocations = np.clip(allocations, 0, None)
+        return np.where(self.valid[:, None], allocations, 0.0)
+
+    def day_entries(self, row: int, first_date, last_date) -> list:
+        """
+        Расписание работы (дата, часы, смещение) в пределах диапазона дат, включая выходные
+        дни между началом и окончанием работы (с нулевыми часами).
+        """
+        if not self.valid[row]:
+            return []
+
+        snapshot = self._snapshot
+        start_position = self.start_position[row]
+        end_position = self.end_position[row]
+        first_ordinal = int(self.first_ordinal[row])
+        entries = []
+
+        for ordinal in range(max(int(self.start_ordinal[row]), to_ordinal(first_date)),
+                             min(int(self.finish_ordinal[row]), to_ordinal(last_date)) + 1):
+            work_hours = snapshot.work_hours(ordinal)
+            if work_hours == 0:
+                entries.append((ordinal_to_iso(ordinal), 0, 0))
+            elif ordinal >= first_ordinal:
+                day_start = snapshot.position(ordinal)
+                hours = min(end_position, day_start + work_hours) - max(start_position, day_start)
+                offset = self.first_offset[row] if ordinal == first_ordinal else 0
+                entries.append((ordinal_to_iso(ordinal), hours, offset))
+
+        return entries
+
+
+def expand_schedules(jobs) -> ScheduleExpansion:
+    """
+    Пакетно рассчитывает расписания для набора работ за один векторный проход по календарю.
+
+    Args:
+        jobs: DataFrame (или словарь массивов) с колонками start_date, hour_offset, duration_hours
+
+    Returns:
+        ScheduleExpansion: массивы дней окончания, позиций и смещений, выровненные по строкам jobs
+    """
+    snapshot = calendar_index.snapshot()
+    index = getattr(jobs, 'index', None)
+
+    if len(jobs) == 0:
+        empty_int, empty_float = np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+        return ScheduleExpansion(snapshot, pd.Index([]) if index is None else index, empty_int, empty_int,
+                                 empty_int, empty_float, empty_float, empty_float, empty_float,
+                                 np.empty(0, dtype=bool))
+
+    start_days = pd.to_datetime(pd.Series(np.asarray(jobs['start_date']))).values.astype('datetime64[D]')
+    start_ordinal = start_days.astype(np.int64) + UNIX_EPOCH_ORDINAL
+    offsets = np.nan_to_num(pd.to_numeric(pd.Series(np.asarray(jobs['hour_offset'])), errors='coerce')
+                            .to_numpy(dtype=float))
+    durations = np.nan_to_num(np.asarray(jobs['duration_hours'], dtype=float))
+
+    # Начало - первый рабочий день; если смещение не помещается в день, то следующий рабочий день
+    first_ordinal = snapshot.first_working_day_many(start_ordinal)
+    fits_first_day = offsets < snapshot.work_hours_many(first_ordinal)
+    first_ordinal = np.where(fits_first_day, first_ordinal, snapshot.first_working_day_many(first_ordinal + 1))
+    first_day_position = snapshot.position_many(first_ordinal)
+    start_position = first_day_position + np.where(fits_first_day, offsets, 0.0)
+
+    end_position = start_position + durations
+    rounded = np.round(end_position)
+    end_position = np.where(np.abs(end_position - rounded) < 1e-9, rounded, end_position)
+
+    finish_ordinal = snapshot.day_at_position_many(end_position)
+    # Смещение первого дня в расписании всегда равно исходному смещению (как в calculate_finish_date)
+    finish_offset = (end_position - snapshot.position_many(finish_ordinal) +
+                     np.where(finish_ordinal == first_ordinal, offsets - (start_position - first_day_position), 0.0))
+
+    valid = durations > 0
+    finish_ordinal = np.where(valid, finish_ordinal, start_ordinal)
+
+    expansion = ScheduleExpansion(snapshot, pd.RangeIndex(len(durations)) if index is None else index,
+                                  start_ordinal, first_ordinal, finish_ordinal, start_position, end_position,
+                                  offsets, finish_offset, valid)
+
+    # Отрицательные смещения считаются пошагово, как в calculate_finish_date
+    for row in np.flatnonzero(valid & (offsets < 0)):
+        finish_date, daily_schedule = _calculate_finish_date_by_days(
+            snapshot, int(start_ordinal[row]), durations[row], offsets[row]
+        )
+        last_day, last_hours, last_offset = daily_schedule[-1]
+        expansion.first_ordinal[row] = to_ordinal(daily_schedule[0][0])
+        expansion.finish_ordinal[row] = to_ordinal(finish_date)
+        expansion.start_position[row] = snapshot.position(expansion.first_ordinal[row])
+        expansion.end_position[row] = expansion.start_position[row] + durations[row]
+        expansion.finish_offset[row] = last_offset + last_hours
 
-        current_schedule_date = work_start_date
-        schedule_index = 0
+    return expansion
 
-        while current_schedule_date <= work_finish_date:
-            current_date_str = current_schedule_date.isoformat()
 
-            # Проверяем, есть ли этот день в оригинальном расписании
-            if schedule_index < len(daily_schedule) and daily_schedule[schedule_index][0] == current_date_str:
-                # День есть в расписании - добавляем как есть
-                extended_schedule.append(daily_schedule[schedule_index])
-                schedule_index += 1
-            else:
-                # Дня нет в расписании - проверяем является ли он выходным
-                work_hours = calendar_dict.get(current_date_str, 8)
-                if work_hours == 0:  # Выходной день
-                    extended_schedule.append((current_date_str, 0, 0))  # hours=0, offset=0
-                # else: рабочий день без работы - не добавляем
+def get_equipment_total_work_hours(start_date, end_date, equipment_jobs, calendar_dict, schedules=None):
+    """
+    Рассчитывает общее время работы оборудования в диапазоне дат.
 
-            current_schedule_date += timedelta(days=1)
+    Args:
+        schedules: готовый результат expand_schedules для набора работ, в который входят equipment_jobs
+                   (если не передан, расписания рассчитываются для equipment_jobs)
+    """
+    if len(equipment_jobs) == 0:
+        return 0
 
-        # Используем расширенное расписание с выходными
-        daily_schedule_with_weekends = extended_schedule
+    if schedules is None:
+        schedules = expand_schedules(equipment_jobs)
 
-        # Суммируем часы в диапазоне дат
-        for day_str, hours, offset in daily_schedule_with_weekends:
-            day_date = pd.to_datetime(day_str).date()
-            if start_date <= day_date <= end_date:
-                total_work_hours += hours
-    return total_work_hours
+    rows = schedules.rows(equipment_jobs.index)
+    return float(schedules.hours_in_range(start_date, end_date)[rows].sum())
 
 
 def get_order_quantity(order_id):
@@ -316,104 +646,44 @@ def get_order_quantity(order_id):
         return 0
 
 
+def get_order_quantities(order_ids) -> dict:
+    """Количества для нескольких заказов одним запросом: {id заказа: количество}"""
+    order_ids = {int(order_id) for order_id in order_ids}
+    quantities = dict.fromkeys(order_ids, 0)
+    if not order_ids:
+        return quantities
+    try:
+        with get_session() as session:
+            quantities.update(session.exec(select(Order.id, Order.quantity).where(Order.id.in_(order_ids))).all())
+    except Exception as e:
+        print(f"Ошибка получения количеств заказов: {e}")
+    return quantities
+
+
 def check_equipment_conflicts(equipment_id: int, job_id: int, start_date_str: str, hour_offset: float,
                               duration_hours: float) -> tuple[str, float]:
     """
     Проверяет конфликты на оборудовании и возвращает доступную дату старта.
     Если есть конфликты, находит следующую доступную дату.
-    """
-
-    def get_job_time_range_with_calendar(job_start: str, job_duration: float, job_offset: float) -> tuple[
-        datetime, datetime]:
-        """Рассчитывает временной диапазон работы с учетом календаря и оборудования"""
-
-        # Используем готовую функцию calculate_finish_date
-        finish_date, daily_schedule = calculate_finish_date(job_start, job_duration, job_offset)
-        # Начало работы с учетом смещения
-        start_dt = datetime.fromisoformat(job_start)
-        start_with_offset = start_dt + timedelta(hours=job_offset)
-
-        # Конец работы - дата из calculate_finish_date + время окончания в последний день
-        last_day_schedule = daily_schedule[-1] if daily_schedule else (finish_date, 0, 0)
-        last_day_date = datetime.fromisoformat(last_day_schedule[0])
-        last_day_hours = last_day_schedule[1]
-        last_day_offset = last_day_schedule[2] if len(last_day_schedule) > 2 else 0
-
-        # Время окончания в последний день
-        end_dt = last_day_date + timedelta(hours=last_day_offset + last_day_hours)
-
-        return start_with_offset, end_dt
-
-    def has_time_conflict(test_start_dt: datetime, test_end_dt: datetime, conflict_start_dt: datetime,
-                          conflict_end_dt: datetime) -> bool:
-        """Проверяет пересечение временных интервалов"""
-        return conflict_start_dt <= test_start_dt < conflict_end_dt or \
-            conflict_start_dt < test_end_dt <= conflict_end_dt or \
-            (test_start_dt <= conflict_start_dt and test_end_dt >= conflict_end_dt)
 
-    def get_existing_jobs(equipment_id: int, job_id: int = None) -> list[Job]:
-        """Получает все работы на оборудовании (кроме текущей)"""
-        statement = select(Job).where(
-            Job.equipment_id == equipment_id,
-            Job.status.in_(['planned', 'started'])
-        )
-        if job_id:
-            statement = statement.where(Job.id != job_id)
-        statement = statement.order_by(Job.start_date)
-
-        with get_session() as session:
-            existing_jobs = session.exec(statement).all()
-            return existing_jobs
-
-    # Начинаем с исходной даты
-    current_date = start_date_str
-    current_offset = hour_offset
-    max_iterations = 100  # Защита от бесконечного цикла
-
-    for iteration in range(max_iterations):
-        # Корректируем дату и смещение с учетом рабочих часов
-        adjusted_date, adjusted_offset = adjust_date_for_work_hours(current_date, current_offset)
-
-        # Получаем временной диапазон для проверяемой работы с учетом календаря
-        test_start_dt, test_end_dt = get_job_time_range_with_calendar(
-            adjusted_date, duration_hours, adjusted_offset
-        )
-        # Получаем все работы на оборудовании (кроме текущей)
-        existing_jobs = get_existing_jobs(equipment_id, job_id)
-        has_conflict = False
-
-        for job in existing_jobs:
-
-            job_db_id = job.id
-            job_start = job.start_date
-            job_duration = job.duration_hours
-            job_offset = job.hour_offset or 0
-            job_locked = job.is_locked
-
-            # Получаем временной диапазон существующей работы с учетом календаря
-            conflict_start_dt, conflict_end_dt = get_job_time_range_with_calendar(
-                job_start, job_duration, job_offset
-            )
-
-            # Проверяем конфликт
-            if has_time_conflict(test_start_dt, test_end_dt, conflict_start_dt, conflict_end_dt):
-                has_conflict = True
-
-                # Начинаем после окончания конфликтующей работы + 0.25 часа
-                new_start_dt = conflict_end_dt + timedelta(hours=0.25)
+    Работы сравниваются как интервалы в абсолютных рабочих часах по индексу интервалов
+    оборудования. При конфликте старт переносится на окончание конфликтующей работы + CONFLICT_GAP.
+    """
+    # Корректируем дату и смещение с учетом рабочих часов
+    adjusted_date, adjusted_offset = adjust_date_for_work_hours(start_date_str, hour_offset)
 
-                # Обновляем текущую дату и смещение
-                current_date = new_start_dt.date().isoformat()
-                current_offset = new_start_dt.hour + new_start_dt.minute / 60.0
-                break
+    snapshot = calendar_index.snapshot()
+    start_position = snapshot.start_position(to_ordinal(adjusted_date), adjusted_offset)
+    available_position = job_interval_index.first_free_slot(
+        equipment_id, start_position, duration_hours, gap=CONFLICT_GAP, exclude_job_id=job_id
+    )
 
-        # Если конфликтов нет, возвращаем текущую дату
-        if not has_conflict:
-            return adjusted_date, adjusted_offset
+    # Если конфликтов нет, возвращаем скорректированную дату
+    if available_position == start_position:
+        return adjusted_date, adjusted_offset
 
-        # Если прошли все итерации, возвращаем последнюю проверенную дату
-        if iteration == max_iterations - 1:
-            return adjusted_date, adjusted_offset
+    available_ordinal, available_offset = snapshot.day_at_start_position(available_position)
+    return ordinal_to_iso(available_ordinal), available_offset
 
 
 def get_adjacent_jobs(conn, job_id):
@@ -589,14 +859,10 @@ def get_work_hours_between_dates(start_date, start_offset, finish_date, finish_o
         hours_in_finish_day = effective_finish
         total_hours += hours_in_finish_day
 
-    # Обрабатываем полные дни между начальным и конечным
-    current_date = start_dt + timedelta(days=1)
-    while current_date.date() < finish_dt.date():
-        date_str = current_date.strftime('%Y-%m-%d')
-        day_hours = get_work_hours_for_date(date_str)
-        if day_hours > 0:  # Только рабочие дни
-            total_hours += day_hours
-        current_date += timedelta(days=1)
+    # Обрабатываем полные дни между начальным и конечным (по накопленным суммам календаря)
+    total_hours += calendar_index.snapshot().hours_between(
+        start_dt.date().toordinal() + 1, finish_dt.date().toordinal() - 1
+    )
 
     return total_hours
 
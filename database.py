@@ -1,6 +1,10 @@
 from sqlmodel import create_engine, Session, select
+from sqlalchemy import event, update, bindparam, inspect
 from models import *
 import os
+import threading
+from collections import defaultdict
+from itertools import chain
 import zipfile
 import shutil
 from datetime import datetime
@@ -30,6 +34,7 @@ def create_db_and_tables():
 
         # Создаем таблицы в правильном порядке
         SQLModel.metadata.create_all(engine)
+        upgrade_schema()
         print("✅ Все таблицы созданы успешно")
 
         # Инициализируем начальные данные
@@ -40,6 +45,31 @@ def create_db_and_tables():
         raise
 
 
+def upgrade_schema():
+    """Добавляет в существующую таблицу работ колонки и индексы, появившиеся в модели Job"""
+    table = Job.__table__
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        return
+
+    existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+    existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+    preparer = engine.dialect.identifier_preparer
+
+    with engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(engine.dialect)
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                )
+                print(f"✅ Добавлена колонка {table.name}.{column.name}")
+
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+
+
 def init_default_data():
     """Инициализирует начальные данные"""
     with get_session() as session:
@@ -65,6 +95,76 @@ def get_session():
     return Session(engine)
 
 
+# Версии данных по таблицам. Увеличиваются после каждой фиксации изменений в таблице
+# и используются для инвалидации кэшей и индексов, построенных по данным БД.
+# Ключ '*' - изменение всей базы (например, восстановление из бэкапа).
+_data_versions = defaultdict(int)
+_data_versions_lock = threading.Lock()
+# Обработчики, вызываемые после изменения версий (см. add_data_change_listener)
+_data_change_listeners = []
+
+
+def get_data_version(*tables) -> int:
+    """Возвращает версию данных указанных таблиц (без аргументов - всей базы)"""
+    if not tables:
+        return sum(_data_versions.values())
+    return sum(_data_versions[table] for table in tables) + _data_versions['*']
+
+
+def bump_data_version(*tables):
+    """Увеличивает версию данных указанных таблиц (без аргументов - всей базы)"""
+    tables = set(tables or ('*',))
+    with _data_versions_lock:
+        for table in tables:
+            _data_versions[table] += 1
+
+    for listener in _data_change_listeners:
+        try:
+            listener(tables)
+        except Exception as e:
+            print(f"Ошибка обработчика изменения данных: {e}")
+
+
+def add_data_change_listener(listener):
+    """
+    Регистрирует функцию, вызываемую после каждой фиксации изменений
+    с множеством измененных таблиц ('*' - изменилась вся база)
+    """
+    _data_change_listeners.append(listener)
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+    """Запоминает таблицы, измененные через ORM в текущей транзакции"""
+    changed_tables = session.info.setdefault('changed_tables', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table_name = getattr(type(obj), '__tablename__', None)
+        if table_name:
+            changed_tables.add(table_name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_statements(orm_execute_state):
+    """Запоминает таблицы, измененные массовыми INSERT/UPDATE/DELETE"""
+    statement = orm_execute_state.statement
+    if statement.is_dml:
+        table = getattr(statement, 'table', None)
+        if table is not None:
+            orm_execute_state.session.info.setdefault('changed_tables', set()).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed_tables(session):
+    changed_tables = session.info.pop('changed_tables', None)
+    if changed_tables:
+        bump_data_version(*changed_tables)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_tables(session):
+    session.info.pop('changed_tables', None)
+
+
 # Функции для работы с заказами
 def get_all_orders():
     with get_session() as session:
@@ -117,9 +217,17 @@ def get_all_jobs_with_details():
         return jobs_with_details
 
 
+def _set_job_positions(job):
+    """Заполняет рассчитываемые по календарю позиции работы"""
+    from components.worktime_functions import get_job_positions
+    for key, value in get_job_positions(job.start_date, job.hour_offset, job.duration_hours).items():
+        setattr(job, key, value)
+
+
 def create_job(job_data):
     with get_session() as session:
         job = Job(**job_data)
+        _set_job_positions(job)
         session.add(job)
         session.commit()
         session.refresh(job)
@@ -132,12 +240,48 @@ def update_job(job_id, update_data):
         if job:
             for key, value in update_data.items():
                 setattr(job, key, value)
+            _set_job_positions(job)
             session.commit()
             session.refresh(job)
             return job
         return None
 
 
+def update_jobs_bulk(updates: list[dict]):
+    """Обновляет несколько работ одним пакетным UPDATE (словари с ключом id и одинаковым набором полей)"""
+    if not updates:
+        return
+    with get_session() as session:
+        session.exec(update(Job), params=updates)
+        session.commit()
+
+
+def update_job_positions_bulk(positions: list[dict]):
+    """
+    Записывает пересчитанные позиции работ одним пакетным UPDATE.
+
+    Каждый словарь содержит id, start_date, hour_offset, duration_hours, по которым
+    выполнен расчет, и start_ordinal, end_ordinal, finish_date. Работа, измененная
+    после расчета, не обновляется.
+    """
+    if not positions:
+        return
+    table = Job.__table__
+    statement = update(table).where(
+        table.c.id == bindparam('b_id'),
+        table.c.start_date == bindparam('b_start_date'),
+        table.c.hour_offset.is_not_distinct_from(bindparam('b_hour_offset')),
+        table.c.duration_hours.is_not_distinct_from(bindparam('b_duration_hours'))
+    ).values(
+        start_ordinal=bindparam('b_start_ordinal'),
+        end_ordinal=bindparam('b_end_ordinal'),
+        finish_date=bindparam('b_finish_date')
+    )
+    with get_session() as session:
+        session.exec(statement, params=[{f'b_{key}': value for key, value in item.items()} for item in positions])
+        session.commit()
+
+
 def delete_job(job_id):
     with get_session() as session:
         job = session.get(Job, job_id)
@@ -153,6 +297,19 @@ def get_job_by_id(job_id):
         return session.get(Job, job_id)
 
 
+def _job_positions_usable(session, job) -> bool:
+    """
+    Можно ли искать соседей работы по сохраненным позициям: позиции пересчитаны по текущему
+    календарю и не убывают вместе с (датой, смещением) - для этого на оборудовании нет работ
+    с отрицательным смещением
+    """
+    from components.worktime_functions import job_positions_are_current
+    if job.start_ordinal is None or not job_positions_are_current():
+        return False
+    negative_offset = select(Job.id).where(Job.equipment_id == job.equipment_id, Job.hour_offset < 0).limit(1)
+    return session.exec(negative_offset).first() is None
+
+
 def get_previous_job_by_id(job_id):
     with get_session() as session:
 
@@ -173,8 +330,15 @@ def get_previous_job_by_id(job_id):
                             (Job.hour_offset < current_offset)
                     )
             )
-        ).order_by(Job.start_date.desc(), Job.hour_offset.desc()).limit(1)
-        return session.exec(statement).first()
+        )
+        if _job_positions_usable(session, current_job):
+            # Позиция начала не убывает вместе с (датой, смещением): поиск идет по индексу
+            # (equipment_id, start_ordinal) от позиции текущей работы назад
+            statement = statement.where(Job.start_ordinal <= current_job.start_ordinal).order_by(
+                Job.start_ordinal.desc(), Job.start_date.desc(), Job.hour_offset.desc())
+        else:
+            statement = statement.order_by(Job.start_date.desc(), Job.hour_offset.desc())
+        return session.exec(statement.limit(1)).first()
 
 
 def get_next_job_by_id(job_id):
@@ -186,7 +350,7 @@ def get_next_job_by_id(job_id):
         current_start_date = current_job.start_date
         current_offset = current_job.hour_offset or 0
 
-        # Находим предыдущую работу
+        # Находим следующую работу
         statement = select(Job).where(
             Job.equipment_id == equipment_id,
             Job.id != job_id,
@@ -197,8 +361,14 @@ def get_next_job_by_id(job_id):
                             (Job.hour_offset > current_offset)
                     )
             )
-        ).order_by(Job.start_date, Job.hour_offset).limit(1)
-        return session.exec(statement).first()
+        )
+        if _job_positions_usable(session, current_job):
+            # Поиск по индексу (equipment_id, start_ordinal) от позиции текущей работы вперед
+            statement = statement.where(Job.start_ordinal >= current_job.start_ordinal).order_by(
+                Job.start_ordinal, Job.start_date, Job.hour_offset)
+        else:
+            statement = statement.order_by(Job.start_date, Job.hour_offset)
+        return session.exec(statement.limit(1)).first()
 
 
 # Функции для работы с оборудованием
@@ -377,6 +547,12 @@ def restore_backup(backup_file_path):
         if os.path.exists("production.db.backup"):
             os.remove("production.db.backup")
 
+        # Бэкап мог быть создан до появления новых колонок
+        upgrade_schema()
+
+        # Все данные изменились - сбрасываем кэши и индексы
+        bump_data_version()
+
         return True
     except Exception as e:
         # Восстанавливаем из backup если что-то пошло не так
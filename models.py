@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index
 from typing import Optional, List
 from datetime import date, datetime
 from typing import TYPE_CHECKING
@@ -46,10 +47,19 @@ class Job(SQLModel, table=True):
     start_date: str  # ISO format date string
     status: str = Field(default="planned")  # planned, started, completed
     is_locked: bool = Field(default=False)
+    # Абсолютные позиции начала и окончания в четвертях рабочего часа и дата окончания,
+    # рассчитываются по календарю при сохранении работы
+    start_ordinal: Optional[int] = None
+    end_ordinal: Optional[int] = None
+    finish_date: Optional[str] = None  # ISO format date string
 
     order: Order = Relationship(back_populates="jobs")
     equipment: Equipment = Relationship(back_populates="jobs")
 
+    __table_args__ = (
+        Index("ix_job_equipment_id_start_ordinal", "equipment_id", "start_ordinal"),
+    )
+
 
 class Calendar(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
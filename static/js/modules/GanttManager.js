@@ -544,7 +544,9 @@ export default class GanttManager {
             row_height: settings.rowHeight || this.ganttSettings.rowHeight,
             job_height_ratio: settings.jobHeightRatio || this.ganttSettings.jobHeightRatio,
             equipment_filter: settings.equipmentFilter || this.ganttSettings.equipmentFilter,
-            is_dark: this.app.isDark
+            is_dark: this.app.isDark,
+            // Координаты работ в целых пикселях: клик определяется с той же точностью, ответ меньше
+            jobs_format: 'quantized'
         };
 
         // Отправляем запрос на генерацию изображения
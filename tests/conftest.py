@@ -0,0 +1,79 @@
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# БД (sqlite:///production.db) и шрифты (./fonts) ищутся относительно текущего каталога:
+# тесты работают во временном каталоге со ссылкой на шрифты и не трогают рабочую БД
+os.environ.pop('SUPABASE_DB_URL', None)
+os.environ['GANTT_PRERENDER'] = 'false'
+WORK_DIR = Path(tempfile.mkdtemp(prefix='procalendar-tests-'))
+(WORK_DIR / 'fonts').symlink_to(ROOT / 'fonts')
+os.chdir(WORK_DIR)
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+
+# Начало календаря и первой работы тестового плана
+PLAN_START = date(2025, 6, 1)
+PLAN_JOBS_START = date(2025, 9, 1)
+
+
+def random_calendar(rng: random.Random, start: date, days: int) -> dict:
+    """
+    Календарь {дата ISO: часы}: выходные (обычно нерабочие), праздники, сокращенные и удлиненные дни.
+    Дни, которых нет в словаре, считаются рабочими по 8 часов.
+    """
+    calendar = {}
+    for i in range(days):
+        day = start + timedelta(days=i)
+        r = rng.random()
+        if day.weekday() >= 5 and r < 0.8:
+            calendar[day.isoformat()] = 0
+        elif r < 0.15:
+            calendar[day.isoformat()] = rng.choice([0, 0, 4, 6, 8, 12, 24])
+    return calendar
+
+
+@pytest.fixture(scope='session')
+def seeded_plan():
+    """
+    БД с фиксированным планом: календарь, 12 единиц оборудования трех типов (часть скрыта
+    с диаграммы), 40 заказов и 300 работ со смещениями, статусами и закреплением
+    """
+    import database as db
+    from models import Calendar, Equipment, EquipmentType, Job, Order
+
+    db.create_db_and_tables()
+    rng = random.Random(7)
+    with db.get_session() as session:
+        session.add_all(Calendar(date=day, work_hours=work_hours)
+                        for day, work_hours in random_calendar(rng, PLAN_START, 500).items())
+        types = [EquipmentType(name=f"Тип {i}", sort_order=i, color=rng.choice(['#FF0000', '#00AA00', '#3355FF']))
+                 for i in range(3)]
+        session.add_all(types)
+        session.commit()
+        equipment = [Equipment(name=f"Станок {i}", sort_order=i, show_on_chart=i % 5 != 4, type_id=types[i % 3].id)
+                     for i in range(12)]
+        orders = [Order(name=f"Заказ номер {i}", color=rng.choice(['#FF8800', '#0088FF', '#22CC22', '#FFFFFF']),
+                        quantity=rng.randint(0, 500), priority_order=i) for i in range(40)]
+        session.add_all(equipment + orders)
+        session.commit()
+        for unit in equipment:
+            day = PLAN_JOBS_START + timedelta(days=rng.randint(0, 10))
+            for _ in range(25):
+                session.add(Job(order_id=rng.choice(orders).id, equipment_id=unit.id,
+                                duration_hours=rng.choice([2, 4, 8, 12, 20, 40, 3.5]),
+                                hour_offset=rng.choice([0, 0, 2, 4.5]), start_date=day.isoformat(),
+                                status=rng.choice(['planned', 'planned', 'started', 'completed']),
+                                is_locked=rng.random() < 0.1))
+                day += timedelta(days=rng.randint(0, 3))
+        session.commit()
+    return db
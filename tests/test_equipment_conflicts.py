@@ -0,0 +1,151 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import PLAN_JOBS_START
+
+# Начало отсчета рабочих часов для проверки (раньше календаря тестового плана)
+ORIGIN = date(2025, 1, 1)
+GAP = 0.25
+
+
+class WorkingHours:
+    """Рабочие часы тестового плана, отсчитываемые перебором дней от ORIGIN (независимо от calendar_index)"""
+
+    def __init__(self, calendar: dict):
+        self.calendar = calendar
+        self.days = [ORIGIN + timedelta(days=i) for i in range(1500)]
+        self.starts = {}
+        position = 0
+        for day in self.days:
+            self.starts[day] = position
+            position += self.hours(day)
+
+    def hours(self, day: date) -> float:
+        return self.calendar.get(day.isoformat(), 8)
+
+    def next_working_day(self, day: date) -> date:
+        day += timedelta(days=1)
+        while self.hours(day) == 0:
+            day += timedelta(days=1)
+        return day
+
+    def first_working_day(self, day: date) -> date:
+        return day if self.hours(day) > 0 else self.next_working_day(day)
+
+    def schedule_start(self, day: date, offset: float) -> float:
+        """Начало расписания работы: смещение, не помещающееся в первый рабочий день, - начало следующего"""
+        day = self.first_working_day(day)
+        return self.starts[day] + offset if offset < self.hours(day) else self.starts[self.next_working_day(day)]
+
+    def job_interval(self, job) -> tuple[float, float]:
+        day = date.fromisoformat(job.start_date)
+        offset = job.hour_offset or 0
+        return (self.starts[day] + min(offset, self.hours(day)),
+                self.schedule_start(day, offset) + job.duration_hours)
+
+    def day_at(self, position: float) -> tuple[str, float]:
+        """Рабочий день, в котором начинается работа с позиции position, и смещение в нем"""
+        for day in self.days:
+            if self.hours(day) > 0 and self.starts[day] <= position < self.starts[day] + self.hours(day):
+                return day.isoformat(), position - self.starts[day]
+        raise AssertionError(position)
+
+
+def expected_available_start(hours: WorkingHours, intervals, start_date: str, offset: float, duration: float):
+    """
+    Ожидаемый результат check_equipment_conflicts и был ли старт перенесен: работы - интервалы
+    [начало, конец) в рабочих часах, при пересечении старт переносится на конец первой по началу
+    пересекающейся работы + GAP
+    """
+    day = date.fromisoformat(start_date)
+    if hours.hours(day) == 0:
+        day, offset = hours.next_working_day(day), 0
+    elif offset >= hours.hours(day):
+        day, offset = hours.next_working_day(day), offset - hours.hours(day)
+
+    start = position = hours.schedule_start(day, offset)
+    while True:
+        overlapping = [(job_start, job_end) for job_start, job_end in intervals
+                       if job_start < position + duration and job_end > position]
+        if not overlapping:
+            break
+        position = min(overlapping)[1] + GAP
+    if position == start:
+        return day.isoformat(), offset, False
+    return *hours.day_at(position), True
+
+
+@pytest.fixture(scope='module')
+def plan(seeded_plan):
+    from models import Calendar, Job
+    from sqlmodel import select
+
+    with seeded_plan.get_session() as session:
+        calendar = {record.date: record.work_hours for record in session.exec(select(Calendar)).all()}
+        jobs = session.exec(select(Job).where(Job.status.in_(['planned', 'started']))).all()
+    return WorkingHours(calendar), jobs
+
+
+def test_conflicts_in_working_hours(plan):
+    from components.worktime_functions import check_equipment_conflicts
+
+    hours, jobs = plan
+    rng = random.Random(21)
+    short_days = 0
+    for _ in range(600):
+        job = rng.choice(jobs)
+        start_date = (PLAN_JOBS_START + timedelta(days=rng.randint(-3, 80))).isoformat()
+        offset = rng.choice([0, 0, 1.5, 2, 3.75, 4, 6, 7.75])
+        duration = rng.choice([0.5, 2, 4, 8, 12, 30])
+        intervals = [hours.job_interval(other) for other in jobs
+                     if other.equipment_id == job.equipment_id and other.id != job.id]
+
+        expected_date, expected_offset, moved = expected_available_start(hours, intervals, start_date, offset,
+                                                                         duration)
+        available_date, available_offset = check_equipment_conflicts(job.equipment_id, job.id, start_date, offset,
+                                                                     duration)
+        assert available_date == expected_date
+        assert available_offset == pytest.approx(expected_offset, abs=1e-9)
+
+        if moved:
+            # Перенесенный старт всегда внутри рабочего дня, в том числе сокращенного
+            # (прежний расчет по часам суток давал, например, смещение 9.25 в 4-часовом дне)
+            day_hours = hours.hours(date.fromisoformat(available_date))
+            assert 0 <= available_offset < day_hours
+            short_days += day_hours < 8
+    assert short_days
+
+
+def test_cascade_uses_working_hours(plan, monkeypatch):
+    from components import worktime_functions
+
+    hours, jobs = plan
+    # Сдвиги проверяются без записи в БД
+    writes = []
+    monkeypatch.setattr(worktime_functions, 'update_jobs_bulk', writes.append)
+    rng = random.Random(22)
+    moved_total = short_days = 0
+    for _ in range(200):
+        job = rng.choice(jobs)
+        start_date = (PLAN_JOBS_START + timedelta(days=rng.randint(-3, 60))).isoformat()
+        offset = rng.choice([0, 1.5, 2, 3.75, 6])
+        duration = rng.choice([2, 8, 12, 30])
+        moved = worktime_functions.reschedule_following_jobs(start_date, offset, duration, job.equipment_id, job.id)
+        assert [update['id'] for update in writes.pop()] == [moved_job['id'] for moved_job in moved]
+
+        # Каждая сдвинутая работа начинается через GAP рабочих часов после окончания предыдущей,
+        # в том же месте, которое приняла бы проверка конфликтов
+        day = date.fromisoformat(start_date)
+        next_position = hours.schedule_start(day, offset) + duration + GAP
+        for moved_job in moved:
+            old_start, _ = hours.job_interval(next(other for other in jobs if other.id == moved_job['id']))
+            assert old_start < next_position
+            new_date, new_offset = hours.day_at(next_position)
+            assert moved_job['new_start_date'] == new_date
+            assert moved_job['new_hour_offset'] == pytest.approx(new_offset, abs=1e-9)
+            short_days += hours.hours(date.fromisoformat(new_date)) < 8
+            next_position += moved_job['duration_hours'] + GAP
+        moved_total += len(moved)
+    assert moved_total and short_days
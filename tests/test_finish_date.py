@@ -0,0 +1,84 @@
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from components.calendar_index import CalendarSnapshot, to_ordinal
+from components.worktime_functions import _calculate_finish_date
+from conftest import random_calendar
+
+
+def calculate_finish_date_by_walk(calendar: dict, start_date, duration, offset):
+    """Прежний расчет окончания работы: перебор дней от даты начала (часы дня - из calendar, по умолчанию 8)"""
+    remaining_hours = duration
+    current_date = datetime.fromisoformat(start_date).date()
+    daily_schedule = []
+    current_offset = offset
+
+    first_day = True
+    while remaining_hours > 0:
+        date_str = current_date.isoformat()
+        work_hours = calendar.get(date_str, 8)
+
+        if work_hours > 0:
+            available_hours = work_hours
+
+            if first_day:
+                available_hours -= current_offset
+                first_day = False
+
+            if available_hours > 0:
+                hours_today = min(available_hours, remaining_hours)
+                daily_schedule.append((date_str, hours_today, current_offset))
+                remaining_hours -= hours_today
+                current_offset = 0
+
+        if remaining_hours > 0:
+            current_date += timedelta(days=1)
+
+    return current_date.isoformat(), daily_schedule
+
+
+def assert_same_schedule(expected, actual):
+    expected_finish, expected_days = expected
+    actual_finish, actual_days = actual
+    assert actual_finish == expected_finish
+    assert len(actual_days) == len(expected_days)
+    assert [day for day, _, _ in actual_days] == [day for day, _, _ in expected_days]
+    assert [hours for _, hours, _ in actual_days] == pytest.approx([hours for _, hours, _ in expected_days], abs=1e-6)
+    assert [offset for _, _, offset in actual_days] == pytest.approx([offset for _, _, offset in expected_days])
+    if expected_days:
+        # Последний день берется без построения всего списка
+        assert actual_days[-1][0] == expected_days[-1][0]
+        assert actual_days[-1][1] == pytest.approx(expected_days[-1][1], abs=1e-6)
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_finish_date_matches_day_by_day_walk(seed):
+    rng = random.Random(seed)
+    calendar_start = date(2025, 1, 1) + timedelta(days=seed * 17)
+    calendar = random_calendar(rng, calendar_start, 300 + seed * 50)
+    snapshot = CalendarSnapshot({to_ordinal(day): work_hours for day, work_hours in calendar.items()})
+
+    for _ in range(1000):
+        # Начало и окончание бывают и за пределами календаря (там дни по 8 часов)
+        start_date = (calendar_start - timedelta(days=30) + timedelta(days=rng.randint(0, 420))).isoformat()
+        duration = rng.choice([0.25, 1, 3.5, 8, 12, 16, 40, 100, 500, rng.uniform(0, 300)])
+        offset = rng.choice([0, 0, 0.25, 2, 4.5, 7.75, 8, 10, 12.5, rng.uniform(0, 9)])
+        assert_same_schedule(calculate_finish_date_by_walk(calendar, start_date, duration, offset),
+                             _calculate_finish_date(snapshot, start_date, duration, offset))
+
+
+@pytest.mark.parametrize('start_date, duration, offset', [
+    ('2025-03-01', 8, 0),      # выходной: работа переносится на понедельник
+    ('2025-03-03', 4, 6),      # смещение больше сокращенного дня: начало на следующий рабочий день
+    ('2025-03-03', 2, 2),      # работа целиком в сокращенном дне
+    ('2025-03-05', 16, 0),     # через праздник
+    ('2025-03-05', 12, 0),     # ровно до конца удлиненного дня: окончание не переносится
+    ('2025-03-05', 0, 0),      # нулевая длительность
+])
+def test_finish_date_edge_cases(start_date, duration, offset):
+    calendar = {'2025-03-01': 0, '2025-03-02': 0, '2025-03-03': 4, '2025-03-05': 12, '2025-03-06': 0}
+    snapshot = CalendarSnapshot({to_ordinal(day): work_hours for day, work_hours in calendar.items()})
+    expected = calculate_finish_date_by_walk(calendar, start_date, duration, offset)
+    assert_same_schedule(expected, _calculate_finish_date(snapshot, start_date, duration, offset))
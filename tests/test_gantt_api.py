@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+import pytest
+
+from conftest import PLAN_JOBS_START
+
+
+@pytest.fixture(scope='module')
+def client(seeded_plan):
+    from app import app
+    from components.worktime_functions import recompute_job_positions
+
+    # Позиции пересчитываются заранее: фоновый пересчет не меняет версию данных между запросами
+    recompute_job_positions()
+    return app.test_client()
+
+
+def test_hit_data_survives_cache_eviction_on_not_modified(client):
+    from app import gantt_hit_cache, gantt_image_cache, gantt_jobs_cache
+
+    request = {'view_mode': 'week', 'start_date': PLAN_JOBS_START.isoformat(), 'format': 'json'}
+    response = client.post('/api/gantt/image', json=request)
+    assert response.status_code == 200
+    render_id = response.json['render_id']
+    jobs = response.json['jobs']
+    assert jobs
+    box = jobs[0]['coordinates']
+    point = {'x': (box['x1'] + box['x2']) / 2, 'y': (box['y1'] + box['y2']) / 2}
+
+    for clear_image_cache in (False, True):
+        # Работы изображения вытеснены из кэша, а само изображение есть у клиента
+        gantt_jobs_cache.clear()
+        gantt_hit_cache.clear()
+        if clear_image_cache:
+            gantt_image_cache.clear()
+        response = client.post('/api/gantt/image', json=request, headers={'If-None-Match': f'"{render_id}"'})
+        assert response.status_code == 304
+
+        hit = client.get('/api/gantt/hit', query_string={'render_id': render_id, **point})
+        assert hit.status_code == 200
+        assert hit.json['job']['id'] == jobs[0]['id']
+        compact = client.get(f'/api/gantt/jobs/{render_id}')
+        assert compact.status_code == 200
+        assert [row[0] for row in compact.json['jobs']] == [job['id'] for job in jobs]
+
+
+def test_image_cache_is_bounded_by_size(client, monkeypatch):
+    from app import gantt_chart_weight, gantt_image_cache
+
+    gantt_image_cache.clear()
+    for day in range(3):
+        request = {'view_mode': 'month', 'start_date': (PLAN_JOBS_START + timedelta(days=day)).isoformat(),
+                   'format': 'json'}
+        assert client.post('/api/gantt/image', json=request).status_code == 200
+    charts = list(gantt_image_cache._data.values())
+    assert len(charts) == 3
+    assert gantt_image_cache.weight == sum(gantt_chart_weight(chart) for chart in charts)
+
+    # Лимит объема меньше двух ответов: в кэше остается только последний
+    monkeypatch.setattr(gantt_image_cache, 'max_weight', max(gantt_chart_weight(chart) for chart in charts) * 3 // 2)
+    request['start_date'] = (PLAN_JOBS_START + timedelta(days=3)).isoformat()
+    assert client.post('/api/gantt/image', json=request).status_code == 200
+    assert len(gantt_image_cache) == 1
+
+
+def test_check_conflicts_returns_moved_jobs(client, seeded_plan, monkeypatch):
+    from components import worktime_functions
+    from models import Job
+    from sqlmodel import select
+
+    # Сдвиги проверяются без записи в БД: тестовый план общий для всех тестов
+    writes = []
+    monkeypatch.setattr(worktime_functions, 'update_jobs_bulk', writes.append)
+    with seeded_plan.get_session() as session:
+        jobs = session.exec(select(Job).where(Job.equipment_id == 1, Job.status.in_(['planned', 'started']))
+                            .order_by(Job.start_date, Job.hour_offset)).all()
+
+    # Работа ставится на место первой активной работы оборудования: следующие за ней сдвигаются
+    request = {'equipment_id': 1, 'start_date': jobs[0].start_date, 'hour_offset': jobs[0].hour_offset or 0,
+               'duration_hours': 40, 'job_id': None}
+    checked = client.post('/api/jobs/check-conflicts', json=request).json
+    assert checked['has_conflicts'] and 'moved_jobs' not in checked
+    assert writes == []
+
+    fixed = client.post('/api/jobs/check-conflicts', json={**request, 'only_check': False}).json
+    assert fixed['success'] and fixed['moved_jobs']
+    assert [job['id'] for job in fixed['moved_jobs']] == [update['id'] for update in writes[0]]
+    assert set(fixed['moved_jobs'][0]) == {'id', 'old_start_date', 'old_hour_offset', 'new_start_date',
+                                           'new_hour_offset', 'duration_hours'}
@@ -0,0 +1,48 @@
+import random
+
+from components.hit_index import JobHitIndex, quantize_jobs
+
+
+def random_jobs(rng: random.Random, count: int) -> list:
+    """Работы с дробными координатами блоков, часть блоков перекрывается и касается друг друга"""
+    jobs = []
+    for job_id in range(count):
+        x1, y1 = rng.uniform(0, 900), rng.choice([10, 70, 130, 190]) + rng.uniform(0, 2)
+        width = rng.choice([0.3, 0.5, 1, 2.5, 10, rng.uniform(0, 300)])
+        jobs.append({'id': job_id, 'coordinates': {'x1': x1, 'y1': y1, 'x2': x1 + width, 'y2': y1 + 40.5}})
+    return jobs
+
+
+def find_by_scan(jobs, x, y):
+    for job in jobs:
+        box = job['coordinates']
+        if box['x1'] <= x <= box['x2'] and box['y1'] <= y <= box['y2']:
+            return job
+    return None
+
+
+def test_find_matches_scan():
+    rng = random.Random(11)
+    jobs = random_jobs(rng, 300)
+    index = JobHitIndex(jobs, cell_size=32)
+    for _ in range(5000):
+        x, y = rng.uniform(-10, 1300), rng.uniform(-10, 260)
+        assert index.find(x, y) is find_by_scan(jobs, x, y)
+
+
+def test_quantized_blocks_do_not_grow():
+    rng = random.Random(12)
+    jobs = random_jobs(rng, 300)
+    for job, quantized in zip(jobs, quantize_jobs(jobs)):
+        box = job['coordinates']
+        # Целые точки округленного блока лежат в исходном блоке
+        assert box['x1'] <= quantized['coordinates']['x1'] and quantized['coordinates']['x2'] <= box['x2']
+        assert box['y1'] <= quantized['coordinates']['y1'] and quantized['coordinates']['y2'] <= box['y2']
+        assert all(isinstance(value, int) for value in quantized['coordinates'].values())
+
+    # Клик по целому пикселю на границе соседних блоков достается блоку, в котором он лежит
+    touching = [{'id': 1, 'coordinates': {'x1': 10.4, 'y1': 0, 'x2': 20.6, 'y2': 10}},
+                {'id': 2, 'coordinates': {'x1': 20.6, 'y1': 0, 'x2': 30.2, 'y2': 10}}]
+    quantized = quantize_jobs(touching)
+    assert find_by_scan(quantized, 20, 5)['id'] == 1
+    assert find_by_scan(quantized, 21, 5)['id'] == 2
@@ -0,0 +1,47 @@
+import random
+
+from components.interval_index import EquipmentIntervals, JobIntervalIndex
+
+
+def make_index(intervals) -> JobIntervalIndex:
+    """Индекс с заданными интервалами оборудования 1 (без загрузки работ из БД)"""
+    index = JobIntervalIndex()
+    index._ensure_current = lambda: None
+    equipment_intervals = EquipmentIntervals()
+    for job_id, (start, end) in enumerate(intervals):
+        equipment_intervals.add(job_id, start, end)
+    index._equipment = {1: equipment_intervals}
+    return index
+
+
+def free_slot_by_scan(intervals, start, duration, gap, exclude_job_id=None):
+    while True:
+        overlapping = [(job_start, job_end) for job_id, (job_start, job_end) in enumerate(intervals)
+                       if job_id != exclude_job_id and job_start < start + duration and job_end > start]
+        if not overlapping:
+            return start
+        start = min(overlapping)[1] + gap
+
+
+def test_free_slot_after_long_chain():
+    # 300 работ подряд с промежутками меньше gap: свободное место только после последней
+    intervals = [(i * 1.1, i * 1.1 + 1) for i in range(300)]
+    index = make_index(intervals)
+    slot = index.first_free_slot(1, 0.5, 2, gap=0.25)
+    assert slot == intervals[-1][1] + 0.25
+    assert index.overlapping(1, slot, slot + 2) == []
+
+
+def test_free_slot_matches_scan():
+    rng = random.Random(4)
+    for _ in range(200):
+        intervals = []
+        for _ in range(rng.randint(0, 150)):
+            start = rng.uniform(0, 400)
+            intervals.append((start, start + rng.choice([0, 0.25, 1, 4, rng.uniform(0, 30)])))
+        index = make_index(intervals)
+        start, duration = rng.uniform(-5, 400), rng.choice([0.25, 2, 8, 40])
+        exclude_job_id = rng.randrange(len(intervals)) if intervals else None
+        slot = index.first_free_slot(1, start, duration, gap=0.25, exclude_job_id=exclude_job_id)
+        assert slot == free_slot_by_scan(intervals, start, duration, 0.25, exclude_job_id)
+        assert index.overlapping(1, slot, slot + duration, exclude_job_id) == []
@@ -0,0 +1,84 @@
+import random
+from datetime import timedelta
+
+import pandas as pd
+import pytest
+
+from conftest import PLAN_JOBS_START
+
+
+@pytest.fixture(scope='module')
+def plan_jobs(seeded_plan):
+    """Работы тестового плана с позициями, пересчитанными по текущему календарю"""
+    from components.worktime_functions import recompute_job_positions, job_positions_are_current
+    from models import Job
+    from sqlmodel import select
+
+    recompute_job_positions()
+    assert job_positions_are_current()
+    with seeded_plan.get_session() as session:
+        return session.exec(select(Job)).all()
+
+
+def test_recompute_matches_single_job_positions(plan_jobs):
+    from components.worktime_functions import get_job_positions
+
+    for job in plan_jobs:
+        assert get_job_positions(job.start_date, job.hour_offset, job.duration_hours) == {
+            'start_ordinal': job.start_ordinal, 'end_ordinal': job.end_ordinal, 'finish_date': job.finish_date}
+
+
+def test_positions_many_matches_single_job_positions(seeded_plan):
+    from components.worktime_functions import get_job_positions, get_job_positions_many
+
+    rng = random.Random(3)
+    rows = [((PLAN_JOBS_START + timedelta(days=rng.randint(-120, 400))).isoformat(),
+             rng.choice([None, 0, 0.25, 2, 4.5, 7.75, 8, 12.5, -2, rng.uniform(0, 9)]),
+             rng.choice([None, 0, 0.25, 3.5, 8, 40, 500, rng.uniform(0, 300)])) for _ in range(2000)]
+    positions = get_job_positions_many(pd.DataFrame(rows, columns=['start_date', 'hour_offset', 'duration_hours']))
+    for row, (start_date, hour_offset, duration_hours) in enumerate(rows):
+        assert get_job_positions(start_date, hour_offset, duration_hours) == {
+            key: positions[key][row] for key in ('start_ordinal', 'end_ordinal', 'finish_date')}
+
+
+def neighbours_by_walk(plan_jobs, job):
+    """Соседние работы на оборудовании по (дате начала, смещению), как при сортировке без позиций"""
+    key = (job.start_date, job.hour_offset or 0)
+    others = [other for other in plan_jobs if other.equipment_id == job.equipment_id and other.id != job.id]
+    before = [other for other in others if (other.start_date, other.hour_offset or 0) < key]
+    after = [other for other in others if (other.start_date, other.hour_offset or 0) > key]
+    sort_key = lambda other: (other.start_date, other.hour_offset or 0)  # noqa: E731
+    return (max(before, key=sort_key) if before else None), (min(after, key=sort_key) if after else None)
+
+
+def test_neighbours_by_stored_positions(seeded_plan, plan_jobs):
+    for job in plan_jobs:
+        expected_previous, expected_next = neighbours_by_walk(plan_jobs, job)
+        for expected, actual in ((expected_previous, seeded_plan.get_previous_job_by_id(job.id)),
+                                 (expected_next, seeded_plan.get_next_job_by_id(job.id))):
+            if expected is None:
+                assert actual is None
+            else:
+                # При одинаковых (дате, смещении) подходит любая из работ
+                assert (actual.start_date, actual.hour_offset) == (expected.start_date, expected.hour_offset)
+
+
+def test_future_jobs_prefilter(plan_jobs):
+    from components import worktime_functions
+
+    rng = random.Random(5)
+    cases = [((PLAN_JOBS_START + timedelta(days=rng.randint(-5, 90))).isoformat(), rng.choice([0, 2, 4, 7.75, 10]),
+              rng.choice(plan_jobs)) for _ in range(200)]
+    filtered = [worktime_functions.get_future_jobs_excluding_current_optimized(need_date, offset, job.id,
+                                                                               job.equipment_id)
+                for need_date, offset, job in cases]
+
+    # Без актуальных позиций - прежний запрос по всем работам оборудования
+    calendar_version = worktime_functions._job_positions_calendar_version
+    worktime_functions._job_positions_calendar_version = None
+    try:
+        for (need_date, offset, job), jobs in zip(cases, filtered):
+            assert jobs == worktime_functions.get_future_jobs_excluding_current_optimized(need_date, offset, job.id,
+                                                                                          job.equipment_id)
+    finally:
+        worktime_functions._job_positions_calendar_version = calendar_version
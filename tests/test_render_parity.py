@@ -0,0 +1,139 @@
+import hashlib
+import io
+import re
+from datetime import date
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# Виды тестового плана: режим, дата начала, пикселей на час, высота строки, темная тема, фильтр оборудования
+VIEWS = {
+    'week': ('week', date(2025, 9, 8), 20, 60, False, 'all'),
+    'month': ('month', date(2025, 9, 1), 10, 70, True, 'visible'),
+    'year': ('year', date(2025, 8, 1), 5, 50, False, 'all'),
+    # Обзорный масштаб: тепловая карта загрузки вместо блоков работ
+    'year_lod': ('year', date(2025, 8, 1), 2, 50, True, 'all'),
+}
+# MD5 пикселей, нарисованных прежним renderer'ом (до разделения на разметку и отрисовку) на тестовом плане.
+# Растеризация текста зависит от версии Pillow/FreeType (см. requirements.txt)
+PREVIOUS_RENDERER_MD5 = {
+    'week': 'd400960b4e7c9f0308340bc7b84f87e6',
+    'month': 'bafe39eee75768a073f71d709aa29d14',
+    'year': 'ef90772e9750a0640500d20543041f3b',
+}
+TILE_SIZE = 256
+
+
+@pytest.fixture(scope='module')
+def charts(seeded_plan):
+    """Разметка и эталонное изображение (draw_render_model, бэкенд pil) для каждого вида"""
+    from app import get_gantt_data
+    from components.draw_functions import draw_render_model
+    from components.render_model import build_render_model, get_chart_end_date
+
+    charts = {}
+    for name, (view_mode, start_date, pixels_per_hour, row_height, is_dark, equipment_filter) in VIEWS.items():
+        jobs_df, equipment_df, calendar_data = get_gantt_data(equipment_filter, start_date,
+                                                              get_chart_end_date(view_mode, start_date))
+        model = build_render_model(view_mode, start_date, calendar_data, equipment_df, jobs_df,
+                                   pixels_per_hour, row_height, 80)
+        image, jobs = draw_render_model(model, is_dark, backend='pil')
+        charts[name] = (model, is_dark, image, jobs, (calendar_data, equipment_df, jobs_df))
+    return charts
+
+
+def assert_same_image(expected, actual):
+    assert actual.mode == expected.mode and actual.size == expected.size
+    assert actual.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('name', list(PREVIOUS_RENDERER_MD5))
+def test_render_matches_previous_renderer(charts, name):
+    from components.draw_functions import draw_chart_image
+
+    model, is_dark, reference, jobs, (calendar_data, equipment_df, jobs_df) = charts[name]
+    view_mode, start_date, pixels_per_hour, row_height, _, _ = VIEWS[name]
+    image, chart_jobs = draw_chart_image(view_mode, start_date, calendar_data, equipment_df, jobs_df,
+                                         pixels_per_hour, row_height, 80, is_dark)
+    assert_same_image(reference, image)
+    assert chart_jobs == jobs
+    assert hashlib.md5(image.tobytes()).hexdigest() == PREVIOUS_RENDERER_MD5[name]
+
+
+@pytest.mark.parametrize('name', list(VIEWS))
+def test_numpy_backend(charts, name):
+    from components.draw_functions import draw_render_model
+
+    model, is_dark, reference, jobs, _ = charts[name]
+    image, numpy_jobs = draw_render_model(model, is_dark, backend='numpy')
+    assert_same_image(reference, image)
+    assert numpy_jobs == jobs
+
+
+@pytest.mark.parametrize('name', list(VIEWS))
+def test_row_strip_cache(charts, name):
+    from components.draw_functions import draw_render_model_by_rows, row_strip_cache
+
+    model, is_dark, reference, jobs, _ = charts[name]
+    row_strip_cache.clear()
+    for _ in range(2):
+        # Первый раз полосы рисуются, второй - берутся из кэша
+        image, strip_jobs = draw_render_model_by_rows(model, is_dark)
+        assert_same_image(reference, image)
+        assert strip_jobs == jobs
+
+
+@pytest.mark.parametrize('name', ['week', 'year_lod'])
+def test_process_bands(charts, name):
+    from components.draw_functions import draw_render_model_parallel
+
+    model, is_dark, reference, jobs, _ = charts[name]
+    image, band_jobs = draw_render_model_parallel(model, is_dark, processes=2)
+    assert_same_image(reference, image)
+    assert band_jobs == jobs
+
+
+@pytest.mark.parametrize('name', list(VIEWS))
+def test_streamed_png(charts, name):
+    from components.draw_functions import iter_chart_bands, iter_chart_png
+
+    model, is_dark, reference, _, _ = charts[name]
+    bands = np.concatenate(list(iter_chart_bands(model, is_dark, band_height=40)))
+    assert bands.tobytes() == reference.tobytes()
+    decoded = Image.open(io.BytesIO(b''.join(iter_chart_png(model, is_dark, band_height=40, chunk_size=4096))))
+    assert_same_image(reference, decoded.convert('RGB'))
+
+
+@pytest.mark.parametrize('name', list(VIEWS))
+def test_tiles(charts, name):
+    from components.draw_functions import draw_render_model
+
+    model, is_dark, reference, _, _ = charts[name]
+    for x in range(0, model.width, TILE_SIZE):
+        for y in range(0, model.height, TILE_SIZE):
+            viewport = (x, y, min(TILE_SIZE, model.width - x), min(TILE_SIZE, model.height - y))
+            tile, _ = draw_render_model(model, is_dark, viewport)
+            assert_same_image(reference.crop((x, y, x + viewport[2], y + viewport[3])), tile)
+
+
+@pytest.mark.parametrize('name', ['week', 'year_lod'])
+def test_svg_draws_jobs_or_heatmap(charts, name):
+    from components.draw_functions import get_utilization_color, hex_to_rgb, rgb_to_hex
+    from components.svg_render import draw_render_model_svg
+
+    model, is_dark, _, jobs, _ = charts[name]
+    svg, svg_jobs = draw_render_model_svg(model, is_dark)
+    assert svg_jobs == jobs
+    if not model.lod:
+        assert svg.count(f'height="{model.job_height}" fill="#') == len(model.job_ids)
+        return
+
+    # В режиме обзора - ячейки тепловой карты тех же цветов, что и на растровой диаграмме, без блоков работ
+    _, _, hours, capacity = model.utilization_cells()
+    expected = [rgb_to_hex(get_utilization_color(hex_to_rgb(model.row_type_colors[row]),
+                                                 hours[row, cell] / capacity[cell]))
+                for row in range(model.rows_count) for cell in np.flatnonzero(hours[row] > 0).tolist()]
+    cell_height = model.job_height // 2 * 2
+    assert expected and re.findall(rf'<rect [^>]*height="{cell_height}" fill="(#[0-9A-F]{{6}})"', svg) == expected
+    assert 'stroke="#' not in svg
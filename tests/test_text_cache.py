@@ -0,0 +1,49 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from components import text_cache
+
+TEXTS = ['Заказ номер 17', '08.09', '8 ч', 'Тираж: 250 шт.', 'W']
+POSITIONS = [(3, 4), (10.25, 7.5), (40.7, 12.33), (-2.5, 1.9)]
+
+
+def draw_texts(draw_function, mode='RGB', fill='black'):
+    image = Image.new(mode, (200, 40), 'white')
+    draw = ImageDraw.Draw(image)
+    font = text_cache.get_font('./fonts/arial.ttf', 12)
+    for text in TEXTS:
+        for xy in POSITIONS:
+            draw_function(draw, xy, text, font=font, fill=fill)
+    return image
+
+
+def draw_with_pillow(draw, xy, text, font=None, fill=None):
+    draw.text(xy, text, fill=fill, font=font)
+
+
+@pytest.mark.parametrize('mode, fill', [('RGB', 'black'), ('RGB', (200, 30, 60)), ('L', 0)])
+def test_draw_text_matches_pillow(mode, fill):
+    expected = draw_texts(draw_with_pillow, mode, fill)
+    for _ in range(2):
+        # Второй раз маски берутся из text_mask_cache
+        assert draw_texts(text_cache.draw_text, mode, fill).tobytes() == expected.tobytes()
+
+
+class DrawWithoutInternals:
+    """ImageDraw без внутреннего метода _getink (как в версии Pillow, где его нет)"""
+
+    def __init__(self, draw):
+        self._draw = draw
+
+    def __getattr__(self, name):
+        if name == '_getink':
+            raise AttributeError(name)
+        return getattr(self._draw, name)
+
+
+def test_draw_text_falls_back_without_pillow_internals(monkeypatch):
+    monkeypatch.setattr(text_cache, '_draw_bitmap_supported', True)
+    expected = draw_texts(draw_with_pillow)
+    image = draw_texts(lambda draw, *args, **kwargs: text_cache.draw_text(DrawWithoutInternals(draw), *args, **kwargs))
+    assert image.tobytes() == expected.tobytes()
+    assert text_cache._draw_bitmap_supported is False